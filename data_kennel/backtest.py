@@ -0,0 +1,316 @@
+"""
+Backtests of monitor thresholds against past metric data.
+
+Simple metric monitors, with queries like `avg(last_5m):avg:system.load.norm.5{environment:prod} > 0.8`, are
+replayed against the timeseries of their metric query to count how often they would have alerted and
+recovered. Timeseries are fetched through data_kennel.metric, whose disk cache makes repeated backtests of the
+same range local.
+
+Every expanded variant of every monitor is evaluated at once: the series of all variants are binned onto one
+regular grid of time steps, a row per series, and the rows of all variants with the same aggregation and
+window are evaluated together with NumPy, a block of rows at a time. The points falling in one step are
+binned as their sum and count, or for min and max as their extreme, so that steps longer than the
+resolution of a metric aggregate every point of a window. Windows are aggregated with cumulative sums, or
+for min and max with windows doubling in length, and a monitor's state at each step is the state of its last
+step with data.
+Requires numpy.
+"""
+import itertools
+import logging
+import re
+
+from collections import OrderedDict
+
+from data_kennel.util import DURATION_UNITS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEP = 60
+# The number of rows evaluated at once, which bounds the memory of a pass over long time ranges
+ROWS_PER_BLOCK = 64
+BACKTEST_TYPES = ('metric alert', 'query alert')
+AGGREGATIONS = ('avg', 'min', 'max', 'sum')
+RESULT_COLUMNS = ['Name', 'Alerts', 'Recoveries', 'Groups', 'Note']
+
+_QUERY_REGEX = re.compile(
+    r'^\s*(avg|min|max|sum)\(last_(\d+)([smhdw])\):(.+?)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$', re.DOTALL
+)
+
+
+class UnsupportedQuery(ValueError):
+    """Raised for monitor queries that can't be backtested"""
+    pass
+
+
+class BacktestQuery(object):
+    """
+    A parsed monitor query.
+
+    aggregation     How the points of the window are aggregated, one of AGGREGATIONS.
+    window          The length of the window, in seconds.
+    metric_query    The metric query of the monitor, such as 'avg:system.load.norm.5{environment:prod}'.
+    comparator      One of >, >=, < or <=.
+    threshold       The threshold in the query.
+    """
+
+    def __init__(self, aggregation, window, metric_query, comparator, threshold):
+        self.aggregation = aggregation
+        self.window = window
+        self.metric_query = metric_query
+        self.comparator = comparator
+        self.threshold = threshold
+
+
+def parse_monitor_query(query):
+    """
+    Parses a monitor query of the form `aggregation(last_N<unit>):metric query comparator threshold`.
+
+    >>> parsed = parse_monitor_query('max(last_10m):avg:queue.depth{queue:jobs} by {host} >= 100')
+    >>> parsed.aggregation, parsed.window, parsed.metric_query, parsed.comparator, parsed.threshold
+    ('max', 600, 'avg:queue.depth{queue:jobs} by {host}', '>=', 100.0)
+    """
+    match = _QUERY_REGEX.match(query)
+    if match is None:
+        raise UnsupportedQuery('Only queries like avg(last_5m):<metric query> > <threshold> can be '
+                               'backtested')
+
+    aggregation, count, unit, metric_query, comparator, threshold = match.groups()
+    if re.search(r'&&|\|\||\b(?:change|pct_change|forecast|anomalies|outliers)\(', metric_query):
+        raise UnsupportedQuery('Functions and multiple conditions can\'t be backtested')
+    return BacktestQuery(aggregation, int(count) * DURATION_UNITS[unit], metric_query.strip(), comparator,
+                         float(threshold))
+
+
+def rolling(values, aggregation, window, counts=None):
+    """
+    Aggregates the window of `window` steps ending at every step of each row of values, ignoring steps
+    without data (NaN). Windows without any data are NaN. For avg and sum, steps of several points are given
+    as the sum of their points, with counts the number of points of every step, which defaults to one per
+    step with data.
+    """
+    present = ~numpy.isnan(values)
+    if aggregation in ('min', 'max'):
+        return _window_extremes(values, window, numpy.fmin if aggregation == 'min' else numpy.fmax)
+
+    if counts is None:
+        counts = present.astype(numpy.float64)
+    sums = _window_sums(numpy.where(present, values, 0.0), window)
+    counts = _window_sums(counts, window)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        aggregated = sums / counts if aggregation == 'avg' else sums
+    aggregated[counts == 0] = numpy.nan
+    return aggregated
+
+
+def _window_sums(values, window):
+    """The sums of the windows of `window` steps ending at every step of each row"""
+    sums = numpy.cumsum(values, axis=1)
+    sums[:, window:] -= sums[:, :-window].copy()
+    return sums
+
+
+def _shift(values, steps):
+    """Shifts each row by a number of steps, filling the first steps with NaN"""
+    shifted = numpy.full(values.shape, numpy.nan)
+    shifted[:, steps:] = values[:, :-steps]
+    return shifted
+
+
+def _window_extremes(values, window, extreme):
+    """
+    The minimum or maximum, given as numpy.fmin or numpy.fmax, of the windows of `window` steps ending at
+    every step of each row. Windows of doubling length are combined, then the two overlapping windows of the
+    largest length covering the whole window.
+    """
+    extremes = values
+    length = 1
+    while length * 2 <= window:
+        extremes = extreme(extremes, _shift(extremes, length))
+        length *= 2
+    if length < window:
+        extremes = extreme(extremes, _shift(extremes, window - length))
+    return extremes
+
+
+def count_transitions(triggered, has_data, start):
+    """
+    Counts the alerts and recoveries of each row from step start on. A row alerts at steps where triggered
+    and recovers at steps with data that aren't triggered, and keeps its state through steps without data.
+    Alerting or recovering before start only sets the state at start.
+
+    Returns the alert and recovery counts of each row.
+    """
+    steps = numpy.arange(triggered.shape[1])
+    last_with_data = numpy.maximum.accumulate(numpy.where(has_data, steps, 0), axis=1)
+    rows = numpy.arange(triggered.shape[0])[:, numpy.newaxis]
+    alerting = triggered[rows, last_with_data] & has_data[rows, last_with_data]
+
+    previous = numpy.hstack([numpy.zeros((len(alerting), 1), dtype=bool), alerting[:, :-1]])
+    after, before = alerting[:, start:], previous[:, start:]
+    return (after & ~before).sum(axis=1), (~after & before).sum(axis=1)
+
+
+def bin_points(points, aggregation, grid_start, step, step_count):
+    """
+    Bins [timestamp, value] points, as an array of two columns, onto a grid of step_count steps of `step`
+    seconds from grid_start. Returns the values of every step, the sum of its points or for min and max their
+    extreme, NaN for steps without points, and the number of points of every step. Points without a value or
+    outside the grid are ignored.
+    """
+    steps = (points[:, 0].astype(numpy.int64) - grid_start) // step
+    in_grid = (steps >= 0) & (steps < step_count) & ~numpy.isnan(points[:, 1])
+    steps, point_values = steps[in_grid], points[in_grid, 1]
+
+    counts = numpy.bincount(steps, minlength=step_count).astype(numpy.float64)
+    if aggregation in ('min', 'max'):
+        values = numpy.full(step_count, numpy.nan)
+        (numpy.fmin if aggregation == 'min' else numpy.fmax).at(values, steps, point_values)
+    else:
+        values = numpy.bincount(steps, weights=point_values, minlength=step_count)
+        values[counts == 0] = numpy.nan
+    return values, counts
+
+
+def _to_array(points):
+    """Converts [timestamp, value] points to an array of two columns, with NaN for missing values"""
+    try:
+        flat = numpy.fromiter(itertools.chain.from_iterable(points), dtype=numpy.float64,
+                              count=2 * len(points))
+        return flat.reshape((len(points), 2))
+    except TypeError:
+        return numpy.array(points, dtype=numpy.float64).reshape((len(points), 2))
+
+
+def _triggered(rows, aggregated):
+    """Where the aggregated values of rows of (name, comparator, threshold, points) cross their thresholds"""
+    # Less than comparisons are made greater than comparisons by negating values and thresholds
+    signs = numpy.array([-1.0 if comparator.startswith('<') else 1.0 for _, comparator, _, _ in rows])
+    inclusive = numpy.array([comparator.endswith('=') for _, comparator, _, _ in rows])
+    thresholds = (signs * numpy.array([threshold for _, _, threshold, _ in rows]))[:, numpy.newaxis]
+
+    signed = aggregated * signs[:, numpy.newaxis]
+    with numpy.errstate(invalid='ignore'):
+        return (signed > thresholds) | (inclusive[:, numpy.newaxis] & (signed == thresholds))
+
+
+class Backtest(object):
+    """
+    Backtests monitors against past metric data
+    """
+
+    def __init__(self, metric, step=DEFAULT_STEP, chunk=None):
+        """
+        metric  The data_kennel.metric.Metric fetching the timeseries.
+        step    The length of the steps monitors are evaluated at, in seconds.
+        chunk   The chunk length metric queries are fetched with, in seconds. Defaults to Metric's default.
+        """
+        self.metric = metric
+        self.step = step
+        self.chunk = chunk
+
+    def run(self, monitors, start, end):
+        """
+        Backtests monitors, as returned by Config.get_monitors, from start to end in POSIX timestamps.
+
+        Yields a row of RESULT_COLUMNS for every monitor: the alerts, recoveries and groups of the monitors
+        that could be backtested, and why the others couldn't.
+        """
+        if numpy is None:
+            raise ImportError('Backtesting requires numpy, install data_kennel[metric]')
+
+        parsed, results = self._parse(monitors)
+        grid = self._grid(parsed, start, end)
+        series = self._fetch(set(query.metric_query for query, _ in parsed.values()), grid[0], end)
+
+        for (aggregation, window), rows in self._passes(parsed, series, results).items():
+            for block_start in range(0, len(rows), ROWS_PER_BLOCK):
+                block = rows[block_start:block_start + ROWS_PER_BLOCK]
+                self._add_counts(results, block, *self._evaluate(block, aggregation, window, grid))
+
+        for result in results.values():
+            yield result
+
+    def _parse(self, monitors):
+        """
+        Parses the queries of monitors. Returns the parsed query and threshold of every monitor that can be
+        backtested, and the results of every monitor, noting why the others can't be.
+        """
+        parsed = OrderedDict()
+        results = OrderedDict()
+        for monitor in monitors:
+            results[monitor['name']] = {'Name': monitor['name'], 'Alerts': '', 'Recoveries': '', 'Groups': 0,
+                                        'Note': ''}
+            try:
+                if monitor.get('type') not in BACKTEST_TYPES:
+                    raise UnsupportedQuery('{0} monitors can\'t be backtested'.format(monitor.get('type')))
+                parsed[monitor['name']] = (parse_monitor_query(monitor['query']), self._threshold(monitor))
+            except UnsupportedQuery as ex:
+                results[monitor['name']]['Note'] = str(ex)
+        return parsed, results
+
+    def _grid(self, parsed, start, end):
+        """
+        The grid of steps the parsed monitors are evaluated on from start to end, as (grid_start, step_count,
+        start_step). The grid starts early enough for the longest window to be full at start.
+        """
+        lead_steps = -(-max([query.window for query, _ in parsed.values()] or [0]) // self.step)
+        grid_start = start - start % self.step - lead_steps * self.step
+        return grid_start, (end - grid_start) // self.step + 1, (start - grid_start) // self.step
+
+    def _passes(self, parsed, series, results):
+        """
+        Groups the rows of (name, comparator, threshold, points) of every fetched series of the parsed
+        monitors by aggregation and window in steps, since the rows of a group are evaluated in one pass.
+        Notes the groups of every monitor in its results.
+        """
+        passes = OrderedDict()
+        for name, (query, threshold) in parsed.items():
+            groups = series[query.metric_query]
+            results[name]['Groups'] = len(groups)
+            if not groups:
+                results[name]['Note'] = 'no data'
+                continue
+            passes.setdefault((query.aggregation, max(query.window // self.step, 1)), []).extend(
+                (name, query.comparator, threshold, points) for points in groups
+            )
+        return passes
+
+    def _add_counts(self, results, rows, alerts, recoveries):
+        """Adds the alerts and recoveries of evaluated rows to the results of their monitors"""
+        for (name, _, _, _), row_alerts, row_recoveries in zip(rows, alerts, recoveries):
+            result = results[name]
+            result['Alerts'] = (result['Alerts'] or 0) + int(row_alerts)
+            result['Recoveries'] = (result['Recoveries'] or 0) + int(row_recoveries)
+
+    def _threshold(self, monitor):
+        """The critical threshold of a monitor, from its options or else its query"""
+        critical = monitor.get('options', {}).get('thresholds', {}).get('critical')
+        return float(critical) if critical is not None else parse_monitor_query(monitor['query']).threshold
+
+    def _fetch(self, metric_queries, start, end):
+        """Fetches the points of every group of each metric query"""
+        options = {'chunk': self.chunk} if self.chunk else {}
+        series = {}
+        for metric_query in sorted(metric_queries):
+            groups = self.metric.query(metric_query, start, end, **options)
+            series[metric_query] = [_to_array(group['points']) for group in groups]
+        return series
+
+    def _evaluate(self, rows, aggregation, window, grid):
+        """
+        Evaluates rows of (name, comparator, threshold, points) in one pass, on a grid of (grid_start,
+        step_count, start_step), returning their alert and recovery counts
+        """
+        grid_start, step_count, start_step = grid
+        values = numpy.empty((len(rows), step_count))
+        counts = numpy.empty((len(rows), step_count))
+        for row, (_, _, _, points) in enumerate(rows):
+            values[row], counts[row] = bin_points(points, aggregation, grid_start, self.step, step_count)
+
+        aggregated = rolling(values, aggregation, window, counts)
+        return count_transitions(_triggered(rows, aggregated), ~numpy.isnan(aggregated), start_step)
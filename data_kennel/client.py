@@ -0,0 +1,201 @@
+"""
+Clients of the Datadog monitor, downtime, metric query and event APIs.
+
+The datadog package keeps its credentials in global state set by `datadog.initialize`, so a process using it
+can only talk to one Datadog org. HttpMonitorClient holds its own credentials instead, so that several orgs
+can be synced from one process at the same time.
+"""
+from datadog import api
+from datadog.api.api_client import APIClient
+
+DEFAULT_API_HOST = 'https://api.datadoghq.com'
+DEFAULT_TIMEOUT = 60
+
+
+class DatadogMonitorClient(object):
+    """
+    Monitor API of the datadog package, using the credentials `datadog.initialize` was called with.
+    """
+
+    def get_all(self, **params):
+        """Gets all monitors matching the params"""
+        return api.Monitor.get_all(**params)
+
+    def get(self, monitor_id):
+        """Gets a monitor"""
+        return api.Monitor.get(monitor_id)
+
+    def create(self, **monitor):
+        """Creates a monitor"""
+        return api.Monitor.create(**monitor)
+
+    def update(self, **monitor):
+        """Updates a monitor, identified by the id of the given monitor"""
+        return api.Monitor.update(**monitor)
+
+    def delete(self, monitor_id):
+        """Deletes a monitor"""
+        return api.Monitor.delete(monitor_id)
+
+    def search(self, **params):
+        """Searches monitors with a monitor search query"""
+        return api.Monitor.search(**params)
+
+    def validate(self, **monitor):
+        """Validates a monitor without creating it"""
+        # Not every supported version of the datadog package has Monitor.validate
+        return APIClient.submit('POST', 'monitor/validate', None, monitor)
+
+
+class DatadogDowntimeClient(object):
+    """
+    Downtime API of the datadog package, using the credentials `datadog.initialize` was called with.
+    """
+
+    def get_all(self, **params):
+        """Gets all downtimes matching the params"""
+        return api.Downtime.get_all(**params)
+
+    def create(self, **downtime):
+        """Schedules a downtime"""
+        return api.Downtime.create(**downtime)
+
+    def update(self, downtime_id, **downtime):
+        """Updates a downtime"""
+        return api.Downtime.update(downtime_id, **downtime)
+
+    def delete(self, downtime_id):
+        """Cancels a downtime"""
+        return api.Downtime.delete(downtime_id)
+
+
+class DatadogMetricClient(object):
+    """
+    Metric query API of the datadog package, using the credentials `datadog.initialize` was called with.
+    """
+
+    def query(self, start, end, query):
+        """Queries the timeseries of a metric query between two POSIX timestamps"""
+        return api.Metric.query(start=start, end=end, query=query)
+
+
+class DatadogEventClient(object):
+    """
+    Event API of the datadog package, using the credentials `datadog.initialize` was called with.
+    """
+
+    def create(self, **event):
+        """Posts an event"""
+        return api.Event.create(**event)
+
+
+class HttpClient(object):
+    """
+    Datadog API client with its own credentials and connection pool. Like the datadog package, errors
+    returned by Datadog are returned as a dictionary with 'errors' rather than raised.
+    """
+
+    def __init__(self, api_key, app_key, api_host=DEFAULT_API_HOST, timeout=DEFAULT_TIMEOUT):
+        import requests
+
+        self.api_host = api_host.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            'DD-API-KEY': api_key,
+            'DD-APPLICATION-KEY': app_key,
+            'Content-Type': 'application/json'
+        })
+
+    def _request(self, method, path, params=None, body=None):
+        """Makes a request to the Datadog API and returns its decoded response"""
+        response = self.session.request(method, self.api_host + path, params=params, json=body,
+                                        timeout=self.timeout)
+        try:
+            content = response.json()
+        except ValueError:
+            content = {}
+
+        if response.status_code >= 400:
+            if not isinstance(content, dict) or not content.get('errors'):
+                content = {'errors': ['{0} {1}'.format(response.status_code, response.reason)]}
+        return content
+
+
+class HttpMonitorClient(HttpClient):
+    """
+    Monitor API client with its own credentials and connection pool.
+    """
+
+    def get_all(self, **params):
+        """Gets all monitors matching the params"""
+        params = dict(
+            (key, ','.join(value) if isinstance(value, list) else value) for key, value in params.items()
+        )
+        return self._request('GET', '/api/v1/monitor', params=params)
+
+    def get(self, monitor_id):
+        """Gets a monitor"""
+        return self._request('GET', '/api/v1/monitor/{0}'.format(monitor_id))
+
+    def create(self, **monitor):
+        """Creates a monitor"""
+        return self._request('POST', '/api/v1/monitor', body=monitor)
+
+    def update(self, **monitor):
+        """Updates a monitor, identified by the id of the given monitor"""
+        return self._request('PUT', '/api/v1/monitor/{0}'.format(monitor['id']), body=monitor)
+
+    def delete(self, monitor_id):
+        """Deletes a monitor"""
+        return self._request('DELETE', '/api/v1/monitor/{0}'.format(monitor_id))
+
+    def search(self, **params):
+        """Searches monitors with a monitor search query"""
+        return self._request('GET', '/api/v1/monitor/search', params=params)
+
+    def validate(self, **monitor):
+        """Validates a monitor without creating it"""
+        return self._request('POST', '/api/v1/monitor/validate', body=monitor)
+
+
+class HttpDowntimeClient(HttpClient):
+    """
+    Downtime API client with its own credentials and connection pool.
+    """
+
+    def get_all(self, **params):
+        """Gets all downtimes matching the params"""
+        return self._request('GET', '/api/v1/downtime', params=params)
+
+    def create(self, **downtime):
+        """Schedules a downtime"""
+        return self._request('POST', '/api/v1/downtime', body=downtime)
+
+    def update(self, downtime_id, **downtime):
+        """Updates a downtime"""
+        return self._request('PUT', '/api/v1/downtime/{0}'.format(downtime_id), body=downtime)
+
+    def delete(self, downtime_id):
+        """Cancels a downtime"""
+        return self._request('DELETE', '/api/v1/downtime/{0}'.format(downtime_id))
+
+
+class HttpMetricClient(HttpClient):
+    """
+    Metric query API client with its own credentials and connection pool.
+    """
+
+    def query(self, start, end, query):
+        """Queries the timeseries of a metric query between two POSIX timestamps"""
+        return self._request('GET', '/api/v1/query', params={'from': start, 'to': end, 'query': query})
+
+
+class HttpEventClient(HttpClient):
+    """
+    Event API client with its own credentials and connection pool.
+    """
+
+    def create(self, **event):
+        """Posts an event"""
+        return self._request('POST', '/api/v1/events', body=event)
@@ -2,74 +2,206 @@
 Class for parsing Data Kennel's configuration file.
 """
 import copy
+import csv
 import glob
+import hashlib
+import itertools
 
 import os
 import re
 import json
 import logging
-import yaml
-from schema import Schema, Optional, Or, Use, SchemaError, Regex
 
-from data_kennel.util import convert_dict_to_tags, is_truthy, convert_tags_to_dict
+from data_kennel.config_constants import (
+    VARIABLE_PATTERN,
+    MONITOR_TYPES,
+    DOWNTIME_RECURRENCE_TYPES,
+    VARIABLE_SOURCES,
+    has_single_variable_source
+)
+from data_kennel.util import convert_dict_to_tags, is_truthy, convert_tags_to_dict, to_timestamp, parse_shard
+from data_kennel.profiling import profile_phase
 from data_kennel import __version__
 
 DEFAULT_RECOVERY_MESSAGE = "This alert has recovered."
-VARIABLE_PATTERN = "(\\$\\{.+?\\})"
 SUB_MONITOR_NAME_TEMPLATE = '[DK-C] {0} -- {1}'
+SHARED_SUB_MONITOR_NAME_TEMPLATE = '[DK-C] {0} | {1}'
+# The first line of the message of a configured downtime, identifying it as a downtime of a team's config
+DOWNTIME_MARKER_TEMPLATE = '[DK] {0} | {1}'
+# The org of teams that don't configure one, which uses the unsuffixed credential environment variables
+DEFAULT_ORG = 'default'
 
-VARIABLE_VALIDATOR = Regex(VARIABLE_PATTERN)
+# A `team: name` line of the data_kennel section, as written in nearly every config file
+TEAM_LINE_PATTERN = re.compile(r'''^\s+team:\s*(['"]?)([^'"#\s]+)\1\s*(#.*)?$''')
 
-CONFIG_SCHEMA = Schema(
-    {
-        'data_kennel': {
-            'team': str
-        },
-        'monitors': [
-            {
-                'name': str,
-                'query': str,
-                'type': Or('metric alert', 'service check', 'event alert', 'query alert'),
-                'message': str,
-                Optional('notify'): [
-                    str
-                ],
-                Optional('tags'): {
-                    str: Use(str)
-                },
-                Optional('with_variables'): [
-                    {
+# Built on first use by get_config_schema, so that importing this module stays cheap.
+_CONFIG_SCHEMA = []
+
+logger = logging.getLogger(__name__)
+
+
+def get_config_schema():
+    """
+    Returns the schema of Data Kennel's configuration file, building it on first use. Configs are validated
+    with data_kennel.validator, which must stay equivalent to this schema.
+    """
+    if not _CONFIG_SCHEMA:
+        _CONFIG_SCHEMA.append(_build_config_schema())
+    return _CONFIG_SCHEMA[0]
+
+
+def get_config_files(config_dir):
+    """Returns the paths of the config files in a config directory"""
+    return glob.glob(config_dir + '/*.yml')
+
+
+def uses_global_client(org):
+    """
+    Whether an org is reached through the datadog package's global client, initialized with the org's
+    credentials, rather than a client of its own. Only the default org is, so that every other org can be
+    managed concurrently with its own credentials.
+    """
+    return org == DEFAULT_ORG
+
+
+def get_shard(team, shard_count):
+    """
+    Returns the shard, from 1 to shard_count, that a team belongs to. Teams are assigned by a hash of their
+    name, so the assignment is the same on every machine and every run.
+    """
+    return int(hashlib.md5(team.encode('utf-8')).hexdigest(), 16) % shard_count + 1
+
+
+def peek_team(path):
+    """
+    Reads the team of a config file without parsing the whole file, by scanning its data_kennel section for
+    a plain `team: name` line. Returns None if the team isn't written that way.
+    """
+    in_section = False
+    with open(path) as config_file:
+        for line in config_file:
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            if not line[0].isspace():
+                in_section = line.startswith('data_kennel:')
+                continue
+            match = TEAM_LINE_PATTERN.match(line) if in_section else None
+            if match:
+                return match.group(2)
+    return None
+
+
+def load_config_file(path):
+    """
+    Parses a YAML config file. The variables files of its monitors are resolved relative to the directory of
+    the config file.
+    """
+    import yaml
+
+    with open(path) as config_file:
+        config = yaml.load(config_file)
+
+    monitors = config.get('monitors') if isinstance(config, dict) else None
+    for monitor in monitors if isinstance(monitors, list) else []:
+        if isinstance(monitor, dict) and isinstance(monitor.get('with_variables_file'), str):
+            monitor['with_variables_file'] = os.path.join(os.path.dirname(path),
+                                                          monitor['with_variables_file'])
+    return config
+
+
+def load_config(args):
+    """Loads the config given by the --config, --config-dir and --shard options of a script's command line"""
+    return Config(config_path=args['--config'], config_dir=args['--config-dir'],
+                  shard=parse_shard(args['--shard']))
+
+
+def _build_config_schema():
+    """Builds the schema of Data Kennel's configuration file"""
+    from schema import Schema, Optional, Or, And, Use, Regex
+
+    variable_validator = Regex(VARIABLE_PATTERN)
+
+    return Schema(
+        {
+            'data_kennel': {
+                'team': str,
+                Optional('org'): str,
+                Optional('share_sub_monitors'): Use(is_truthy)
+            },
+            'monitors': [
+                And({
+                    'name': str,
+                    'query': str,
+                    'type': Or(*MONITOR_TYPES),
+                    'message': str,
+                    Optional('notify'): [
+                        str
+                    ],
+                    Optional('tags'): {
                         str: Use(str)
-                    }
-                ],
-                Optional('options'): {
-                    Optional('silenced', default=None): {
-                        str: Or(None, Use(int))
                     },
-                    Optional('notify_no_data'): Or(Use(is_truthy), VARIABLE_VALIDATOR),
-                    Optional('new_host_delay'): Or(Use(int), VARIABLE_VALIDATOR),
-                    Optional('no_data_timeframe'): Or(Use(int), VARIABLE_VALIDATOR),
-                    Optional('timeout_h'): Or(Use(int), VARIABLE_VALIDATOR),
-                    Optional('require_full_window'): Or(Use(is_truthy), VARIABLE_VALIDATOR),
-                    Optional('renotify_interval'): Or(Use(int), VARIABLE_VALIDATOR),
-                    Optional('escalation_message'): str,
-                    Optional('notify_audit'): Or(Use(is_truthy), VARIABLE_VALIDATOR),
-                    Optional('locked'): Or(Use(is_truthy), VARIABLE_VALIDATOR),
-                    Optional('include_tags'): Or(Use(is_truthy), VARIABLE_VALIDATOR),
-                    Optional('thresholds'): {
-                        Optional('critical'): Or(Use(float), VARIABLE_VALIDATOR),
-                        Optional('warning'): Or(Use(float), VARIABLE_VALIDATOR),
-                        Optional('ok'): Or(Use(float), VARIABLE_VALIDATOR)
+                    Optional('with_variables'): [
+                        {
+                            str: Use(str)
+                        }
+                    ],
+                    Optional('with_variables_file'): str,
+                    Optional('variable_matrix'): {
+                        'axes': {
+                            str: [Use(str)]
+                        },
+                        Optional('exclude'): [
+                            {
+                                str: Use(str)
+                            }
+                        ]
+                    },
+                    Optional('options'): {
+                        Optional('silenced', default=None): {
+                            str: Or(None, Use(int))
+                        },
+                        Optional('notify_no_data'): Or(Use(is_truthy), variable_validator),
+                        Optional('new_host_delay'): Or(Use(int), variable_validator),
+                        Optional('no_data_timeframe'): Or(Use(int), variable_validator),
+                        Optional('timeout_h'): Or(Use(int), variable_validator),
+                        Optional('require_full_window'): Or(Use(is_truthy), variable_validator),
+                        Optional('renotify_interval'): Or(Use(int), variable_validator),
+                        Optional('escalation_message'): str,
+                        Optional('notify_audit'): Or(Use(is_truthy), variable_validator),
+                        Optional('locked'): Or(Use(is_truthy), variable_validator),
+                        Optional('include_tags'): Or(Use(is_truthy), variable_validator),
+                        Optional('thresholds'): {
+                            Optional('critical'): Or(Use(float), variable_validator),
+                            Optional('warning'): Or(Use(float), variable_validator),
+                            Optional('ok'): Or(Use(float), variable_validator)
+                        },
+                        Optional('evaluation_delay'): Or(Use(int), variable_validator),
+                        Optional(str): Use(str)
+                    }
+                }, has_single_variable_source)
+            ],
+            Optional('downtimes'): [
+                {
+                    'name': str,
+                    Optional('scope'): [str],
+                    Optional('monitor_tags'): {
+                        str: Use(str)
                     },
-                    Optional('evaluation_delay'): Or(Use(int), VARIABLE_VALIDATOR),
-                    Optional(str): Use(str)
+                    Optional('start'): Use(to_timestamp),
+                    Optional('end'): Use(to_timestamp),
+                    Optional('message'): str,
+                    Optional('timezone'): str,
+                    Optional('recurrence'): {
+                        'type': Or(*DOWNTIME_RECURRENCE_TYPES),
+                        'period': Use(int),
+                        Optional('week_days'): [str],
+                        Optional('until_date'): Use(to_timestamp),
+                        Optional('until_occurrences'): Use(int)
+                    }
                 }
-            }
-        ]
-    }
-)
-
-logger = logging.getLogger(__name__)
+            ]
+        }
+    )
 
 
 class MonitorType(object):
@@ -81,35 +213,44 @@ class MonitorType(object):
 class Config(object):
     """Class for parsing Data Kennel's configuration file."""
 
-    def __init__(self, config_list=None, config_path=None, config_dir=None, api_key=None, app_key=None):
+    @profile_phase
+    def __init__(self, config_list=None, config_path=None, config_dir=None, api_key=None, app_key=None,
+                 config_files=None, shard=None):
+        """
+        The config is read from a list of parsed config files, a config file, a config directory or a list
+        of config files. shard is an optional (index, count) pair, from (1, count) to (count, count), that
+        restricts the config to the teams of that shard, see get_shard. Config files of other teams in a
+        config directory aren't parsed at all.
+        """
         configs = {}
         self.team_config = {}
+        self.org = DEFAULT_ORG
+        self.shard = shard
         if config_list:
             for config in config_list:
                 self._validate_config(config)
-                team = config['data_kennel']['team']
-                if not configs.get(team):
-                    configs[team] = copy.deepcopy(config)
-                else:
-                    configs[team]['monitors'].extend(config['monitors'])
+                self._add_config(configs, config)
         elif config_path:
-            config = yaml.load(open(config_path))
+            config = load_config_file(config_path)
             self._validate_config(config)
             team = config['data_kennel']['team']
             configs[team] = config
-        elif config_dir:
-            config_files = glob.glob(config_dir + '/*.yml')
+        elif config_dir or config_files:
+            from schema import SchemaError
+
+            config_files = config_files or get_config_files(config_dir)
             for conf_file in config_files:
-                config = yaml.load(open(conf_file))
+                if shard and not self._in_shard(peek_team(conf_file)):
+                    continue
+                config = load_config_file(conf_file)
                 try:
                     self._validate_config(config)
                 except SchemaError as ex:
                     raise Exception('Invalid schema in %s: %s' % (conf_file, ex))
-                team = config['data_kennel']['team']
-                if not configs.get(team):
-                    configs[team] = copy.deepcopy(config)
-                else:
-                    configs[team]['monitors'].extend(config['monitors'])
+                self._add_config(configs, config)
+
+        if shard:
+            configs = {team: config for team, config in configs.items() if self._in_shard(team)}
 
         self._api_key = api_key
         self._app_key = app_key
@@ -122,26 +263,86 @@ class Config(object):
         """The teams of the config files"""
         return self.team_config.keys()
 
+    @property
+    def orgs(self):
+        """The Datadog orgs of the teams of the config files"""
+        return sorted(set(self.get_org(team) for team in self.teams))
+
     @property
     def api_key(self):
         """Datadog API Key"""
         if self._api_key is None:
-            api_key = os.getenv('DATADOG_API_KEY')
-            if api_key is None:
-                raise Exception('Data Kennel relies on environment variable DATADOG_API_KEY')
-            self._api_key = api_key
+            self._api_key = self._get_credential('DATADOG_API_KEY')
         return self._api_key
 
     @property
     def app_key(self):
         """Data Kennel APP Key"""
         if self._app_key is None:
-            app_key = os.getenv('DATA_KENNEL_APP_KEY')
-            if app_key is None:
-                raise Exception('Data Kennel relies on environment variable DATA_KENNEL_APP_KEY')
-            self._app_key = app_key
+            self._app_key = self._get_credential('DATA_KENNEL_APP_KEY')
         return self._app_key
 
+    @property
+    def api_host(self):
+        """The Datadog API host of the org, or None for the default host"""
+        return os.getenv(self._get_credential_variable('DATADOG_API_HOST'))
+
+    def get_org(self, team):
+        """The Datadog org a team's monitors live in"""
+        return self.team_config[team]['data_kennel'].get('org', DEFAULT_ORG)
+
+    def for_org(self, org):
+        """
+        Returns a config of only the teams of one org, using the credentials of that org. The credentials of
+        orgs other than the default one come from the DATADOG_API_KEY_<ORG>, DATA_KENNEL_APP_KEY_<ORG> and
+        optionally DATADOG_API_HOST_<ORG> environment variables, where <ORG> is the org in upper case with
+        anything but letters and digits replaced by underscores.
+        """
+        org_config = copy.copy(self)
+        org_config.org = org
+        org_config.team_config = {
+            team: team_config for team, team_config in self.team_config.items() if self.get_org(team) == org
+        }
+        if org != self.org:
+            org_config._api_key = None
+            org_config._app_key = None
+        return org_config
+
+    def _get_credential_variable(self, variable):
+        """The environment variable holding a credential of the config's org"""
+        if self.org == DEFAULT_ORG:
+            return variable
+        return '{0}_{1}'.format(variable, re.sub('[^A-Z0-9]', '_', self.org.upper()))
+
+    def _get_credential(self, variable):
+        """Reads a credential of the config's org from the environment"""
+        variable = self._get_credential_variable(variable)
+        value = os.getenv(variable)
+        if value is None:
+            raise Exception('Data Kennel relies on environment variable {0}'.format(variable))
+        return value
+
+    def _in_shard(self, team):
+        """Whether a team belongs to the config's shard. A team that isn't known yet might."""
+        if team is None:
+            return True
+        index, count = self.shard
+        return get_shard(team, count) == index
+
+    def _add_config(self, configs, config):
+        """Adds a config file to the configs by team, merging the monitors of config files of the same team"""
+        team = config['data_kennel']['team']
+        if not configs.get(team):
+            configs[team] = copy.deepcopy(config)
+            return
+
+        orgs = [team_config['data_kennel'].get('org', DEFAULT_ORG) for team_config in (configs[team], config)]
+        if orgs[0] != orgs[1]:
+            raise Exception('Team {0} is configured for both org {1} and org {2}'.format(team, *orgs))
+        configs[team]['monitors'].extend(config['monitors'])
+        if config.get('downtimes'):
+            configs[team].setdefault('downtimes', []).extend(config['downtimes'])
+
     def _get_team(self, config):
         """The team of the config file"""
         return config['data_kennel']['team']
@@ -151,11 +352,23 @@ class Config(object):
         dict_tag = convert_tags_to_dict(monitor['tags'])
         return dict_tag['team']
 
+    @property
+    def data_files(self):
+        """The paths of the variables files the monitors of the config read their variables from"""
+        return sorted(set(
+            monitor['with_variables_file']
+            for team_config in self.team_config.values()
+            for monitor in team_config.get('lazy_monitors', [])
+            if 'with_variables_file' in monitor
+        ))
+
     def _validate_config(self, config):
         """
         Function for validating that the parsed config object is a valid data_kennel config.
         """
-        CONFIG_SCHEMA.validate(config)
+        from data_kennel.validator import validate_config
+
+        validate_config(config)
 
     def _build_tags(self, dk_type, team, tags=None):
         """
@@ -173,56 +386,183 @@ class Config(object):
         tags.update(default_tags)
         return tags
 
+    @profile_phase
     def _interpolate_config(self, config):
         """
         Function for interpolating strings in the config object.
 
-        Returns a copy of the config object with strings interpolated and monitors expanded out.
+        Returns a copy of the config object with strings interpolated and monitors expanded out. Monitors
+        with a variable_matrix or a with_variables_file aren't expanded here, but kept under 'lazy_monitors'
+        to be expanded lazily by get_monitors.
         """
+        team = self._get_team(config)
         interpolated_config = {
             'data_kennel': config['data_kennel'].copy(),
-            'monitors': []
+            'monitors': [],
+            'lazy_monitors': [],
+            'downtimes': config.get('downtimes', [])
         }
 
         for monitor in config['monitors']:
-            variable_sets = monitor.get('with_variables', [{"team": self._get_team(config)}])
+            if 'variable_matrix' in monitor or 'with_variables_file' in monitor:
+                interpolated_config['lazy_monitors'].append(monitor)
+                continue
+
+            variable_sets = monitor.get('with_variables', [{"team": team}])
+            monitor_string = self._dump_monitor(monitor)
 
             for variable_set in variable_sets:
-                variable_set['team'] = self._get_team(config)
-
-                interpolated_monitor = monitor.copy()
-                interpolated_monitor.pop('with_variables', None)
-
-                replaces = {re.escape('${{{0}}}'.format(str(k))): str(v) for k, v in variable_set.iteritems()}
-                pattern = re.compile("|".join(replaces.keys()))
-
-                # Dumps the complex dictionary into a simple string. Then replace all of our variables with
-                # their actual values there.
-                interpolated_monitor_string = pattern.sub(
-                    lambda m, reps=replaces: reps[re.escape(m.group(0))],
-                    json.dumps(interpolated_monitor)
-                )
-
-                # If any variables still remain, warn the user but continue.
-                matches = re.search(VARIABLE_PATTERN, interpolated_monitor_string)
-                if matches is not None:
-                    logger.warning(
-                        "Non-interpolated variables '%s' found for monitor '%s'",
-                        ", ".join(matches.groups()), monitor['name']
-                    )
-                    continue
+                interpolated_monitor = self._interpolate_monitor(monitor, monitor_string, variable_set, team)
+                if interpolated_monitor is not None:
+                    interpolated_config['monitors'].append(interpolated_monitor)
 
-                # Load our complex dictionary object back from its string...
-                interpolated_monitor = json.loads(interpolated_monitor_string)
+        return interpolated_config
 
-                # Build and set the monitor's tags
-                interpolated_monitor['tags'] = self._build_tags(MonitorType.DK_MONITOR,
-                                                                self._get_team(config),
-                                                                interpolated_monitor.get('tags', {}))
+    def _dump_monitor(self, monitor):
+        """Dumps a monitor, without its variables, into the string that variables are interpolated into"""
+        monitor = monitor.copy()
+        for key in VARIABLE_SOURCES:
+            monitor.pop(key, None)
+        return json.dumps(monitor)
 
-                interpolated_config['monitors'].append(interpolated_monitor)
+    def _interpolate_monitor(self, monitor, monitor_string, variable_set, team):
+        """
+        Interpolates one set of variables into a monitor dumped by _dump_monitor.
 
-        return interpolated_config
+        Returns the interpolated monitor, or None if any variables remain uninterpolated.
+        """
+        variable_set = dict(variable_set, team=team)
+        replaces = {re.escape('${{{0}}}'.format(str(k))): str(v) for k, v in variable_set.iteritems()}
+        pattern = re.compile("|".join(replaces.keys()))
+
+        # Dumps the complex dictionary into a simple string. Then replace all of our variables with
+        # their actual values there.
+        interpolated_monitor_string = pattern.sub(
+            lambda m, reps=replaces: reps[re.escape(m.group(0))],
+            monitor_string
+        )
+
+        # If any variables still remain, warn the user but continue.
+        matches = re.search(VARIABLE_PATTERN, interpolated_monitor_string)
+        if matches is not None:
+            logger.warning(
+                "Non-interpolated variables '%s' found for monitor '%s'",
+                ", ".join(matches.groups()), monitor['name']
+            )
+            return None
+
+        # Load our complex dictionary object back from its string...
+        interpolated_monitor = json.loads(interpolated_monitor_string)
+
+        # Build and set the monitor's tags
+        interpolated_monitor['tags'] = self._build_tags(MonitorType.DK_MONITOR,
+                                                        team,
+                                                        interpolated_monitor.get('tags', {}))
+        return interpolated_monitor
+
+    def _expand_lazy_monitors(self, team, tags):
+        """
+        Lazily yields the interpolated monitors of a team's monitors with a variable_matrix or a
+        with_variables_file that could match the tags.
+        """
+        for monitor in self.team_config[team].get('lazy_monitors', []):
+            constraints = self._get_variable_constraints(monitor, team, tags)
+            if constraints is None:
+                continue
+
+            if 'variable_matrix' in monitor:
+                variable_sets = self._expand_variable_matrix(monitor['variable_matrix'], constraints)
+            else:
+                variable_sets = self._read_variables_file(monitor['with_variables_file'], constraints)
+
+            monitor_string = self._dump_monitor(monitor)
+            for variable_set in variable_sets:
+                interpolated_monitor = self._interpolate_monitor(monitor, monitor_string, variable_set, team)
+                if interpolated_monitor is not None:
+                    yield interpolated_monitor
+
+    def _get_variable_constraints(self, monitor, team, tags):
+        """
+        Works out which variable sets of a monitor can match the requested tags, so that the others are
+        never enumerated. A tag of the monitor that is just a variable constrains that variable to the
+        requested value.
+
+        Returns a dictionary of variables to the only value they can have, or None if the monitor can't match
+        the tags whatever its variables.
+        """
+        monitor_tags = monitor.get('tags', {})
+        default_tags = self._build_tags(MonitorType.DK_MONITOR, team)
+        constraints = {}
+
+        for tag, value in (tags or {}).items():
+            if tag in default_tags:
+                if str(default_tags[tag]) != str(value):
+                    return None
+                continue
+            if tag not in monitor_tags:
+                return None
+
+            template = str(monitor_tags[tag]).replace('${team}', team)
+            variable = re.match(r'^\$\{(.+?)\}$', template)
+            if variable:
+                constraints[variable.group(1)] = str(value)
+            elif not re.search(VARIABLE_PATTERN, template) and template != str(value):
+                return None
+
+        return constraints
+
+    def _expand_variable_matrix(self, matrix, constraints):
+        """
+        Lazily yields the variable sets of a variable_matrix, every combination of the values of its axes
+        that isn't excluded. Axes are narrowed down to the values allowed by the constraints first.
+        """
+        axes = {
+            axis: [
+                str(value) for value in values if axis not in constraints or str(value) == constraints[axis]
+            ]
+            for axis, values in matrix['axes'].items()
+        }
+        exclusions = [
+            {axis: str(value) for axis, value in exclusion.items()} for exclusion in matrix.get('exclude', [])
+        ]
+        names = sorted(axes)
+        for values in itertools.product(*[axes[name] for name in names]):
+            variable_set = dict(zip(names, values))
+            if not any(all(variable_set.get(axis) == value for axis, value in exclusion.items())
+                       for exclusion in exclusions):
+                yield variable_set
+
+    def _read_variables_file(self, path, constraints):
+        """
+        Lazily yields the variable sets of a variables file allowed by the constraints, reading the file a row
+        at a time. CSV files have a header row naming the variables, JSONL files have an object per line.
+        """
+        if path.endswith('.csv'):
+            with open(path, 'rb') as variables_file:
+                rows = csv.DictReader(variables_file)
+                for row in rows:
+                    if self._satisfies(row, constraints):
+                        yield row
+        elif path.endswith(('.jsonl', '.ndjson')):
+            with open(path) as variables_file:
+                for line_number, line in enumerate(variables_file, 1):
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise Exception('Line {0} of {1} should be an object of variables'.format(
+                            line_number, path))
+                    if self._satisfies(row, constraints):
+                        yield row
+        else:
+            raise Exception('Unsupported variables file {0}, it should be a .csv or .jsonl file'.format(path))
+
+    def _satisfies(self, variable_set, constraints):
+        """Whether a variable set satisfies the constraints on the variables it has"""
+        return all(
+            str(variable_set[variable]) == value
+            for variable, value in constraints.items() if variable in variable_set
+        )
 
     def get_monitors(self, tags=None):
         """
@@ -236,11 +576,16 @@ class Config(object):
         tags = tags or {}
         # logger.info("team config %s", self.team_config)
         for team in self.teams:
-            for monitor in self.team_config[team]['monitors']:
+            monitors = itertools.chain(self.team_config[team]['monitors'],
+                                       self._expand_lazy_monitors(team, tags))
+            for monitor in monitors:
                 monitor_tags = monitor.get('tags', {})
 
                 # Test if the requested tags are a subset of the monitor's tags
                 if tags.viewitems() <= monitor_tags.viewitems():
+                    # Work on a copy, so that the config can be asked for its monitors again
+                    monitor = monitor.copy()
+
                     # Convert tags into the format expected by Datadog's API
                     monitor['tags'] = convert_dict_to_tags(monitor['tags'])
 
@@ -268,12 +613,58 @@ class Config(object):
 
         return configured_monitors
 
+    def get_downtimes(self, tags=None):
+        """
+        Gets downtimes in an appropriate format for the Datadog API. Downtimes only mute the monitors of their
+        own team, since the team's default tags are added to their monitor tags, and the first line of their
+        message identifies them, see DOWNTIME_MARKER_TEMPLATE.
+
+        tags    A dictionary of tags to filter the downtimes by, matched against their monitor tags.
+        """
+        configured_downtimes = []
+        tags = tags or {}
+
+        for team in self.teams:
+            for downtime in self.team_config[team].get('downtimes', []):
+                monitor_tags = dict(downtime.get('monitor_tags', {}), source='data_kennel', team=team)
+                if not tags.viewitems() <= monitor_tags.viewitems():
+                    continue
+
+                marker = DOWNTIME_MARKER_TEMPLATE.format(team, downtime['name'])
+                configured_downtime = {
+                    'scope': downtime.get('scope') or ['*'],
+                    'monitor_tags': sorted(convert_dict_to_tags(monitor_tags)),
+                    'message': marker + ('\n' + downtime['message'] if downtime.get('message') else ''),
+                    # A downtime without an end never ends, and one whose end was removed stops ending
+                    'end': to_timestamp(downtime['end']) if downtime.get('end') is not None else None
+                }
+                if downtime.get('start') is not None:
+                    configured_downtime['start'] = to_timestamp(downtime['start'])
+                if downtime.get('timezone'):
+                    configured_downtime['timezone'] = downtime['timezone']
+                if downtime.get('recurrence'):
+                    configured_downtime['recurrence'] = self._get_recurrence(downtime['recurrence'])
+                configured_downtimes.append(configured_downtime)
+
+        return configured_downtimes
+
+    def _get_recurrence(self, recurrence):
+        """Converts the recurrence of a configured downtime to the format of the Datadog API"""
+        recurrence = dict(recurrence, period=int(recurrence['period']))
+        if recurrence.get('until_date') is not None:
+            recurrence['until_date'] = to_timestamp(recurrence['until_date'])
+        if recurrence.get('until_occurrences') is not None:
+            recurrence['until_occurrences'] = int(recurrence['until_occurrences'])
+        return recurrence
+
     def get_sub_monitor(self, monitor):
         """
         Extract the sub-monitors from the specified monitor in the Datadog format if any exist.
         If the monitor query is a string containing '&&' operator substrings then the monitor is a
         composite monitor and the query elements are the sub-monitor's conditions used by the composite
         monitor.
+        If the team's config sets `share_sub_monitors`, sub-monitors are named after a digest of their
+        normalized query, type and options instead, so identical conditions resolve to one sub-monitor.
         :param monitor: The monitor to process
         """
         if isinstance(monitor['query'], basestring) and '&&' not in monitor['query']:
@@ -289,8 +680,12 @@ class Config(object):
         sub_queries = monitor['query'].split('&&')
         index = 1
         name = monitor['name'][len('[DK] '):] if monitor['name'].startswith('[DK] ') else monitor['name']
-        tags = convert_dict_to_tags(self._build_tags(dk_type=MonitorType.DK_SUB_MONITOR,
-                                                     team=self._get_team_from_monitor_tags(monitor)))
+        team = self._get_team_from_monitor_tags(monitor)
+        share = self._shares_sub_monitors(team)
+        tags = self._build_tags(dk_type=MonitorType.DK_SUB_MONITOR, team=team)
+        if share:
+            tags['dk_shared'] = 'true'
+        tags = convert_dict_to_tags(tags)
 
         for query in sub_queries:
             # Create a new monitor for each
@@ -302,7 +697,30 @@ class Config(object):
             if monitor.get('options'):
                 sub_monitor['options'] = monitor.get('options')
             sub_monitor['query'] = query.strip()
+            if share:
+                # Shared sub-monitors are named after their content, so every composite monitor with the
+                # same condition resolves to the same sub-monitor.
+                sub_monitor['query'] = ' '.join(sub_monitor['query'].split())
+                sub_monitor['name'] = SHARED_SUB_MONITOR_NAME_TEMPLATE.format(
+                    team, self._get_sub_monitor_digest(sub_monitor))
             sub_monitors.append(sub_monitor)
             index += 1
 
         return sub_monitors
+
+    def _shares_sub_monitors(self, team):
+        """Whether the team's composite monitors share sub-monitors with identical conditions"""
+        team_config = self.team_config.get(team, {})
+        return is_truthy(team_config.get('data_kennel', {}).get('share_sub_monitors', False))
+
+    def _get_sub_monitor_digest(self, sub_monitor):
+        """The content address of a sub-monitor, a digest of its query, type and options"""
+        content = json.dumps(
+            {
+                'query': sub_monitor['query'],
+                'type': sub_monitor['type'],
+                'options': sub_monitor.get('options', {})
+            },
+            sort_keys=True
+        )
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,15 @@
+"""
+The values config files can take, shared by the schema of data_kennel.config and by data_kennel.validator,
+which import them from here rather than from each other.
+"""
+
+VARIABLE_PATTERN = "(\\$\\{.+?\\})"
+MONITOR_TYPES = ('metric alert', 'service check', 'event alert', 'query alert')
+DOWNTIME_RECURRENCE_TYPES = ('days', 'weeks', 'months', 'years')
+# The keys a monitor can take its variable sets from, of which it can use one
+VARIABLE_SOURCES = ('with_variables', 'with_variables_file', 'variable_matrix')
+
+
+def has_single_variable_source(monitor):
+    """Whether a monitor uses at most one of with_variables, with_variables_file and variable_matrix"""
+    return sum(1 for key in VARIABLE_SOURCES if key in monitor) <= 1
@@ -0,0 +1,343 @@
+"""
+Data Kennel class for orchestrating management of Datadog downtimes.
+
+A downtime mutes every monitor matching its scope and monitor tags with one API object, instead of silencing
+each monitor through its options. Data Kennel only manages the downtimes it scheduled itself, which it tells
+apart by the first line of their message: '[DK] team | name' for the downtimes of a team's config, and
+'[DK-S] team | name' for downtimes scheduled from the command line. Either kind only mutes the monitors of
+its team, whose default tags are part of its monitor tags.
+"""
+import logging
+import re
+import time
+
+from collections import OrderedDict
+
+from datadog import initialize
+
+from data_kennel.client import DatadogDowntimeClient, HttpDowntimeClient, DEFAULT_API_HOST
+from data_kennel.config import uses_global_client
+from data_kennel.reconciler import ReconcileReport, Reconciler, ResourceAdapter
+from data_kennel.tag_query import TagQuery
+from data_kennel.util import convert_dict_to_tags, run_concurrently, DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# The first line of the message of a downtime scheduled from the command line
+SCHEDULED_DOWNTIME_MARKER_TEMPLATE = '[DK-S] {0} | {1}'
+# The kinds of downtimes, by the prefix of their marker
+DOWNTIME_KINDS = OrderedDict([('[DK] ', 'configured'), ('[DK-S] ', 'scheduled')])
+_MARKER_REGEX = re.compile(r'^(\[DK\] |\[DK-S\] )(.+?) \| (.+)$')
+
+# The fields of a downtime that are written to Datadog and compared with the real downtime
+DOWNTIME_FIELDS = ['scope', 'monitor_tags', 'start', 'end', 'message', 'timezone', 'recurrence']
+# The columns that can be listed, and how to get each one from a downtime
+LIST_COLUMNS = OrderedDict([
+    ('Id', lambda downtime: downtime['id']),
+    ('Team', lambda downtime: parse_marker(downtime)[1]),
+    ('Name', lambda downtime: parse_marker(downtime)[2]),
+    ('Kind', lambda downtime: parse_marker(downtime)[0]),
+    ('Scope', lambda downtime: ', '.join(downtime.get('scope') or [])),
+    ('Monitor Tags', lambda downtime: ', '.join(downtime.get('monitor_tags') or [])),
+    ('Start', lambda downtime: format_timestamp(downtime.get('start'))),
+    ('End', lambda downtime: format_timestamp(downtime.get('end'))),
+    ('Active', lambda downtime: bool(downtime.get('active')))
+])
+DEFAULT_LIST_COLUMNS = list(LIST_COLUMNS)
+
+
+def parse_marker(downtime):
+    """
+    Parses the marker on the first line of a downtime's message.
+
+    Returns a (kind, team, name) tuple, where kind is 'configured' or 'scheduled', or None if Data Kennel
+    didn't schedule the downtime.
+    """
+    match = _MARKER_REGEX.match((downtime.get('message') or '').split('\n', 1)[0])
+    if match is None:
+        return None
+    return DOWNTIME_KINDS[match.group(1)], match.group(2), match.group(3)
+
+
+def is_active(downtime, now):
+    """Whether a downtime is neither cancelled, disabled nor ended at the POSIX timestamp now"""
+    if downtime.get('canceled') or downtime.get('disabled'):
+        return False
+    return downtime.get('end') is None or downtime['end'] > now
+
+
+def _marker_matches(marker, kind=None, team=None, name=None):
+    """Whether a parsed marker has the kind, team and name that are given"""
+    return all(not expected or actual == expected for expected, actual in zip((kind, team, name), marker))
+
+
+def get_marker(downtime):
+    """The marker on the first line of a downtime's message, or None if Data Kennel didn't schedule it"""
+    return downtime['message'].split('\n', 1)[0] if parse_marker(downtime) else None
+
+
+def format_timestamp(timestamp):
+    """Formats a POSIX timestamp as a UTC date and time, or an empty string for None"""
+    if timestamp is None:
+        return ''
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+class DowntimeReport(ReconcileReport):
+    """
+    The changes made, or that would be made in a dry run, by syncing downtimes. Deleted downtimes are
+    cancelled ones.
+    """
+
+    @property
+    def cancelled(self):
+        """The cancelled downtimes"""
+        return self.deleted
+
+    def summary(self):
+        """Returns the markers of the downtimes in each category of change"""
+        return {
+            change: [get_marker(downtime) for downtime in getattr(self, change)]
+            for change in ('created', 'updated', 'unchanged', 'cancelled')
+        }
+
+
+class DowntimeAdapter(ResourceAdapter):
+    """
+    Adapts downtimes and a downtime client to the Reconciler. Downtimes are identified by their marker, and a
+    configured downtime replaces the fields of its real equivalent rather than being merged over it.
+    """
+
+    kind = 'downtime'
+    keys = (get_marker,)
+    verbs = {'created': 'Scheduling', 'updated': 'Updating', 'deleted': 'Cancelling'}
+
+    def __init__(self, client):
+        self.client = client
+
+    def name(self, resource):
+        return get_marker(resource)
+
+    def merge(self, real, configured):
+        return dict(configured, id=real['id'])
+
+    def differs(self, merged, real):
+        """
+        Only the fields the configured downtime has are compared, lists regardless of their order, and
+        recurrences by the keys the configured recurrence sets. Configured downtimes always have an end, None
+        for never.
+        """
+        for field in DOWNTIME_FIELDS:
+            if field not in merged:
+                continue
+            configured_value = merged[field]
+            real_value = real.get(field)
+            if field in ('scope', 'monitor_tags'):
+                configured_value, real_value = sorted(configured_value), sorted(real_value or [])
+            elif field == 'recurrence':
+                real_value = {key: (real_value or {}).get(key) for key in configured_value}
+            if configured_value != real_value:
+                return True
+        return False
+
+    def create(self, resource):
+        response = self._check(self.client.create(**self._fields(resource)), resource)
+        if isinstance(response, dict) and 'id' in response:
+            return dict(resource, id=response['id'])
+        return resource
+
+    def update(self, resource):
+        self._check(self.client.update(resource['id'], **self._fields(resource)), resource)
+        return resource
+
+    def delete(self, resource):
+        return self._check(self.client.delete(resource['id']), resource)
+
+    def _fields(self, resource):
+        """The fields of a downtime written to Datadog"""
+        return {field: resource[field] for field in DOWNTIME_FIELDS if field in resource}
+
+    def _check(self, response, resource):
+        """Raises any error Datadog returned for a downtime, or returns the response"""
+        if isinstance(response, dict) and response.get('errors'):
+            raise Exception('Failed to write downtime {0}: {1}'.format(get_marker(resource),
+                                                                       ', '.join(response['errors'])))
+        return response
+
+
+class Downtime(object):
+    """
+    Class for orchestrating management of Datadog downtimes.
+    """
+
+    def __init__(self, config=None, client=None):
+        self.config = config
+        self.client = client
+
+        # Without a client of its own, the datadog package's global client is used
+        if self.client is None:
+            initialize(
+                api_key=self.config.api_key,
+                app_key=self.config.app_key
+            )
+            self.client = DatadogDowntimeClient()
+        self.adapter = DowntimeAdapter(self.client)
+
+    def list(self, tags=None, columns=None, team=None, name=None, scopes=None):
+        """
+        Yields dictionaries that form a human-readable table of downtimes scheduled by Data Kennel, with
+        optional filtering.
+
+        tags    A dictionary of tags to filter downtimes by, matched against their monitor tags.
+        columns The columns to include in each row, from LIST_COLUMNS. Defaults to DEFAULT_LIST_COLUMNS.
+        team    The team to filter downtimes by.
+        name    The name to filter downtimes by.
+        scopes  A list of scopes that downtimes must all have.
+        """
+        columns = columns or DEFAULT_LIST_COLUMNS
+        for downtime in self.get_downtimes(tags=tags, team=team, name=name, scopes=scopes):
+            yield {column: LIST_COLUMNS[column](downtime) for column in columns}
+
+    def update(self, dry_run=False, tags=None, workers=DEFAULT_WORKERS):
+        """
+        Reconciles the downtimes in Datadog with the downtimes of the config. Configured downtimes that are
+        already scheduled are updated in place if they changed, the others are scheduled. Downtimes of the
+        config's teams that are no longer configured are cancelled. Downtimes scheduled from the command line
+        are left alone. Changes are written concurrently.
+
+        dry_run If True, no changes are written to Datadog.
+        tags    A dictionary of tags to filter downtimes by, matched against their monitor tags.
+        workers The number of changes to write concurrently.
+
+        Returns a DowntimeReport of the changes.
+        """
+        logger.info('Updating downtimes')
+
+        if dry_run:
+            logger.info('--dry-run active, no changes will be made')
+
+        now = int(time.time())
+        configured_downtimes = []
+        for configured_downtime in self.config.get_downtimes(tags):
+            if configured_downtime['end'] is not None and configured_downtime['end'] <= now:
+                logger.info('Skipping downtime that already ended: %s', get_marker(configured_downtime))
+                continue
+            configured_downtimes.append(configured_downtime)
+
+        # Newer downtimes are matched first, so that older duplicates with the same marker are cancelled
+        real_downtimes = sorted(self.get_downtimes(tags=tags, kind='configured'),
+                                key=lambda downtime: downtime['id'], reverse=True)
+        reconciler = Reconciler(self.adapter, real_downtimes, dry_run=dry_run, report=DowntimeReport())
+        return reconciler.reconcile(configured_downtimes, workers=workers)
+
+    def schedule(self, team, name, scope=None, monitor_tags=None, start=None, end=None, message=None,
+                 dry_run=False):
+        """
+        Schedules a downtime from the command line, muting the monitors of a team that match the scope and
+        monitor tags. Scheduling a downtime with the name of one that is already scheduled updates it instead.
+
+        team            The team whose monitors are muted.
+        name            The name of the downtime.
+        scope           A list of scopes to mute. Defaults to every scope.
+        monitor_tags    A dictionary of the tags of the monitors to mute.
+        start           A POSIX timestamp to start at. Defaults to now.
+        end             A POSIX timestamp to end at. Defaults to never.
+        message         A message for the notifications of the downtime.
+        dry_run         If True, no changes are written to Datadog.
+
+        Returns the scheduled downtime.
+        """
+        if team not in self.config.teams:
+            raise Exception('Team {0} has no config'.format(team))
+
+        marker = SCHEDULED_DOWNTIME_MARKER_TEMPLATE.format(team, name)
+        downtime = {
+            'scope': scope or ['*'],
+            'monitor_tags': sorted(convert_dict_to_tags(dict(monitor_tags or {}, source='data_kennel',
+                                                             team=team))),
+            'message': marker + ('\n' + message if message else ''),
+            'end': end
+        }
+        if start is not None:
+            downtime['start'] = start
+
+        existing = self.get_downtimes(team=team, name=name, kind='scheduled')
+        if existing:
+            logger.info('Updating downtime: %s', marker)
+            downtime['id'] = existing[-1]['id']
+            return downtime if dry_run else self.adapter.update(downtime)
+
+        logger.info('Scheduling downtime: %s', marker)
+        return downtime if dry_run else self.adapter.create(downtime)
+
+    def cancel(self, dry_run=False, tags=None, team=None, name=None, scopes=None, workers=DEFAULT_WORKERS):
+        """
+        Cancels downtimes scheduled by Data Kennel, whether from a config or the command line.
+
+        dry_run If True, no changes are written to Datadog.
+        tags    A dictionary of tags to filter downtimes by, matched against their monitor tags.
+        team    The team to filter downtimes by.
+        name    The name to filter downtimes by.
+        scopes  A list of scopes that downtimes must all have.
+        workers The number of downtimes to cancel concurrently.
+
+        Returns the cancelled downtimes.
+        """
+        logger.info('Cancelling downtimes')
+
+        if dry_run:
+            logger.info('--dry-run active, no changes will be made')
+
+        downtimes = self.get_downtimes(tags=tags, team=team, name=name, scopes=scopes)
+        for downtime in downtimes:
+            logger.info('Cancelling downtime: %s', get_marker(downtime))
+
+        if not dry_run:
+            run_concurrently(self.adapter.delete, downtimes, workers)
+        return downtimes
+
+    def get_downtimes(self, tags=None, team=None, name=None, scopes=None, kind=None):
+        """
+        Gets the downtimes scheduled by Data Kennel for the teams of the config that haven't been cancelled
+        or ended, with some convenient filtering.
+
+        tags    A dictionary of tags to filter downtimes by, matched against their monitor tags.
+        team    The team to filter downtimes by.
+        name    The name to filter downtimes by.
+        scopes  A list of scopes that downtimes must all have.
+        kind    'configured' or 'scheduled' to only get downtimes of that kind.
+        """
+        response = self.client.get_all()
+        if isinstance(response, dict) and response.get('errors'):
+            raise Exception('Failed to get downtimes: {0}'.format(', '.join(response['errors'])))
+
+        now = int(time.time())
+        tag_query = TagQuery.from_tags(convert_dict_to_tags(tags)) if tags else None
+        teams = set(self.config.teams)
+        downtimes = []
+        for downtime in response:
+            marker = parse_marker(downtime)
+            if marker is None or marker[1] not in teams or not is_active(downtime, now):
+                continue
+            if not _marker_matches(marker, kind=kind, team=team, name=name):
+                continue
+            if scopes and not set(scopes) <= set(downtime.get('scope') or []):
+                continue
+            if tag_query and not tag_query.matches(downtime.get('monitor_tags') or []):
+                continue
+            downtimes.append(downtime)
+        return downtimes
+
+
+def create_org_downtime(config, org):
+    """
+    Creates a Downtime for the teams of one org of the config, like data_kennel.monitor.create_org_monitor
+    creates a Monitor.
+    """
+    org_config = config.for_org(org)
+    if uses_global_client(org):
+        return Downtime(org_config)
+
+    client = HttpDowntimeClient(org_config.api_key, org_config.app_key,
+                                org_config.api_host or DEFAULT_API_HOST)
+    return Downtime(org_config, client=client)
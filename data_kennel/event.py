@@ -0,0 +1,301 @@
+"""
+Datadog events, emitted without waiting on Datadog.
+
+EventEmitter queues events in memory and sends them from a background thread, so emitting an event costs the
+caller next to nothing. The events queued while a batch is being sent make up the next batch, whose events
+are posted concurrently since the event API takes one event per request. Requests that fail or are rate
+limited are retried with exponential backoff, and events that still can't be sent are spooled to disk, if a
+spool directory is set, to be replayed once Datadog is reachable again. Queued events are flushed when the
+process exits. Events are sent at least once: an event whose request is still in flight when closing times
+out is spooled too, and is sent twice if that request succeeds after all.
+"""
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    from Queue import Empty, Queue
+except ImportError:
+    from queue import Empty, Queue
+
+from datadog import initialize
+
+from data_kennel.client import DatadogEventClient, HttpEventClient, DEFAULT_API_HOST
+from data_kennel.config import uses_global_client
+from data_kennel.util import is_rate_limited, run_concurrently, DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+ALERT_TYPES = ('info', 'success', 'warning', 'error')
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+# How long closing an emitter waits for queued events to be sent before spooling them
+DEFAULT_CLOSE_TIMEOUT = 10.0
+SPOOL_PREFIX = 'events-'
+SPOOL_SUFFIX = '.jsonl'
+
+# Tells the sender thread to stop
+_STOP = object()
+
+
+def _is_retryable(response):
+    """Whether a failed request may succeed if retried, because of rate limits or a server error"""
+    return is_rate_limited(response) or any(str(error).startswith('5') for error in response['errors'])
+
+
+class EventEmitter(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Emits Datadog events from a background thread. See the module documentation.
+    """
+
+    def __init__(self, client, batch_size=DEFAULT_BATCH_SIZE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, spool_dir=None, workers=DEFAULT_WORKERS):
+        """
+        client      The event client, e.g. a DatadogEventClient or HttpEventClient.
+        batch_size  The maximum number of events sent at a time.
+        retries     How many times a failed request is retried.
+        backoff     The seconds waited before the first retry, doubling with each retry.
+        spool_dir   The directory events that couldn't be sent are spooled to. If None they are dropped.
+        workers     The number of concurrent requests of a batch.
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.sent = 0
+        self.spooled = 0
+        self.dropped = 0
+        self._queue = Queue()
+        self._condition = threading.Condition()
+        self._pending = 0
+        # The events of the batch being sent whose requests haven't completed, by id
+        self._in_flight = {}
+        self._closed = False
+        self._sender = None
+
+    def emit(self, title, text='', tags=None, alert_type='info', **fields):
+        """
+        Queues an event and returns right away. Any other field of the event API, such as aggregation_key,
+        source_type_name or host, can be given as a keyword argument. The event happened now unless
+        date_happened says otherwise.
+        """
+        if alert_type not in ALERT_TYPES:
+            raise ValueError('Unknown alert type {0!r}, it should be one of {1}'.format(
+                alert_type, ', '.join(ALERT_TYPES)))
+
+        event = dict(fields, title=title, text=text, tags=list(tags or []), alert_type=alert_type)
+        event.setdefault('date_happened', int(time.time()))
+
+        with self._condition:
+            if self._closed:
+                raise Exception('Unable to emit event {0!r}, the emitter is closed'.format(title))
+            self._pending += 1
+            self._queue.put(event)
+            if self._sender is None:
+                self._start()
+
+    def flush(self, timeout=None):
+        """
+        Waits up to timeout seconds, or forever if timeout is None, until every event emitted so far has been
+        sent, spooled or dropped. Returns whether they all were.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=DEFAULT_CLOSE_TIMEOUT):
+        """
+        Stops emitting events, waiting up to timeout seconds for queued events to be sent. Events that weren't
+        sent by then, including those still being sent, are spooled, or dropped without a spool directory.
+        Returns whether every event was sent. Called when the process exits.
+        """
+        with self._condition:
+            if self._closed:
+                return True
+            self._closed = True
+
+        flushed = self.flush(timeout)
+        if flushed or self._sender is None:
+            if self._sender is not None:
+                self._queue.put(_STOP)
+                self._sender.join()
+            return flushed
+
+        # The sender is still sending a batch, which isn't waited for since the process may exit before it is
+        # sent. The events of the batch that haven't been sent yet and the events queued behind it are
+        # spooled, and the sender stops after the batch.
+        with self._condition:
+            unsent = list(self._in_flight.values())
+            self._in_flight = {}
+        if unsent:
+            logger.warning('Closing with %s events still being sent, which are spooled and may be sent twice',
+                           len(unsent))
+        while True:
+            try:
+                unsent.append(self._queue.get_nowait())
+            except Empty:
+                break
+        self._queue.put(_STOP)
+        if unsent:
+            self._spool(unsent)
+        return flushed
+
+    def replay_spool(self):
+        """
+        Sends the events spooled by this or earlier processes, oldest first, respooling the ones that still
+        can't be sent. Returns the number of events sent.
+        """
+        if self.spool_dir is None or not os.path.isdir(self.spool_dir):
+            return 0
+
+        sent = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not (name.startswith(SPOOL_PREFIX) and name.endswith(SPOOL_SUFFIX)):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            with open(path) as spool_file:
+                events = [json.loads(line) for line in spool_file if line.strip()]
+            logger.info('Replaying %s spooled events from %s', len(events), path)
+
+            results = run_concurrently(self._send, events, self.workers)
+            failed = [event for event, result in zip(events, results) if result == 'failed']
+            sent += results.count('sent')
+            if failed:
+                self._spool(failed)
+            os.remove(path)
+
+        with self._condition:
+            self.sent += sent
+        return sent
+
+    def _start(self):
+        """Starts the sender thread. Called with the condition held."""
+        self._sender = threading.Thread(target=self._run, name='data_kennel-events')
+        self._sender.daemon = True
+        self._sender.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        """Sends the queued events in batches until told to stop"""
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+            if batch:
+                self._send_batch(batch)
+            if stop:
+                return
+
+    def _send_batch(self, batch):
+        """Sends a batch of events concurrently, spooling the ones that couldn't be sent"""
+        with self._condition:
+            self._in_flight = dict((id(event), event) for event in batch)
+        results = run_concurrently(self._send_in_flight, batch, self.workers)
+        failed = [event for event, result in zip(batch, results) if result == 'failed']
+        if failed:
+            self._spool(failed)
+
+        with self._condition:
+            self.sent += results.count('sent')
+            self._pending -= len(batch)
+            self._condition.notify_all()
+
+    def _send_in_flight(self, event):
+        """
+        Sends an event of the batch being sent, see _send. Returns 'spooled' rather than 'failed' for an event
+        that closing already spooled while it was being sent.
+        """
+        result = self._send(event)
+        with self._condition:
+            if self._in_flight.pop(id(event), None) is None and result == 'failed':
+                return 'spooled'
+        return result
+
+    def _send(self, event):
+        """
+        Sends an event, retrying with exponential backoff.
+
+        Returns 'sent', 'failed' if it can be sent later, or 'dropped' if Datadog rejected it.
+        """
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = self.client.create(**event)
+            except Exception as ex:  # pylint: disable=broad-except
+                error = str(ex)
+            else:
+                if not (isinstance(response, dict) and response.get('errors')):
+                    return 'sent'
+                error = ', '.join(str(error) for error in response['errors'])
+                if not _is_retryable(response):
+                    logger.error('Dropping event %r rejected by Datadog: %s', event['title'], error)
+                    with self._condition:
+                        self.dropped += 1
+                    return 'dropped'
+            logger.warning('Failed to send event %r (attempt %s of %s): %s', event['title'], attempt + 1,
+                           self.retries + 1, error)
+        return 'failed'
+
+    def _spool(self, events):
+        """Writes events that couldn't be sent to a new file of the spool directory, or drops them"""
+        if self.spool_dir is None:
+            logger.error('Dropping %s events that could not be sent', len(events))
+            with self._condition:
+                self.dropped += len(events)
+            return
+
+        if not os.path.isdir(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        # Spool files sort by when they were written
+        path = os.path.join(self.spool_dir, '{0}{1:015d}-{2}{3}'.format(
+            SPOOL_PREFIX, int(time.time() * 1000), uuid.uuid4().hex, SPOOL_SUFFIX))
+        descriptor, temporary_path = tempfile.mkstemp(dir=self.spool_dir, prefix='.data_kennel',
+                                                      suffix='.jsonl.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as spool_file:
+                for event in events:
+                    spool_file.write(json.dumps(event) + '\n')
+            os.rename(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+        logger.warning('Spooled %s events that could not be sent to %s', len(events), path)
+        with self._condition:
+            self.spooled += len(events)
+
+
+def create_org_emitter(config, org, **options):
+    """
+    Creates an EventEmitter posting to one org of the config, like data_kennel.monitor.create_org_monitor
+    creates a Monitor. The options are those of EventEmitter.
+    """
+    org_config = config.for_org(org)
+    if uses_global_client(org):
+        initialize(api_key=org_config.api_key, app_key=org_config.app_key)
+        return EventEmitter(DatadogEventClient(), **options)
+
+    client = HttpEventClient(org_config.api_key, org_config.app_key,
+                             org_config.api_host or DEFAULT_API_HOST)
+    return EventEmitter(client, **options)
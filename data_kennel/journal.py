@@ -0,0 +1,102 @@
+"""
+Checkpoint journal of a sync, so that an interrupted sync can be resumed.
+
+The journal is a JSONL file with a line per monitor the sync created, updated, found unchanged or deleted,
+appended as soon as Datadog answers. A resumed sync takes the monitors already in the journal as done instead
+of comparing them again, and never creates them a second time. A sync that runs to the end marks its journal
+complete, and resuming from a complete journal starts over.
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_OPERATIONS = ('created', 'updated', 'unchanged', 'deleted')
+COMPLETE = 'complete'
+
+
+def digest_monitor(monitor):
+    """A digest of a configured monitor, so that a journaled monitor isn't skipped once its config changes"""
+    return hashlib.sha1(json.dumps(monitor, sort_keys=True)).hexdigest()
+
+
+class SyncJournal(object):
+    """
+    Append-only journal of the operations of a sync.
+
+    path    The path of the journal file.
+    resume  If True, the operations of an incomplete journal at the path are kept and can be looked up.
+            Otherwise the journal starts empty.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        # The last journaled operation of each monitor, by name
+        self.entries = self._read(path) if resume and os.path.exists(path) else {}
+
+        if self.entries:
+            logger.info('Resuming from %s operations journaled in %s', len(self.entries), path)
+            self._file = open(path, 'a+')
+            # The interrupted sync may have died halfway through writing a line
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell():
+                self._file.seek(-1, os.SEEK_END)
+                if self._file.read(1) != '\n':
+                    self._file.write('\n')
+        else:
+            self._file = open(path, 'w')
+
+    def _read(self, path):
+        """Reads the entries of a journal, none if the journal is complete"""
+        entries = {}
+        with open(path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning('Skipping a truncated line of journal %s', path)
+                    continue
+
+                if entry.get('op') == COMPLETE:
+                    entries = {}
+                elif entry.get('op') in JOURNAL_OPERATIONS:
+                    entries[entry['name']] = entry
+        return entries
+
+    def lookup(self, configured_monitor):
+        """
+        Returns the journal entry of a configured monitor whose sync already completed, with the 'op' and the
+        resulting 'monitor', or None if the monitor still needs to be synced.
+        """
+        entry = self.entries.get(configured_monitor['name'])
+        if entry and entry['op'] != 'deleted' and entry['digest'] == digest_monitor(configured_monitor):
+            return entry
+        return None
+
+    def record(self, operation, configured_monitor, monitor):
+        """Durably appends a completed operation to the journal"""
+        entry = {
+            'op': operation,
+            'name': configured_monitor['name'],
+            'digest': digest_monitor(configured_monitor),
+            'monitor': monitor
+        }
+        self._write(entry)
+        self.entries[entry['name']] = entry
+
+    def complete(self):
+        """Marks the sync as complete and closes the journal"""
+        self._write({'op': COMPLETE})
+        self.close()
+
+    def close(self):
+        """Closes the journal"""
+        self._file.close()
+
+    def _write(self, entry):
+        """Writes a line to the journal and flushes it to disk"""
+        self._file.write(json.dumps(entry, sort_keys=True) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -0,0 +1,254 @@
+"""
+Queries of Datadog metrics over long time ranges.
+
+Datadog limits the points a metric query returns and how often it can be called, so long ranges are split
+into chunks that are fetched concurrently, retrying rate limited requests. Chunks are aligned to multiples of
+their duration since the epoch, so that overlapping ranges share chunks, and chunks that have passed are
+cached on disk per org, query and chunk: their points no longer change, so they are never fetched again.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from collections import OrderedDict
+
+from datadog import initialize
+
+from data_kennel.client import DatadogMetricClient, HttpMetricClient, DEFAULT_API_HOST
+from data_kennel.config import uses_global_client
+from data_kennel.util import is_rate_limited, run_concurrently, user_cache_dir, DEFAULT_WORKERS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK = 6 * 60 * 60
+# How long Datadog can take to ingest points, after which a chunk is complete and can be cached
+INGESTION_DELAY = 15 * 60
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BACKOFF = 2.0
+
+
+def default_cache_dir():
+    """The directory metric queries are cached in by default, under the user's cache directory"""
+    return user_cache_dir('metrics')
+
+
+def split_range(start, end, chunk=DEFAULT_CHUNK):
+    """
+    Splits the time range from start to end, in POSIX timestamps, into (start, end) chunks aligned to
+    multiples of the chunk duration. The first and last chunks are whole chunks overlapping the range.
+
+    >>> split_range(100, 250, chunk=100)
+    [(100, 200), (200, 300)]
+    >>> split_range(150, 151, chunk=100)
+    [(100, 200)]
+    """
+    first = start - start % chunk
+    return [(chunk_start, chunk_start + chunk) for chunk_start in range(first, end, chunk)]
+
+
+def series_name(series):
+    """The name of a series, its expression or its metric and scope"""
+    return series.get('expression') or '{0}{{{1}}}'.format(series.get('metric'), series.get('scope', '*'))
+
+
+class MetricCache(object):
+    """
+    The series of complete chunks of metric queries, one JSON file per query and chunk in a directory.
+    Files are written atomically, so concurrent queries never read a half written chunk.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def for_org(self, org):
+        """
+        The cache of one org, in a directory of its own, since the same query has different series in every
+        org
+        """
+        return MetricCache(os.path.join(self.directory, re.sub(r'[^\w.-]', '_', org)))
+
+    def get(self, query, chunk):
+        """The cached series of a chunk of a query, or None if it isn't cached"""
+        try:
+            with open(self._path(query, chunk)) as chunk_file:
+                return json.load(chunk_file)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, query, chunk, series):
+        """Caches the series of a chunk of a query"""
+        path = self._path(query, chunk)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another query may have created it in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.data_kennel',
+                                                      suffix='.json.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as chunk_file:
+                json.dump(series, chunk_file)
+            os.rename(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+    def _path(self, query, chunk):
+        """The file caching a chunk of a query"""
+        digest = hashlib.sha1(query.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], '{0}-{1}-{2}.json'.format(digest, *chunk))
+
+
+class Metric(object):
+    """
+    Class for querying Datadog metrics
+    """
+
+    def __init__(self, config=None, client=None, cache=None):
+        """
+        config  The Config whose credentials are used, unless a client is given.
+        client  The metric client, e.g. a DatadogMetricClient or HttpMetricClient.
+        cache   The MetricCache of complete chunks, or None to fetch every chunk.
+        """
+        self.config = config
+        self.client = client
+        self.cache = cache
+
+        # Without a client of its own, the datadog package's global client is used
+        if self.client is None:
+            initialize(
+                api_key=self.config.api_key,
+                app_key=self.config.app_key
+            )
+            self.client = DatadogMetricClient()
+
+    def query(self, query, start, end, chunk=DEFAULT_CHUNK, workers=DEFAULT_WORKERS):
+        """
+        Queries the series of a metric query from start to end, in POSIX timestamps. The range is fetched in
+        chunks of chunk seconds, up to workers at once, and complete chunks are cached.
+
+        Returns a list of series, each a dictionary with the name, metric, scope and expression of the
+        series, and its points as [timestamp, value] pairs in seconds, in the order Datadog returned them.
+        """
+        chunks = split_range(start, end, chunk)
+        complete_before = int(time.time()) - INGESTION_DELAY
+
+        cached = {}
+        if self.cache is not None:
+            for query_chunk in chunks:
+                if query_chunk[1] <= complete_before:
+                    series = self.cache.get(query, query_chunk)
+                    if series is not None:
+                        cached[query_chunk] = series
+
+        missing = [query_chunk for query_chunk in chunks if query_chunk not in cached]
+        logger.info('Querying %s: %s chunks, %s cached', query, len(chunks), len(cached))
+
+        fetched = run_concurrently(lambda query_chunk: self._fetch(query, query_chunk), missing, workers)
+        for query_chunk, series in zip(missing, fetched):
+            cached[query_chunk] = series
+            if self.cache is not None and query_chunk[1] <= complete_before:
+                self.cache.put(query, query_chunk, series)
+
+        return self._merge([cached[query_chunk] for query_chunk in chunks], start, end)
+
+    def _fetch(self, query, chunk):
+        """Fetches the series of a chunk of a query, retrying while rate limited"""
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            response = self.client.query(chunk[0], chunk[1] - 1, query)
+            if not is_rate_limited(response) or attempt == RATE_LIMIT_RETRIES:
+                break
+            backoff = RATE_LIMIT_BACKOFF * 2 ** attempt
+            logger.warning('Rate limited querying %s, retrying in %s seconds', query, backoff)
+            time.sleep(backoff)
+
+        if not isinstance(response, dict):
+            raise Exception('Failed to query {0}: {1}'.format(query, response))
+        if response.get('errors') or response.get('status') == 'error':
+            raise Exception('Failed to query {0}: {1}'.format(
+                query, ', '.join(response.get('errors') or [response.get('error', 'unknown error')])))
+
+        return [
+            {
+                'name': series_name(series),
+                'metric': series.get('metric'),
+                'scope': series.get('scope'),
+                'expression': series.get('expression'),
+                'points': [
+                    [int(timestamp // 1000), value] for timestamp, value in series.get('pointlist', [])
+                    if chunk[0] * 1000 <= timestamp < chunk[1] * 1000
+                ]
+            }
+            for series in response.get('series', [])
+        ]
+
+    def _merge(self, chunks, start, end):
+        """Merges the series of consecutive chunks, keeping the points from start to end"""
+        merged = OrderedDict()
+        for chunk_series in chunks:
+            for series in chunk_series:
+                if series['name'] not in merged:
+                    merged[series['name']] = dict(series, points=[])
+                merged[series['name']]['points'].extend(
+                    point for point in series['points'] if start <= point[0] <= end
+                )
+        return list(merged.values())
+
+
+def list_points(series):
+    """Yields a row of every point of the series, for print_rows"""
+    for one_series in series:
+        for timestamp, value in one_series['points']:
+            yield {'Series': one_series['name'], 'Timestamp': timestamp, 'Value': value}
+
+
+def write_npz(path, series):
+    """
+    Writes series to a NumPy .npz file in columns: 'timestamps', the sorted timestamps of every point,
+    'values', a series by timestamp array of floats with NaN where a series has no point, and 'series', the
+    names of the series. Requires numpy.
+    """
+    if numpy is None:
+        raise ImportError('Writing .npz files requires numpy, install data_kennel[metric]')
+
+    timestamps = numpy.array(sorted(set(
+        timestamp for one_series in series for timestamp, _ in one_series['points']
+    )), dtype=numpy.int64)
+    values = numpy.full((len(series), len(timestamps)), numpy.nan)
+    for row, one_series in enumerate(series):
+        points = one_series['points']
+        if points:
+            columns = numpy.searchsorted(timestamps, [timestamp for timestamp, _ in points])
+            values[row, columns] = [numpy.nan if value is None else value for _, value in points]
+
+    with open(path, 'wb') as npz_file:
+        numpy.savez(npz_file, timestamps=timestamps, values=values,
+                    series=numpy.array([one_series['name'] for one_series in series]))
+
+
+def create_org_metric(config, org, cache=None):
+    """
+    Creates a Metric querying one org of the config, like data_kennel.monitor.create_org_monitor creates a
+    Monitor. The Metric caches chunks in the org's own part of the cache, see MetricCache.for_org.
+    """
+    org_config = config.for_org(org)
+    cache = cache.for_org(org) if cache is not None else None
+    if uses_global_client(org):
+        return Metric(org_config, cache=cache)
+
+    client = HttpMetricClient(org_config.api_key, org_config.app_key,
+                              org_config.api_host or DEFAULT_API_HOST)
+    return Metric(org_config, client=client, cache=cache)
@@ -0,0 +1,233 @@
+"""
+Run metrics of Data Kennel commands, written in the Prometheus textfile format.
+
+While metrics are being collected, the time spent in each phase of a run, the requests made to the monitor
+API with their latencies, and the monitors synced for each team are recorded. At the end of the run they are
+written to a file that node_exporter's textfile collector picks up. The file is replaced atomically, so the
+collector never reads a half written file.
+"""
+import bisect
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from data_kennel.util import is_rate_limited
+
+METRIC_PREFIX = 'data_kennel'
+# The upper bounds of the API request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SYNC_CHANGES = ('created', 'updated', 'unchanged', 'deleted')
+
+logger = logging.getLogger(__name__)
+
+# The metrics of the running command, if any. Consulted by `metrics_phase` and `instrument_client`.
+_ACTIVE_METRICS = [None]
+
+
+class RunMetrics(object):
+    """
+    Metrics of one run of a command. Recording is safe from several threads.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.started = time.time()
+        self.duration = None
+        self.success = None
+        self.phase_durations = defaultdict(float)
+        # (operation, status) to request count, latency sum and counts per latency bucket
+        self.request_counts = defaultdict(int)
+        self.request_latency_sums = defaultdict(float)
+        self.request_latency_buckets = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        # (team, change) to the number of monitors
+        self.monitor_counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_phase(self, phase, duration):
+        """Records time spent in a phase of the run"""
+        with self._lock:
+            self.phase_durations[phase] += duration
+
+    def record_request(self, operation, status, latency):
+        """Records a request to the monitor API"""
+        key = (operation, status)
+        with self._lock:
+            self.request_counts[key] += 1
+            self.request_latency_sums[key] += latency
+            buckets = self.request_latency_buckets[key]
+            for index in range(bisect.bisect_left(LATENCY_BUCKETS, latency), len(LATENCY_BUCKETS)):
+                buckets[index] += 1
+
+    def record_sync(self, report):
+        """Records the monitors a SyncReport created, updated, found unchanged and deleted, per team"""
+        with self._lock:
+            for change in SYNC_CHANGES:
+                for monitor in getattr(report, change):
+                    team = next((tag[len('team:'):] for tag in monitor.get('tags') or []
+                                 if tag.startswith('team:')), '')
+                    self.monitor_counts[(team, change)] += 1
+
+    def finish(self, success):
+        """Records the end of the run"""
+        self.duration = time.time() - self.started
+        self.success = success
+
+    def render(self):
+        """Renders the metrics in the Prometheus text exposition format"""
+        lines = []
+        command = {'command': self.command}
+
+        def metric(name, metric_type, description, samples):
+            """Renders one metric family, from (suffix, labels, value) samples"""
+            lines.append('# HELP {0}_{1} {2}'.format(METRIC_PREFIX, name, description))
+            lines.append('# TYPE {0}_{1} {2}'.format(METRIC_PREFIX, name, metric_type))
+            for suffix, labels, value in samples:
+                lines.append('{0}_{1}{2}{3} {4}'.format(
+                    METRIC_PREFIX, name, suffix, _render_labels(dict(command, **labels)), _render_value(value)
+                ))
+
+        metric('run_duration_seconds', 'gauge', 'How long the last run took.',
+               [('', {}, self.duration or 0)])
+        metric('run_success', 'gauge', 'Whether the last run succeeded.',
+               [('', {}, 1 if self.success else 0)])
+        metric('run_timestamp_seconds', 'gauge', 'When the last run started.', [('', {}, self.started)])
+        metric('phase_duration_seconds', 'gauge', 'Time the last run spent in each phase.',
+               [('', {'phase': phase}, duration) for phase, duration in sorted(self.phase_durations.items())])
+        metric('api_requests_total', 'counter', 'Requests the last run made to the monitor API.',
+               [('', {'operation': operation, 'status': status}, count)
+                for (operation, status), count in sorted(self.request_counts.items())])
+        metric('api_request_duration_seconds', 'histogram', 'Latency of the requests to the monitor API.',
+               self._latency_samples())
+        metric('monitors', 'gauge', 'Monitors the last run created, updated, found unchanged or deleted.',
+               [('', {'team': team, 'change': change}, count)
+                for (team, change), count in sorted(self.monitor_counts.items())])
+        return '\n'.join(lines) + '\n'
+
+    def _latency_samples(self):
+        """The (suffix, labels, value) samples of the request latency histogram"""
+        samples = []
+        for key, buckets in sorted(self.request_latency_buckets.items()):
+            labels = {'operation': key[0], 'status': key[1]}
+            for bound, count in zip(LATENCY_BUCKETS, buckets):
+                samples.append(('_bucket', dict(labels, le=_render_value(bound)), count))
+            samples.append(('_bucket', dict(labels, le='+Inf'), self.request_counts[key]))
+            samples.append(('_sum', labels, self.request_latency_sums[key]))
+            samples.append(('_count', labels, self.request_counts[key]))
+        return samples
+
+
+def _render_labels(labels):
+    """Renders the labels of a sample, escaped as the exposition format requires"""
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in sorted(labels.items())
+    ) + '}'
+
+
+def _render_value(value):
+    """Renders the value of a sample"""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_textfile(path, metrics):
+    """Writes the metrics to a textfile, atomically replacing any previous one"""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.data_kennel', suffix='.prom.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as metrics_file:
+            metrics_file.write(metrics.render())
+        os.chmod(temporary_path, 0o644)
+        os.rename(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+class InstrumentedMonitorClient(object):
+    """
+    Monitor client recording the count, status and latency of the requests of the client it wraps. A
+    request's status is 'ok', 'error' if Datadog returned errors, 'rate_limited' if those errors are about
+    rate limits, or 'exception' if the request raised.
+    """
+
+    def __init__(self, client, metrics):
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, operation):
+        method = getattr(self.client, operation)
+
+        def call(*args, **kwargs):
+            """Calls the operation of the wrapped client, recording the request"""
+            started = time.time()
+            status = 'exception'
+            try:
+                response = method(*args, **kwargs)
+                status = _response_status(response)
+                return response
+            finally:
+                self.metrics.record_request(operation, status, time.time() - started)
+        return call
+
+
+def _response_status(response):
+    """The status of a response of the monitor API"""
+    if not (isinstance(response, dict) and response.get('errors')):
+        return 'ok'
+    return 'rate_limited' if is_rate_limited(response) else 'error'
+
+
+def instrument_client(client):
+    """Wraps a monitor client to record its requests if metrics are being collected"""
+    metrics = _ACTIVE_METRICS[0]
+    return client if metrics is None else InstrumentedMonitorClient(client, metrics)
+
+
+def record_sync(report):
+    """Records the monitors of a SyncReport if metrics are being collected"""
+    metrics = _ACTIVE_METRICS[0]
+    if metrics is not None:
+        metrics.record_sync(report)
+
+
+@contextmanager
+def metrics_phase(phase):
+    """Context manager timing its body as a phase of the run if metrics are being collected"""
+    metrics = _ACTIVE_METRICS[0]
+    started = time.time()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.record_phase(phase, time.time() - started)
+
+
+@contextmanager
+def collecting_metrics(path, command):
+    """
+    Context manager collecting the metrics of its body and writing them to a textfile at path, whether the
+    body succeeds or not. Failing to write the textfile is logged rather than raised, so that it neither
+    fails a successful run nor hides the exception of a failed one. Does nothing if path is None.
+    """
+    if path is None:
+        yield None
+        return
+
+    metrics = RunMetrics(command)
+    _ACTIVE_METRICS[0] = metrics
+    success = False
+    try:
+        yield metrics
+        success = True
+    finally:
+        _ACTIVE_METRICS[0] = None
+        metrics.finish(success)
+        try:
+            write_textfile(path, metrics)
+        except (IOError, OSError):
+            logger.exception('Failed to write run metrics to %s', path)
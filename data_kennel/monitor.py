@@ -1,58 +1,255 @@
 """
 Data Kennel class for orchestrating management of Datadog monitors.
 """
+import functools
 import logging
-import json
-import difflib
 import random
 
-from datadog import api, initialize
+from collections import Counter, OrderedDict, deque
 
-from data_kennel.config import MonitorType
-from data_kennel.util import convert_dict_to_tags
+from datadog import initialize
+
+from data_kennel.client import DatadogMonitorClient, HttpMonitorClient, DEFAULT_API_HOST
+from data_kennel.transport import AsyncMonitorClient
+from data_kennel.config import MonitorType, uses_global_client
+from data_kennel.journal import SyncJournal
+from data_kennel.metrics import instrument_client, metrics_phase, record_sync
+from data_kennel.reconciler import ReconcileReport, Reconciler, ResourceAdapter, ResourceIndex, diff_resources
+from data_kennel.tag_query import TagQuery
+from data_kennel.util import convert_dict_to_tags, run_concurrently, run_in_processes, DEFAULT_WORKERS
 
 logger = logging.getLogger(__name__)
 
+# The columns that can be listed, and how to get each one from a monitor
+LIST_COLUMNS = {
+    'Id': lambda monitor: monitor['id'],
+    'Name': lambda monitor: monitor['name'],
+    'Type': lambda monitor: monitor['type'],
+    'State': lambda monitor: monitor['overall_state'],
+    'Tags': lambda monitor: ", ".join(monitor['tags'])
+}
+DEFAULT_LIST_COLUMNS = ['Name', 'State', 'Tags']
+# The only fields of a monitor that garbage collection needs
+GC_FIELDS = ['id', 'name', 'query', 'tags']
+# The only fields of a monitor that listing needs
+LIST_FIELDS = ['id', 'name', 'type', 'overall_state', 'tags']
+# Column widths for printing tables without sizing the columns to their contents first
+LIST_COLUMN_WIDTHS = {
+    'Id': 12,
+    'Name': 80,
+    'Type': 14,
+    'State': 8,
+    'Tags': 120
+}
+# The fields of the monitors written by a sync that verification compares with Datadog, which are the fields
+# monitor search returns
+VERIFY_FIELDS = ['name', 'query', 'type', 'tags']
+# The number of monitors verified by each monitor search request
+VERIFY_BATCH_SIZE = 100
+
+
+class SyncReport(ReconcileReport):
+    """
+    The changes made, or that would be made in a dry run, by syncing monitors.
+    """
+
+    def apply(self, inventory, synced_inventory):
+        """
+        Returns what an inventory of real monitors looks like after this sync.
+
+        inventory           The real monitors before the sync.
+        synced_inventory    The part of the inventory that was synced.
+        """
+        synced = set(id(monitor) for monitor in synced_inventory)
+        touched_ids = set(monitor['id'] for monitor in self.updated + self.unchanged + self.deleted)
+
+        monitors = [monitor for monitor in inventory if id(monitor) not in synced]
+        monitors.extend(monitor for monitor in synced_inventory if monitor['id'] not in touched_ids)
+        return monitors + self.created + self.updated + self.unchanged
+
+
+class DriftReport(object):
+    """
+    The monitors written by a sync that don't match what Datadog has.
+    """
+
+    def __init__(self):
+        self.verified = []
+        self.missing = []
+        # Pairs of a written monitor and a dictionary of each differing field to its written and real value
+        self.drifted = []
+
+    def has_drift(self):
+        """Whether any written monitor is missing or differs in Datadog"""
+        return bool(self.missing or self.drifted)
+
+    def describe(self):
+        """Returns a line describing each missing or drifted monitor"""
+        lines = ['Missing monitor: {0}'.format(monitor['name']) for monitor in self.missing]
+        for monitor, fields in self.drifted:
+            lines.extend(
+                'Drifted monitor: {0}: {1} is {2!r}, expected {3!r}'.format(monitor['name'], field, real,
+                                                                            written)
+                for field, (written, real) in sorted(fields.items())
+            )
+        return lines
+
+
+# Monitors are equivalent to real monitors with the same name or the same query
+MONITOR_KEYS = (lambda monitor: monitor.get('name'), lambda monitor: monitor.get('query'))
+
+
+class MonitorIndex(ResourceIndex):
+    """
+    Real monitors indexed by name and by query, see ResourceIndex.
+    """
+
+    def __init__(self, monitors):
+        super(MonitorIndex, self).__init__(monitors, MONITOR_KEYS)
+
+
+def merge_monitor(base_monitor, new_monitor):
+    """
+    Merges two monitors, the base monitor updated with the new monitor's configuration.
+    """
+    monitor = base_monitor.copy()
+    monitor.update(new_monitor)
+
+    base_options = base_monitor.get('options', {}).copy()
+    base_options.update(new_monitor.get('options', {}))
+    monitor['options'] = base_options
+
+    return monitor
+
+
+def diff_monitors(monitor1, monitor1_name, monitor2, monitor2_name):
+    """
+    Performs a diff of two monitors, returning the diff as a string.
+    """
+    return diff_resources(monitor1, monitor1_name, monitor2, monitor2_name)
+
+
+def compare_monitors(pair):
+    """
+    Compares a configured monitor with its real equivalent the way an update does. Defined at the top level
+    so that Monitor.diff can run it in a process pool.
+
+    pair    A (configured monitor, real monitor, unified) tuple.
+
+    Returns the fields an update would change, and their unified diff if unified is true, or None.
+    """
+    configured_monitor, real_monitor, unified = pair
+    merged_monitor = merge_monitor(real_monitor, configured_monitor)
+    fields = sorted(
+        field for field in set(merged_monitor) | set(real_monitor)
+        if merged_monitor.get(field) != real_monitor.get(field)
+    )
+    monitor_diff = None
+    if fields and unified:
+        monitor_diff = diff_monitors(real_monitor, "Existing Monitor", merged_monitor, "New Monitor")
+    return fields, monitor_diff
+
+
+def get_changed_monitors(pairs, unified=False, processes=None):
+    """
+    Compares matched monitors with compare_monitors in a pool of processes, see Monitor.diff.
+
+    pairs       (configured monitor, real monitor) tuples.
+    unified     If True, changed monitors include a unified diff of the existing and the new monitor.
+    processes   The number of processes comparing monitors. Defaults to the number of CPUs.
+
+    Returns a dictionary for each real monitor that an update would change, as Monitor.diff returns them.
+    """
+    comparisons = run_in_processes(compare_monitors, [pair + (unified,) for pair in pairs], processes)
+    changed_monitors = []
+    for (_, real_monitor), (fields, monitor_diff) in zip(pairs, comparisons):
+        if fields:
+            difference = {'status': 'changed', 'name': real_monitor['name'], 'id': real_monitor['id'],
+                          'fields': fields}
+            if unified:
+                difference['diff'] = monitor_diff
+            changed_monitors.append(difference)
+    return changed_monitors
+
+
+class MonitorAdapter(ResourceAdapter):
+    """
+    Adapts monitors and a monitor client to the Reconciler.
+    """
+
+    kind = 'monitor'
+    keys = MONITOR_KEYS
+
+    def __init__(self, client):
+        self.client = client
+
+    def merge(self, real, configured):
+        return merge_monitor(real, configured)
+
+    def diff(self, real, merged):
+        return diff_monitors(real, "Existing Monitor", merged, "New Monitor")
+
+    def placeholder(self, resource):
+        # Composite monitors are built from the ids of their sub-monitors, so monitors that a dry run would
+        # create get a fake id.
+        resource['id'] = ''.join(random.choice('ABCDEF1234567890') for _ in range(12))
+        return resource
+
+    def create(self, resource):
+        return self.client.create(**resource)
+
+    def update(self, resource):
+        return self.client.update(**resource)
+
+    def delete(self, resource):
+        return self.client.delete(resource['id'])
+
 
 class Monitor(object):
     """
     Class for orchestrating management of Datadog monitors.
     """
 
-    def __init__(self, config=None):
-        self.real_monitors = {}
+    def __init__(self, config=None, client=None):
+        # The SyncReport of the last sync
+        self.report = SyncReport()
         self.config = config
-
-        initialize(
-            api_key=self.config.api_key,
-            app_key=self.config.app_key
-        )
-
-    def list(self, tags=None):
+        self.client = client
+
+        # Without a client of its own, the datadog package's global client is used
+        if self.client is None:
+            initialize(
+                api_key=self.config.api_key,
+                app_key=self.config.app_key
+            )
+            self.client = DatadogMonitorClient()
+        # Requests are recorded in the run metrics, when they are being collected
+        self.client = instrument_client(self.client)
+        # Independent requests, like those of several teams, are sent concurrently through the transport
+        self.transport = AsyncMonitorClient(self.client)
+
+    def list(self, tags=None, columns=None, name=None, states=None, monitor_types=None, inventory=None):
         """
-        Returns a list of dictionarys that forms a human-readable table of monitors created by Data Kennel,
-        with optional tags for filtering.
+        Yields dictionaries that form a human-readable table of monitors created by Data Kennel, with
+        optional filtering.
+
+        tags            A dictionary of tags, or a TagQuery, to filter monitors by.
+        columns         The columns to include in each row, from LIST_COLUMNS. Defaults to
+                        DEFAULT_LIST_COLUMNS.
+        name            A substring of the monitor names to filter by.
+        states          A list of overall states to filter monitors by.
+        monitor_types   A list of monitor types to filter monitors by.
+        inventory       If set, these already fetched monitors are listed instead of fetching monitors.
         """
-        monitors = self.get_monitors(tags)
-        printable_monitors = []
+        columns = columns or DEFAULT_LIST_COLUMNS
+        monitors = self.get_monitors(tags, name=name, states=states, monitor_types=monitor_types,
+                                     fields=LIST_FIELDS, inventory=inventory)
 
         for monitor in monitors:
             if self._is_principal_monitor(monitor):
-                name = monitor['name']
-                tags = ", ".join(monitor['tags'])
-                state = monitor['overall_state']
-
-                printable_monitors.append(
-                    {
-                        "Name": name,
-                        "State": state,
-                        "Tags": tags
-                    }
-                )
+                yield {column: LIST_COLUMNS[column](monitor) for column in columns}
 
-        return printable_monitors
-
-    def update(self, dry_run=False, tags=None):
+    def update(self, dry_run=False, tags=None, journal=None):
         """
         Orchestrates creation and updating of monitors. If a configured monitor already exists, it is updated
         in place. If it doesn't exist, then it is created. If an existing monitor has no counterpart in the
@@ -60,22 +257,56 @@ class Monitor(object):
 
         dry_run If True, no changes are written to Datadog.
         tags    A dictionary of tags to filter monitors by.
+        journal A SyncJournal to record the operations in, and to resume from.
         """
         logger.info('Updating monitors')
 
         if dry_run:
             logger.info('--dry-run active, no changes will be made')
 
-        configured_monitors = self.config.get_monitors(tags)
-        self.real_monitors = self.get_monitors(tags)
+        with metrics_phase('interpolate'):
+            configured_monitors = self.config.get_monitors(tags)
+        with metrics_phase('fetch'):
+            real_monitors = self.get_monitors(tags)
+        with metrics_phase('sync'):
+            report = self.sync(configured_monitors, real_monitors, dry_run=dry_run, journal=journal)
+        record_sync(report)
+        return report
+
+    def sync(self, configured_monitors, real_monitors, dry_run=False, keep=None, journal=None):
+        """
+        Reconciles real monitors with configured monitors. Configured monitors with an equivalent real
+        monitor update it, the others are created. Real monitors without a configured equivalent are deleted.
+
+        configured_monitors The monitors to sync, in the format of Config.get_monitors.
+        real_monitors       The existing monitors that the configured monitors are matched against.
+        dry_run             If True, no changes are written to Datadog.
+        keep                Names of real monitors that shouldn't be deleted even without a configured
+                            equivalent.
+        journal             A SyncJournal to record each operation in as it completes. Monitors whose sync
+                            the journal already records aren't synced again. Ignored in dry runs.
+
+        Returns a SyncReport of the changes.
+
+        Every sync has a reconciler of its own, so that concurrent syncs of one Monitor, such as the dry runs
+        of the plans of the serve command, don't disturb each other.
+        """
+        journal = None if dry_run else journal
+        reconciler = Reconciler(MonitorAdapter(self.client), real_monitors, dry_run=dry_run,
+                                report=SyncReport(), listener=functools.partial(self._record_change, journal))
+        # Sub-monitors already synced, by name. Shared sub-monitors are referenced by several composite
+        # monitors but must only be created or updated once.
+        synced_sub_monitors = {}
 
         for configured_monitor in configured_monitors:
             # process sub monitors if the monitor is a composite monitor
             sub_monitors = self.config.get_sub_monitor(configured_monitor)
             sub_monitor_ids = []
             for sub_monitor in sub_monitors:
-                monitor = self._create_or_update_monitor(sub_monitor, dry_run)
-                sub_monitor_ids.append(monitor['id'])
+                if sub_monitor['name'] not in synced_sub_monitors:
+                    synced_sub_monitors[sub_monitor['name']] = self._create_or_update_monitor(
+                        sub_monitor, reconciler, journal)
+                sub_monitor_ids.append(synced_sub_monitors[sub_monitor['name']]['id'])
 
             if sub_monitor_ids:
                 # The monitor is a composite monitor. Build the query using the sub_monitor ids
@@ -83,21 +314,139 @@ class Monitor(object):
                 configured_monitor['type'] = 'composite'
 
             # Process the principal monitor
-            self._create_or_update_monitor(configured_monitor, dry_run)
+            self._create_or_update_monitor(configured_monitor, reconciler, journal)
 
         # For all of the real monitors that didn't have a configured equivalent, delete them.
-        for monitor in self.real_monitors:
-            logger.info('Deleting monitor: %s', monitor['name'])
+        for change in reconciler.plan_deletions(keep):
+            reconciler.apply(change)
 
-            if not dry_run:
-                api.Monitor.delete(monitor['id'])
+        if journal:
+            journal.complete()
+        self.report = reconciler.report
+        return self.report
+
+    def diff(self, tags=None, unified=False, processes=None):
+        """
+        Compares the configured monitors with the real monitors without changing anything. Monitors are
+        matched like update matches them, and the comparison and rendering of matched monitors is spread
+        over a pool of processes.
+
+        tags        A dictionary of tags to filter monitors by.
+        unified     If True, changed monitors include a unified diff of the existing and the new monitor.
+        processes   The number of processes comparing monitors. Defaults to the number of CPUs.
+
+        Returns a list of a dictionary for each monitor that differs, with its 'status', one of 'missing'
+        from Datadog, 'extra' in Datadog or 'changed', its 'name', its 'id' in Datadog if any, and the
+        'fields' an update would write.
+        """
+        real_monitors = MonitorIndex(self.get_monitors(tags))
+        differences = []
+        pairs = []
+
+        def match(configured_monitor):
+            """Matches a configured monitor with its real equivalent, returning the real monitor or None"""
+            real_monitor = real_monitors.find(configured_monitor)
+            if real_monitor is None:
+                differences.append({'status': 'missing', 'name': configured_monitor['name'], 'id': None,
+                                    'fields': sorted(configured_monitor)})
+            else:
+                real_monitors.remove(real_monitor)
+                pairs.append((configured_monitor, real_monitor))
+            return real_monitor
+
+        # Sub-monitors already matched, by name, to their id or, for missing ones, their name
+        matched_sub_monitors = {}
+        for configured_monitor in self.config.get_monitors(tags):
+            sub_monitor_ids = []
+            for sub_monitor in self.config.get_sub_monitor(configured_monitor):
+                if sub_monitor['name'] not in matched_sub_monitors:
+                    real_sub_monitor = match(sub_monitor)
+                    matched_sub_monitors[sub_monitor['name']] = (
+                        real_sub_monitor['id'] if real_sub_monitor else sub_monitor['name']
+                    )
+                sub_monitor_ids.append(matched_sub_monitors[sub_monitor['name']])
+
+            if sub_monitor_ids:
+                configured_monitor['query'] = ' && '.join([str(mon_id) for mon_id in sub_monitor_ids])
+                configured_monitor['type'] = 'composite'
+            match(configured_monitor)
+
+        differences.extend(get_changed_monitors(pairs, unified=unified, processes=processes))
+        differences.extend(
+            {'status': 'extra', 'name': monitor['name'], 'id': monitor['id'], 'fields': []}
+            for monitor in real_monitors
+        )
+        return differences
+
+    def verify(self, report=None, batch_size=VERIFY_BATCH_SIZE):
+        """
+        Verifies that the monitors a sync created or updated are in Datadog as they were written, without
+        fetching every monitor again. Only the written monitors are fetched, batch_size of them per monitor
+        search request, and their VERIFY_FIELDS are compared.
+
+        report      The SyncReport of the sync to verify. Defaults to the last sync of this Monitor.
+        batch_size  The number of monitors fetched by each request.
+
+        Returns a DriftReport.
+        """
+        report = report or self.report
+        written = report.created + report.updated
+        drift = DriftReport()
+        if not written:
+            return drift
+
+        logger.info('Verifying %s written monitors', len(written))
+        ids = ['id:{0}'.format(monitor['id']) for monitor in written]
+        requests = [
+            self.transport.search(query=' OR '.join(ids[start:start + batch_size]), per_page=batch_size)
+            for start in range(0, len(ids), batch_size)
+        ]
+
+        real_monitors = {}
+        for response in self.transport.gather(requests):
+            if response.get('errors'):
+                raise Exception('Failed to verify monitors: {0}'.format(', '.join(response['errors'])))
+            real_monitors.update((str(monitor['id']), monitor) for monitor in response.get('monitors', []))
+
+        for monitor in written:
+            real_monitor = real_monitors.get(str(monitor['id']))
+            if real_monitor is None:
+                drift.missing.append(monitor)
+                continue
+
+            fields = self._compare_fields(monitor, real_monitor)
+            if fields:
+                drift.drifted.append((monitor, fields))
+            else:
+                drift.verified.append(monitor)
+        return drift
+
+    def _compare_fields(self, written_monitor, real_monitor):
+        """
+        Convenience method for comparing the VERIFY_FIELDS of a written monitor with the real monitor. Tags
+        are compared regardless of their order, and queries regardless of their whitespace.
+        :return: A dictionary of each differing field to its written and real value
+        """
+        def normalize(field, value):
+            """Normalizes a field of a monitor for comparison"""
+            if field == 'tags':
+                return sorted(value or [])
+            if field == 'query':
+                return ' '.join((value or '').split())
+            return value
+
+        return {
+            field: (written_monitor.get(field), real_monitor.get(field))
+            for field in VERIFY_FIELDS
+            if normalize(field, written_monitor.get(field)) != normalize(field, real_monitor.get(field))
+        }
 
     def delete(self, dry_run=False, tags=None):
         """
         Deletes monitors.
 
         dry_run If True, no changes are written to Datadog.
-        tags    A dictionary of tags to filter monitors by.
+        tags    A dictionary of tags, or a TagQuery, to filter monitors by.
         """
         logger.info('Deleting monitors')
 
@@ -105,6 +454,8 @@ class Monitor(object):
             logger.info('--dry-run active, no changes will be made')
 
         monitors = self.get_monitors(tags)
+        # The number of composite monitors referencing each sub-monitor, only needed for shared sub-monitors
+        references = None
 
         for monitor in monitors:
             if self._is_principal_monitor(monitor):
@@ -112,127 +463,167 @@ class Monitor(object):
                 logger.info('Deleting monitor: %s', monitor['name'])
                 # Try getting any sub_monitors associated to the principal monitor
                 sub_monitors = self._get_sub_monitors(monitor)
+                if any(self._is_shared_sub_monitor(sub_monitor) for sub_monitor in sub_monitors):
+                    if references is None:
+                        # Count references across the whole inventory, not just the monitors being deleted
+                        all_monitors = self.get_monitors(fields=GC_FIELDS) if tags else monitors
+                        references = self._get_sub_monitor_references(all_monitors)
+                    sub_monitors = self._release_sub_monitors(sub_monitors, references)
                 if sub_monitors:
                     logger.info('Deleting sub-monitors: %s', [sub_monitor['name'] for sub_monitor in
                                                               sub_monitors])
                 if not dry_run:
                     # delete the principal monitor and  any associated sub_monitors
-                    api.Monitor.delete(monitor['id'])
+                    self.client.delete(monitor['id'])
                     for sub_monitor_id in [sub_monitor['id'] for sub_monitor in sub_monitors]:
-                        api.Monitor.delete(sub_monitor_id)
+                        self.client.delete(sub_monitor_id)
 
-    def get_monitors(self, tags=None):
+    def gc(self, dry_run=False, workers=DEFAULT_WORKERS):  # pylint: disable=invalid-name
         """
-        Gets all existing Datadog monitors, with some convenient filtering.
+        Deletes orphaned sub-monitors, the sub-monitors that no composite monitor references anymore. These
+        are left behind when the query of a composite monitor changes shape or a delete is interrupted.
 
-        tags    A dictionary of tags to filter monitors by.
+        dry_run If True, no changes are written to Datadog.
+        workers The number of sub-monitors to delete concurrently.
+
+        Returns the orphaned sub-monitors.
         """
-        monitors = []
-        # get monitors for each team that we have a config file for
-        for team in self.config.teams:
-            default_tags = {'source': 'data_kennel', 'team': team}
-            default_tags.update(tags or {})
-            monitor_tags = convert_dict_to_tags(default_tags)
+        logger.info('Collecting orphaned sub-monitors')
 
-            monitors.extend(api.Monitor.get_all(monitor_tags=monitor_tags))
+        if dry_run:
+            logger.info('--dry-run active, no changes will be made')
 
-        # Annoyingly, the Datadog API treats monitor tags as ORs instead of ANDs, so we need to do some of our
-        # own filtering to achieve that behavior.
-        # only do the filtering with the actual tags that the user used (exclude the auto team tag
-        # since there can be multiple teams)
-        user_tags = convert_dict_to_tags(tags or {})
-        return [
+        monitors = self.get_monitors(fields=GC_FIELDS)
+        references = self._get_sub_monitor_references(monitors)
+        orphans = [
             monitor for monitor in monitors
-            if all(tag in monitor.get('tags', []) for tag in user_tags)
+            if not self._is_principal_monitor(monitor) and str(monitor['id']) not in references
         ]
 
-    def _compare_monitor(self, monitor1, monitor2):
-        """
-        Convenience method for comparing two monitors.
+        for orphan in orphans:
+            logger.info('Deleting orphaned sub-monitor: %s', orphan['name'])
 
-        If two monitors have the same name or query, they are considered to be equivalent.
-        """
-        return monitor1['name'] == monitor2['name'] or monitor1['query'] == monitor2['query']
+        if not dry_run:
+            run_concurrently(self._delete_monitor, orphans, workers)
+
+        return orphans
 
-    def _merge_monitor(self, base_monitor, new_monitor):
+    def get_monitors(self, tags=None, name=None, states=None, monitor_types=None, fields=None,
+                     inventory=None):
         """
-        Convenience method for merging two monitors.
+        Gets all existing Datadog monitors, with some convenient filtering.
 
-        The base monitor is updated with the new monitor's configuration.
+        tags            A dictionary of tags, or a TagQuery, to filter monitors by.
+        name            A substring of the monitor names to filter by. Filtered by the Datadog API.
+        states          A list of overall states (e.g. 'Alert', 'OK') to filter monitors by.
+        monitor_types   A list of monitor types (e.g. 'metric alert', 'composite') to filter monitors by.
+        fields          If set, only these fields of each monitor are kept.
+        inventory       If set, these already fetched monitors are filtered instead of fetching monitors.
         """
-        monitor = base_monitor.copy()
-        monitor.update(new_monitor)
+        if inventory is not None:
+            return list(self._filter_monitors(inventory, tags, name, states, monitor_types, fields))
 
-        base_options = base_monitor.get('options', {}).copy()
-        base_options.update(new_monitor.get('options', {}))
-        monitor['options'] = base_options
+        params = {}
+        if name:
+            params['name'] = name
 
-        return monitor
+        def request_team(team):
+            """Requests the monitors of a team"""
+            default_tags = {'source': 'data_kennel', 'team': team}
+            if not isinstance(tags, TagQuery):
+                default_tags.update(tags or {})
+            monitor_tags = convert_dict_to_tags(default_tags)
+            return self.transport.get_all(monitor_tags=monitor_tags, **params)
+
+        # get monitors for each team that we have a config file for. No more teams are requested at a time
+        # than the transport sends at once, and each team's full response is released as soon as its
+        # monitors are filtered and projected, so that only the full responses of that many teams, and of the
+        # team being projected, are held at a time.
+        teams = deque(self.config.teams)
+        ahead = min(self.transport.workers, len(teams))
+        requests = deque(request_team(teams.popleft()) for _ in range(ahead))
+        monitors = []
+        while requests:
+            response = requests.popleft().result()
+            if teams:
+                requests.append(request_team(teams.popleft()))
+            monitors.extend(self._filter_monitors(response, tags, name, states, monitor_types, fields))
+            response = None
+
+        return monitors
 
-    def _diff_monitors(self, monitor1, monitor1_name, monitor2, monitor2_name):
+    def _filter_monitors(self, monitors, tags=None, name=None, states=None, monitor_types=None, fields=None):
         """
-        Convenience method for performing a diff of two monitors, returning the diff as a string.
+        Convenience method for filtering and projecting monitors, see get_monitors for the parameters.
         """
-        return "\n".join(difflib.unified_diff(
-            json.dumps(monitor1, indent=4, sort_keys=True).splitlines(),
-            json.dumps(monitor2, indent=4, sort_keys=True).splitlines(),
-            fromfile=monitor1_name,
-            tofile=monitor2_name
-        ))
+        # Annoyingly, the Datadog API treats monitor tags as ORs instead of ANDs, so we need to do some of our
+        # own filtering to achieve that behavior.
+        # only do the filtering with the actual tags that the user used (exclude the auto team tag
+        # since there can be multiple teams)
+        if tags:
+            tag_query = tags if isinstance(tags, TagQuery) else TagQuery.from_tags(convert_dict_to_tags(tags))
+            monitors = tag_query.filter(monitors)
+        states = set(state.lower() for state in states or [])
+        monitor_types = set(monitor_type.lower() for monitor_type in monitor_types or [])
 
-    def _create_or_update_monitor(self, configured_monitor, dry_run=False):
+        for monitor in monitors:
+            if name and name.lower() not in monitor.get('name', '').lower():
+                continue
+            if states and monitor.get('overall_state', '').lower() not in states:
+                continue
+            if monitor_types and monitor.get('type', '').lower() not in monitor_types:
+                continue
+
+            if fields:
+                monitor = {field: monitor[field] for field in fields if field in monitor}
+            yield monitor
+
+    def _create_or_update_monitor(self, configured_monitor, reconciler, journal=None):
         """
-        Function to create or update a monitor
+        Function to create or update a monitor, through the reconciler of a sync
         :param configured_monitor: The monitor to create or update
-        :param dry_run: If True, no changes are written to Datadog.
+        :param reconciler: The Reconciler of the sync
+        :param journal: The SyncJournal of the sync, if any
         :return: the created or updated monitor
         """
-        real_monitor = next(
-            (monitor for monitor in self.real_monitors if self._compare_monitor(monitor, configured_monitor)),
-            None
-        )
+        entry = journal.lookup(configured_monitor) if journal else None
+        if entry:
+            return self._resume_monitor(configured_monitor, entry, reconciler)
 
-        # If we found an equivalent real_monitor, we prepare to update it. Otherwise, we'll make a new
-        # monitor.
-        if real_monitor:
-            # Its important to play the configured monitor over the real monitor because the config should
-            # be considered the source of truth.
-            merged_monitor = self._merge_monitor(real_monitor, configured_monitor)
-            # The idea is to eventually make real_monitors the list of all real monitors that don't have
-            # equivalents in the config.
-            self.real_monitors.remove(real_monitor)
-
-            if merged_monitor != real_monitor:
-                logger.info('Updating monitor: %s', merged_monitor['name'])
-
-                monitor_diff = self._diff_monitors(
-                    real_monitor,
-                    "Existing Monitor",
-                    merged_monitor,
-                    "New Monitor"
-                )
-
-                logger.debug('Differences between monitors:\n%s', monitor_diff)
-
-                if not dry_run:
-                    return api.Monitor.update(**merged_monitor)
-
-                return merged_monitor
-            else:
-                logger.info('No updates needed for %s', real_monitor['name'])
-                return real_monitor
+        return reconciler.apply(reconciler.plan(configured_monitor))
 
-        else:
-            logger.info('Creating monitor: %s', configured_monitor['name'])
+    def _resume_monitor(self, configured_monitor, entry, reconciler):
+        """
+        Takes the sync of a configured monitor from the journal of an interrupted sync instead of syncing it
+        :param configured_monitor: The monitor to sync
+        :param entry: The journal entry of the monitor
+        :param reconciler: The Reconciler of the sync
+        :return: the monitor the journaled operation resulted in
+        """
+        logger.info('Already %s according to the journal: %s', entry['op'], configured_monitor['name'])
+        real_monitor = reconciler.index.find(configured_monitor)
+        if real_monitor:
+            reconciler.index.remove(real_monitor)
 
-            if not dry_run:
-                return api.Monitor.create(**configured_monitor)
+        getattr(reconciler.report, entry['op']).append(entry['monitor'])
+        return entry['monitor']
 
-            # If we are making fake monitors for a composite monitor, then we need to insert a fake id for
-            # the monitor to have.
-            fake_id = ''.join(random.choice('ABCDEF1234567890') for _ in range(12))
-            configured_monitor["id"] = fake_id
-            return configured_monitor
+    def _record_change(self, journal, change, monitor):
+        """
+        Records a change written by the reconciler of a sync in its journal, if any. Writes that Datadog
+        answered with errors, rather than the monitor, aren't recorded, so that a resumed sync retries them.
+        :param journal: The SyncJournal of the sync, or None
+        :param change: The Change
+        :param monitor: The monitor the change resulted in
+        """
+        if not journal:
+            return
+        if 'errors' in monitor or (change.action == 'created' and 'id' not in monitor):
+            logger.error('Not journaling monitor %s, which Datadog failed to write: %s',
+                         change.resource['name'], monitor.get('errors'))
+            return
+        journal.record(change.action, change.configured if change.configured is not None else change.real,
+                       monitor)
 
     def _is_principal_monitor(self, monitor):
         """
@@ -253,6 +644,56 @@ class Monitor(object):
         """
         return ' && ' in monitor.get('query', '')
 
+    def _get_sub_monitor_references(self, monitors):
+        """
+        Convenience method for building the reference graph between composite monitors and sub-monitors
+        :param monitors: The monitors
+        :return: A Counter of sub-monitor id, as a string, to the number of composite monitors referencing it
+        """
+        references = Counter()
+        for monitor in monitors:
+            if self._is_principal_monitor(monitor) and self._is_composite_monitor(monitor):
+                references.update(sub_monitor_id.strip() for sub_monitor_id in monitor['query'].split('&&'))
+        return references
+
+    def _is_shared_sub_monitor(self, monitor):
+        """
+        Convenience method for testing if the monitor is a sub-monitor shared between composite monitors
+        :param monitor: The monitor
+        :return: True if the monitor is a shared sub-monitor
+        """
+        return 'dk_shared:true' in monitor.get('tags', [])
+
+    def _release_sub_monitors(self, sub_monitors, references):
+        """
+        Convenience method for releasing a composite monitor's references to its sub-monitors
+        :param sub_monitors: The sub-monitors of a composite monitor that is being deleted
+        :param references: A Counter of sub-monitor id to the number of composite monitors referencing it,
+                           which is updated
+        :return: The sub-monitors that no composite monitor references anymore
+        """
+        released_sub_monitors = []
+        for sub_monitor in sub_monitors:
+            sub_monitor_id = str(sub_monitor['id'])
+            references[sub_monitor_id] -= 1
+            if not self._is_shared_sub_monitor(sub_monitor) or references[sub_monitor_id] <= 0:
+                released_sub_monitors.append(sub_monitor)
+            else:
+                logger.info('Keeping shared sub-monitor %s, still referenced by %s composite monitors',
+                            sub_monitor['name'], references[sub_monitor_id])
+        return released_sub_monitors
+
+    def _delete_monitor(self, monitor):
+        """
+        Convenience method for deleting a monitor, logging rather than raising any error Datadog returns
+        :param monitor: The monitor to delete
+        :return: The response from Datadog
+        """
+        response = self.client.delete(monitor['id'])
+        if isinstance(response, dict) and response.get('errors'):
+            logger.error('Failed to delete monitor %s: %s', monitor['name'], ', '.join(response['errors']))
+        return response
+
     def _get_sub_monitors(self, monitor):
         """
         Convenience method for getting the sub-monitor associated to the monitor if the specified monitor
@@ -261,7 +702,49 @@ class Monitor(object):
         :return: A list containing the sub-monitors associted to the specified monitor
         """
         sub_monitor_ids = monitor['query'].split('&&') if self._is_composite_monitor(monitor) else []
-        sub_monitors = []
-        for sub_monitor_id in sub_monitor_ids:
-            sub_monitors.append(api.Monitor.get(sub_monitor_id))
-        return sub_monitors
+        requests = [self.transport.get(sub_monitor_id) for sub_monitor_id in sub_monitor_ids]
+        return self.transport.gather(requests)
+
+
+def create_org_monitor(config, org):
+    """
+    Creates a Monitor for the teams of one org of the config. The default org uses the datadog package's
+    global client as always, and every other org a client of its own, see config.uses_global_client.
+    """
+    org_config = config.for_org(org)
+    if uses_global_client(org):
+        return Monitor(org_config)
+
+    client = HttpMonitorClient(org_config.api_key, org_config.app_key,
+                               org_config.api_host or DEFAULT_API_HOST)
+    return Monitor(org_config, client=client)
+
+
+def update_orgs(config, dry_run=False, tags=None, workers=DEFAULT_WORKERS, journal_path=None, resume=False):
+    """
+    Updates the monitors of every org of the config concurrently. A failure to update one org is logged and
+    doesn't affect the others.
+
+    dry_run         If True, no changes are written to Datadog.
+    tags            A dictionary of tags to filter monitors by.
+    workers         The number of orgs to update concurrently.
+    journal_path    If set, each org journals its operations to this path suffixed with the org.
+    resume          If True, each org resumes from its journal.
+
+    Returns an OrderedDict of each org to its SyncReport, or to the exception its update failed with.
+    """
+    def update_org(org):
+        """Updates the monitors of one org"""
+        try:
+            journal = None
+            if journal_path and not dry_run:
+                journal = SyncJournal('{0}.{1}'.format(journal_path, org), resume=resume)
+            return create_org_monitor(config, org).update(dry_run=dry_run, tags=tags, journal=journal)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.exception('Failed to update monitors of org %s', org)
+            if journal:
+                journal.close()
+            return ex
+
+    orgs = config.orgs
+    return OrderedDict(zip(orgs, run_concurrently(update_org, orgs, workers)))
@@ -0,0 +1,237 @@
+"""
+Profiling support for Data Kennel commands.
+
+A profiler can either observe a whole command (scope 'all') or only the CPU bound phases of a run (scope
+'cpu'). CPU bound phases are marked with the `profile_phase` decorator, so time spent waiting on the Datadog
+API is left out of the profile. Only the thread profiling started in is recorded: phases entered from other
+threads, such as those updating several orgs concurrently, run unprofiled.
+"""
+from __future__ import print_function
+
+import abc
+import cProfile
+import functools
+import logging
+import pstats
+import signal
+import sys
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_MODES = ('deterministic', 'sampling')
+PROFILE_SCOPES = ('all', 'cpu')
+DEFAULT_REPORT_LIMIT = 40
+DEFAULT_SAMPLE_INTERVAL = 0.005
+REPORT_SUFFIX = '.txt'
+
+logger = logging.getLogger(__name__)
+
+# The profiler of the running command, if any. Consulted by `profile_phase`.
+_ACTIVE_PROFILER = [None]
+
+
+class BaseProfiler(object):
+    """
+    Common behaviour of the Data Kennel profilers. Tracks how deeply nested the current call of each thread
+    is within profiled phases, so that the 'cpu' scope only records while the thread profiling started in
+    is inside at least one phase.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, output_path, scope='all', report_limit=DEFAULT_REPORT_LIMIT):
+        if scope not in PROFILE_SCOPES:
+            raise ValueError('Unknown profile scope: {0}'.format(scope))
+
+        self.output_path = output_path
+        self.report_path = output_path + REPORT_SUFFIX
+        self.scope = scope
+        self.report_limit = report_limit
+        self._thread = None
+        self._local = threading.local()
+        self._warned = False
+
+    @property
+    def _phase_depth(self):
+        """How deeply the current call of this thread is nested within phases"""
+        return getattr(self._local, 'depth', 0)
+
+    def start(self):
+        """Starts profiling. With the 'cpu' scope, nothing is recorded until a phase is entered."""
+        self._thread = threading.current_thread()
+        if self.scope == 'all':
+            self._enable()
+
+    def stop(self):
+        """Stops profiling and writes the profile and its text report."""
+        if self.scope == 'all' or self._phase_depth:
+            self._disable()
+        self._write()
+
+    def enter_phase(self):
+        """Marks the start of a CPU bound phase"""
+        self._local.depth = self._phase_depth + 1
+        if self.scope == 'cpu' and self._phase_depth == 1 and self._is_profiled_thread():
+            self._enable()
+
+    def exit_phase(self):
+        """Marks the end of a CPU bound phase"""
+        self._local.depth = self._phase_depth - 1
+        if self.scope == 'cpu' and self._phase_depth == 0 and self._is_profiled_thread():
+            self._disable()
+
+    def _is_profiled_thread(self):
+        """Whether the current thread is the one profiling started in, warning once if it isn't"""
+        if threading.current_thread() is self._thread:
+            return True
+        if not self._warned:
+            self._warned = True
+            logger.warning('Phases of other threads than the one profiling started in are not profiled')
+        return False
+
+    @abc.abstractmethod
+    def _enable(self):
+        """Starts recording"""
+
+    @abc.abstractmethod
+    def _disable(self):
+        """Stops recording"""
+
+    @abc.abstractmethod
+    def _write(self):
+        """Writes the profile and its text report"""
+
+
+class DeterministicProfiler(BaseProfiler):
+    """
+    Profiler built on cProfile. Writes a pstats file to the output path and a report of the top functions
+    by cumulative time next to it.
+    """
+
+    def __init__(self, output_path, scope='all', report_limit=DEFAULT_REPORT_LIMIT):
+        super(DeterministicProfiler, self).__init__(output_path, scope, report_limit)
+        self._profile = cProfile.Profile()
+
+    def _enable(self):
+        self._profile.enable()
+
+    def _disable(self):
+        self._profile.disable()
+
+    def _write(self):
+        self._profile.dump_stats(self.output_path)
+
+        with open(self.report_path, 'w') as report:
+            stats = pstats.Stats(self._profile, stream=report)
+            stats.sort_stats('cumulative').print_stats(self.report_limit)
+
+
+class SamplingProfiler(BaseProfiler):
+    """
+    Low overhead statistical profiler for long runs. Samples the main thread's stack on a CPU time interval
+    timer, so time spent blocked on the network is never sampled. Writes the samples as collapsed stacks
+    (the input format of flame graph tools) to the output path and a report of the top functions next to it.
+    """
+
+    def __init__(self, output_path, scope='all', report_limit=DEFAULT_REPORT_LIMIT,
+                 interval=DEFAULT_SAMPLE_INTERVAL):
+        super(SamplingProfiler, self).__init__(output_path, scope, report_limit)
+        self.interval = interval
+        self.samples = Counter()
+        self._previous_handler = None
+
+    def _enable(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def _disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def _sample(self, _signum, frame):
+        """Signal handler recording the interrupted stack, outermost frame first"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{0}:{1}'.format(code.co_filename, code.co_name))
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+    def _write(self):
+        with open(self.output_path, 'w') as output:
+            for stack, count in self.samples.most_common():
+                output.write('{0} {1}\n'.format(stack, count))
+
+        own_samples = Counter()
+        total_samples = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(';')
+            own_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+
+        sample_count = sum(self.samples.values())
+        with open(self.report_path, 'w') as report:
+            report.write('{0} samples at {1}s intervals\n\n'.format(sample_count, self.interval))
+            for title, counter in (('Own samples', own_samples), ('Total samples', total_samples)):
+                report.write('{0}:\n'.format(title))
+                for frame, count in counter.most_common(self.report_limit):
+                    report.write('{0:>8} {1:>6.1%}  {2}\n'.format(count, float(count) / sample_count, frame))
+                report.write('\n')
+
+
+def create_profiler(output_path, mode='deterministic', scope='all', report_limit=DEFAULT_REPORT_LIMIT):
+    """
+    Creates a profiler for the given mode.
+    :param output_path: Where the profile is written. The text report is written next to it.
+    :param mode: One of PROFILE_MODES
+    :param scope: One of PROFILE_SCOPES
+    :param report_limit: The number of functions to include in the text report
+    """
+    if mode == 'deterministic':
+        return DeterministicProfiler(output_path, scope, report_limit)
+    elif mode == 'sampling':
+        return SamplingProfiler(output_path, scope, report_limit)
+    raise ValueError('Unknown profile mode: {0}'.format(mode))
+
+
+@contextmanager
+def profiling(output_path, mode='deterministic', scope='all', report_limit=DEFAULT_REPORT_LIMIT):
+    """
+    Context manager profiling its body. Does nothing if output_path is None.
+    """
+    if output_path is None:
+        yield None
+        return
+
+    profiler = create_profiler(output_path, mode, scope, report_limit)
+    _ACTIVE_PROFILER[0] = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _ACTIVE_PROFILER[0] = None
+        profiler.stop()
+        print('Profile written to {0}, report written to {1}'.format(
+            profiler.output_path, profiler.report_path), file=sys.stderr)
+
+
+def profile_phase(func):
+    """
+    Decorator marking a CPU bound phase of a run. These phases are what the 'cpu' profile scope records.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """Runs the function inside a profiled phase if a profiler is active"""
+        profiler = _ACTIVE_PROFILER[0]
+        if profiler is None:
+            return func(*args, **kwargs)
+
+        profiler.enter_phase()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.exit_phase()
+
+    return wrapper
@@ -0,0 +1,282 @@
+"""
+A resource agnostic engine reconciling real resources, such as the monitors in Datadog, with configured ones.
+
+Each kind of resource plugs in through a ResourceAdapter, which names the identity keys that make a configured
+resource equivalent to a real one, how a configured resource is merged over its real equivalent, and how
+resources are created, updated and deleted through its API. The Reconciler matches configured resources with
+real ones through a ResourceIndex of those keys rather than scanning every real resource, plans the change
+each one needs, and writes the changes one at a time or concurrently.
+"""
+import abc
+import difflib
+import json
+import logging
+
+from collections import OrderedDict, defaultdict
+
+from data_kennel.profiling import profile_phase
+from data_kennel.util import run_concurrently
+
+logger = logging.getLogger(__name__)
+
+# The changes a reconciliation can make, in the order they are reported
+CHANGES = ('created', 'updated', 'unchanged', 'deleted')
+
+
+def diff_resources(resource1, resource1_name, resource2, resource2_name):
+    """
+    Performs a diff of two resources, returning the diff as a string.
+    """
+    return "\n".join(difflib.unified_diff(
+        json.dumps(resource1, indent=4, sort_keys=True).splitlines(),
+        json.dumps(resource2, indent=4, sort_keys=True).splitlines(),
+        fromfile=resource1_name,
+        tofile=resource2_name
+    ))
+
+
+class ResourceIndex(object):
+    """
+    Real resources indexed by each of their identity keys, so that configured resources can be matched with
+    the real resource they are equivalent to without scanning every real resource. Iterating over the index
+    yields the resources that haven't been removed, in their original order.
+    """
+
+    def __init__(self, resources, keys):
+        """
+        resources   The real resources.
+        keys        Functions returning an identity key of a resource, or None if it has no such key.
+        """
+        self.keys = keys
+        self._resources = OrderedDict(enumerate(resources))
+        self._positions = {}
+        self._by_key = [defaultdict(list) for _ in keys]
+
+        for position, resource in self._resources.items():
+            self._positions[id(resource)] = position
+            for key, by_key in zip(keys, self._by_key):
+                value = key(resource)
+                if value is not None:
+                    by_key[value].append(position)
+
+    def __iter__(self):
+        return iter(list(self._resources.values()))
+
+    def count(self):
+        """The number of resources that haven't been removed"""
+        return len(self._resources)
+
+    def find(self, resource):
+        """
+        Finds the first remaining resource sharing any identity key with the given resource, or None.
+        """
+        candidates = []
+        for key, by_key in zip(self.keys, self._by_key):
+            value = key(resource)
+            if value is not None:
+                candidates.append(self._first_remaining(by_key.get(value, [])))
+        candidates = [position for position in candidates if position is not None]
+        return self._resources[min(candidates)] if candidates else None
+
+    def remove(self, resource):
+        """Removes a resource from the index"""
+        del self._resources[self._positions.pop(id(resource))]
+
+    def _first_remaining(self, positions):
+        """The first of the positions whose resource hasn't been removed, dropping removed ones as it goes"""
+        while positions and positions[0] not in self._resources:
+            positions.pop(0)
+        return positions[0] if positions else None
+
+
+class ReconcileReport(object):
+    """
+    The changes made, or that would be made in a dry run, by reconciling resources.
+    """
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.unchanged = []
+        self.deleted = []
+
+    def summary(self):
+        """Returns the names of the resources in each category of change"""
+        return {change: [resource['name'] for resource in getattr(self, change)] for change in CHANGES}
+
+    def extend(self, report):
+        """Adds the changes of another report, such as the report of another org, to this one"""
+        for change in CHANGES:
+            getattr(self, change).extend(getattr(report, change))
+
+
+class Change(object):
+    """
+    A change planned by a Reconciler.
+
+    action      One of CHANGES.
+    configured  The configured resource, or None for deletions.
+    real        The real equivalent of the configured resource, or None for creations.
+    resource    The resource to write: the configured resource to create, the merged resource to update, or
+                the real resource to delete or leave unchanged.
+    """
+
+    def __init__(self, action, configured, real, resource):
+        self.action = action
+        self.configured = configured
+        self.real = real
+        self.resource = resource
+
+
+class ResourceAdapter(object):
+    """
+    Adapts a kind of resource and its API to the Reconciler. Subclasses set the kind and the identity keys,
+    and implement create, update and delete.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    # The kind of resource, for logging
+    kind = 'resource'
+    # Functions returning an identity key of a resource, see ResourceIndex
+    keys = ()
+    # The verbs logged for each change written
+    verbs = {'created': 'Creating', 'updated': 'Updating', 'deleted': 'Deleting'}
+
+    def name(self, resource):
+        """The name of a resource, for logging"""
+        return resource.get('name')
+
+    def merge(self, real, configured):
+        """Merges a configured resource over its real equivalent, the config being the source of truth"""
+        merged = real.copy()
+        merged.update(configured)
+        return merged
+
+    def differs(self, merged, real):
+        """Whether a merged resource differs from the real resource, so that it needs to be updated"""
+        return merged != real
+
+    def diff(self, real, merged):
+        """Describes the differences between a real resource and the merged resource updating it"""
+        return diff_resources(real, 'Existing {0}'.format(self.kind), merged, 'New {0}'.format(self.kind))
+
+    def placeholder(self, resource):
+        """The resource standing in for a resource that a dry run would create"""
+        return resource
+
+    @abc.abstractmethod
+    def create(self, resource):
+        """Creates a resource, returning the created resource"""
+
+    @abc.abstractmethod
+    def update(self, resource):
+        """Updates a resource, returning the updated resource"""
+
+    @abc.abstractmethod
+    def delete(self, resource):
+        """Deletes a resource"""
+
+
+class Reconciler(object):
+    """
+    Reconciles real resources with configured ones through a ResourceAdapter. Configured resources with a real
+    equivalent update it if they differ, the others are created, and real resources left without a configured
+    equivalent are deleted.
+
+    Changes can be planned and applied one resource at a time, for resources that depend on resources synced
+    before them, or all at once with reconcile, which writes them concurrently.
+    """
+
+    def __init__(self, adapter, real_resources, dry_run=False, report=None, listener=None):
+        """
+        adapter         The ResourceAdapter of the kind of resource.
+        real_resources  The existing resources that configured resources are matched against.
+        dry_run         If True, no changes are written.
+        report          The ReconcileReport to record changes in. Defaults to a new ReconcileReport.
+        listener        If set, called with each Change and its resulting resource as soon as it is written,
+                        from the thread that wrote it.
+        """
+        self.adapter = adapter
+        self.index = ResourceIndex(real_resources, adapter.keys)
+        self.dry_run = dry_run
+        self.report = report if report is not None else ReconcileReport()
+        self.listener = listener
+
+    @profile_phase
+    def plan(self, configured):
+        """
+        Plans the change of a configured resource, matching it with its real equivalent, which is then no
+        longer available to other configured resources.
+        """
+        real = self.index.find(configured)
+        if real is None:
+            return Change('created', configured, None, configured)
+
+        self.index.remove(real)
+        merged = self.adapter.merge(real, configured)
+        if self.adapter.differs(merged, real):
+            return Change('updated', configured, real, merged)
+        return Change('unchanged', configured, real, real)
+
+    def plan_deletions(self, keep=None):
+        """
+        Plans the deletion of the real resources that no configured resource has been matched with.
+
+        keep    Names of real resources that shouldn't be deleted even without a configured equivalent.
+        """
+        return [
+            Change('deleted', None, real, real) for real in self.index
+            if not (keep and self.adapter.name(real) in keep)
+        ]
+
+    def apply(self, change):
+        """Writes a change, unless this is a dry run, and records it. Returns the resulting resource."""
+        result = self._write(change)
+        getattr(self.report, change.action).append(result)
+        return result
+
+    def reconcile(self, configured_resources, keep=None, workers=1):
+        """
+        Plans the changes of every configured resource and the deletions they leave, then writes them with
+        up to workers concurrent writes. Changes are reported in the order they were planned.
+
+        Returns the report.
+        """
+        changes = [self.plan(configured) for configured in configured_resources]
+        changes.extend(self.plan_deletions(keep))
+
+        results = run_concurrently(self._write, changes, workers)
+        for change, result in zip(changes, results):
+            getattr(self.report, change.action).append(result)
+        return self.report
+
+    def _write(self, change):
+        """
+        Convenience method for writing a change, unless this is a dry run
+        :param change: The Change
+        :return: The resulting resource
+        """
+        adapter = self.adapter
+        if change.action == 'unchanged':
+            logger.info('No updates needed for %s %s', adapter.kind, adapter.name(change.real))
+            result = change.real
+        else:
+            logger.info('%s %s: %s', adapter.verbs[change.action], adapter.kind,
+                        adapter.name(change.resource))
+            if change.action == 'updated' and logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Differences between %ss:\n%s', adapter.kind,
+                             adapter.diff(change.real, change.resource))
+
+            if self.dry_run:
+                return adapter.placeholder(change.resource) if change.action == 'created' else change.resource
+            if change.action == 'created':
+                result = adapter.create(change.resource)
+            elif change.action == 'updated':
+                result = adapter.update(change.resource)
+            else:
+                adapter.delete(change.resource)
+                result = change.resource
+
+        if self.listener and not self.dry_run:
+            self.listener(change, result)
+        return result
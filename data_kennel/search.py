@@ -0,0 +1,273 @@
+"""
+Search over the names, queries, messages and tags of every monitor of an org, including monitors not managed
+by Data Kennel, through a local trigram index.
+
+Fetching every monitor of a large org takes a while, so the inventory is cached on disk together with its
+index, and refetched once it is older than a maximum age. The index maps every three characters of the
+lowercased fields of the monitors to the monitors containing them. A search term, or the literal strings a
+regular expression can't match without, is looked up by its trigrams, and only the monitors having all of
+them are matched against the term. Searches are case insensitive and match within one field.
+
+The cache is written with marshal rather than JSON, since loading tens of thousands of monitors from JSON
+takes longer than a search should.
+"""
+import json
+import logging
+import marshal
+import os
+import re
+import sre_constants
+import sre_parse
+import tempfile
+import time
+
+from array import array
+from collections import defaultdict
+
+from data_kennel.monitor import create_org_monitor
+from data_kennel.util import user_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# Changes whenever the format of cached indexes changes, so that older caches are refetched
+INDEX_VERSION = 1
+# The fields of a monitor that are searched, in the order they are reported
+SEARCH_FIELDS = ['name', 'query', 'message', 'tags']
+# The fields of a monitor that are kept in the index
+INDEX_FIELDS = ['id', 'name', 'type', 'query', 'message', 'tags']
+RESULT_COLUMNS = ['Id', 'Name', 'Type', 'Managed', 'Fields']
+MANAGED_TAG = 'source:data_kennel'
+DEFAULT_MAX_AGE = 60 * 60
+
+# Separates the fields of a document, so that no search term matches across fields
+_FIELD_SEPARATOR = u'\x00'
+# Regular expression nodes whose contents every match contains
+_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+
+def default_cache_dir():
+    """The directory inventories are cached in by default, under the user's cache directory"""
+    return user_cache_dir('inventory')
+
+
+def is_managed(monitor):
+    """Whether a monitor is managed by Data Kennel"""
+    return MANAGED_TAG in (monitor.get('tags') or [])
+
+
+def trigrams(text):
+    """
+    The set of every three consecutive characters of text
+
+    >>> sorted(trigrams(u'load'))
+    [u'loa', u'oad']
+    """
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+def required_literals(pattern):
+    """
+    The lowercased literal strings every match of a regular expression contains. Alternatives, optional parts
+    and character classes end a literal, so the literals are a conservative subset of what a match contains.
+
+    >>> required_literals(r'system\\.load\\.(norm|raw)\\.\\d+ > 0\\.[5-9]')
+    [u'system.load.', u'.', u' > 0.']
+    >>> required_literals(r'cpu|memory')
+    []
+    """
+    return [literal.lower() for literal in _literals(sre_parse.parse(pattern))]
+
+
+def _literals(parsed):
+    """The literal strings of a parsed regular expression that every match contains"""
+    literals = []
+    characters = []
+    for operator, argument in parsed:
+        if operator == sre_constants.LITERAL:
+            characters.append(unichr(argument))
+            continue
+
+        if characters:
+            literals.append(u''.join(characters))
+            characters = []
+        if operator == sre_constants.SUBPATTERN:
+            literals.extend(_literals(argument[-1]))
+        elif operator in _REPEATS and argument[0] >= 1:
+            literals.extend(_literals(argument[2]))
+    if characters:
+        literals.append(u''.join(characters))
+    return literals
+
+
+def _document(monitor):
+    """The lowercased searched fields of a monitor, separated by _FIELD_SEPARATOR"""
+    fields = []
+    for field in SEARCH_FIELDS:
+        value = monitor.get(field) or u''
+        if isinstance(value, list):
+            value = u'\n'.join(value)
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        fields.append(value.replace(_FIELD_SEPARATOR, u' ').lower())
+    return _FIELD_SEPARATOR.join(fields)
+
+
+class SearchIndex(object):
+    """
+    A trigram index of monitors. Monitors and their documents are kept encoded, and only decoded for the
+    monitors a search matches, so that loading a cached index doesn't decode every monitor.
+    """
+
+    def __init__(self, monitors=(), fetched=None):
+        """
+        monitors    The monitors to index, as returned by the monitor API.
+        fetched     When the monitors were fetched, as a POSIX timestamp. Defaults to now.
+        """
+        self.fetched = fetched if fetched is not None else time.time()
+        self._monitors = []
+        self._documents = []
+        positions = defaultdict(list)
+
+        for position, monitor in enumerate(monitors):
+            document = _document(monitor)
+            self._monitors.append(json.dumps({field: monitor.get(field) for field in INDEX_FIELDS}))
+            self._documents.append(document.encode('utf-8'))
+            for trigram in trigrams(document):
+                positions[trigram].append(position)
+
+        # Positions are packed into bytes, which marshal much faster than lists of integers
+        self._postings = {trigram: array('I', trigram_positions).tostring()
+                          for trigram, trigram_positions in positions.items()}
+
+    def count(self):
+        """The number of indexed monitors"""
+        return len(self._monitors)
+
+    @classmethod
+    def load(cls, path):
+        """Loads an index saved with save, or returns None if there is none or it can't be read"""
+        try:
+            with open(path, 'rb') as index_file:
+                saved = marshal.load(index_file)
+            if saved.get('version') != INDEX_VERSION:
+                return None
+        except (IOError, EOFError, ValueError, TypeError, AttributeError):
+            return None
+
+        index = cls.__new__(cls)
+        index.fetched = saved['fetched']
+        index._monitors = saved['monitors']
+        index._documents = saved['documents']
+        index._postings = saved['postings']
+        return index
+
+    def save(self, path):
+        """Saves the index to a file, atomically"""
+        directory = os.path.dirname(path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.data_kennel',
+                                                      suffix='.index.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as index_file:
+                marshal.dump({'version': INDEX_VERSION, 'fetched': self.fetched, 'monitors': self._monitors,
+                              'documents': self._documents, 'postings': self._postings}, index_file)
+            os.rename(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+    def search(self, term, regex=False):
+        """
+        Yields a row of RESULT_COLUMNS for every monitor with a field containing term, or matching it as a
+        regular expression if regex is set, in the order the monitors were indexed.
+        """
+        text = term.decode('utf-8') if isinstance(term, str) else term
+        if regex:
+            try:
+                match = re.compile(text, re.IGNORECASE | re.UNICODE).search
+            except re.error as ex:
+                raise ValueError('Invalid regular expression {0!r}: {1}'.format(term, ex))
+            literals = required_literals(text)
+        else:
+            literals = [text.lower()]
+
+            def match(value):
+                """Whether a lowercased field contains the term"""
+                return literals[0] in value
+
+        for position in self._candidates(literals):
+            fields = self._documents[position].decode('utf-8').split(_FIELD_SEPARATOR)
+            matched = [field for field, value in zip(SEARCH_FIELDS, fields) if match(value)]
+            if matched:
+                monitor = json.loads(self._monitors[position])
+                yield {
+                    'Id': monitor['id'],
+                    'Name': monitor['name'],
+                    'Type': monitor['type'],
+                    'Managed': 'yes' if is_managed(monitor) else 'no',
+                    'Fields': ', '.join(matched)
+                }
+
+    def _candidates(self, literals):
+        """The sorted positions of the monitors having every trigram of the literals"""
+        needed = set()
+        for literal in literals:
+            needed.update(trigrams(literal))
+        if not needed:
+            return range(len(self._monitors))
+
+        # Intersecting from the rarest trigram keeps the intermediate sets small
+        postings = []
+        for trigram in needed:
+            if trigram not in self._postings:
+                return []
+            postings.append(self._postings[trigram])
+        postings.sort(key=len)
+
+        candidates = set(_unpack(postings[0]))
+        for packed in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(_unpack(packed))
+        return sorted(candidates)
+
+
+def _unpack(packed):
+    """Unpacks the positions of a posting"""
+    positions = array('I')
+    positions.fromstring(packed)
+    return positions
+
+
+def index_path(cache_dir, org):
+    """The file the index of an org is cached in"""
+    return os.path.join(cache_dir, '{0}.index'.format(re.sub(r'[^\w.-]', '_', org)))
+
+
+def fetch_index(monitor):
+    """Fetches every monitor of the org of a Monitor, managed by Data Kennel or not, and indexes them"""
+    fetched = time.time()
+    monitors = monitor.client.get_all()
+    if isinstance(monitors, dict) and monitors.get('errors'):
+        raise Exception('Failed to get monitors: {0}'.format(', '.join(monitors['errors'])))
+    return SearchIndex(monitors, fetched=fetched)
+
+
+def get_org_index(config, org, cache_dir=None, max_age=DEFAULT_MAX_AGE):
+    """
+    Gets the index of every monitor of an org, from the cache if it was fetched less than max_age seconds
+    ago, and otherwise from Datadog, caching it.
+    """
+    path = index_path(cache_dir or default_cache_dir(), org)
+    index = SearchIndex.load(path)
+    if index is not None and time.time() - index.fetched < max_age:
+        logger.debug('Searching %s monitors of org %s cached %.0fs ago', index.count(), org,
+                     time.time() - index.fetched)
+        return index
+
+    logger.info('Fetching the monitors of org %s', org)
+    index = fetch_index(create_org_monitor(config, org))
+    index.save(path)
+    return index
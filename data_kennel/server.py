@@ -0,0 +1,284 @@
+"""
+Local HTTP control server exposing Data Kennel operations over warm config and inventory state.
+"""
+import json
+import logging
+import os
+import itertools
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import urlparse, parse_qs
+
+from data_kennel.config import Config
+from data_kennel.monitor import SyncReport, create_org_monitor, LIST_COLUMNS, DEFAULT_LIST_COLUMNS
+from data_kennel.util import convert_tags_to_dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8778
+DEFAULT_HOST = '127.0.0.1'
+
+
+class RequestError(Exception):
+    """Raised for requests that are invalid, which are answered with a 400"""
+    pass
+
+
+class ReadWriteLock(object):
+    """
+    Lock that many readers can hold at once, but a writer holds alone.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def reading(self):
+        """Holds the lock for reading"""
+        with self._condition:
+            while self._writing:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        """Holds the lock for writing"""
+        with self._condition:
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class DataKennelService(object):
+    """
+    Data Kennel operations over a config and an inventory of real monitors that are loaded once and kept in
+    memory. Every org of the config has a Monitor with the credentials of that org and an inventory of its
+    own, and operations span every org. Read operations run concurrently, while operations that change
+    Datadog or reload state are serialized.
+    """
+
+    def __init__(self, config_path=None, config_dir=None):
+        self.config_path = config_path
+        self.config_dir = config_dir
+        self.config = None
+        # The Monitor of each org of the config, by org
+        self.monitors = OrderedDict()
+        # The real monitors of the teams of each org, by org
+        self.inventories = {}
+        self._lock = ReadWriteLock()
+        self.reload()
+
+    def reload(self):
+        """Reloads the config from disk and refetches the inventory of every org from Datadog"""
+        with self._lock.writing():
+            self.config = Config(config_path=self.config_path, config_dir=self.config_dir)
+            self.monitors = OrderedDict(
+                (org, create_org_monitor(self.config, org)) for org in self.config.orgs
+            )
+            self.inventories = {org: monitor.get_monitors() for org, monitor in self.monitors.items()}
+            monitor_count = sum(len(inventory) for inventory in self.inventories.values())
+            logger.info('Loaded %s teams and %s monitors of %s orgs', len(self.config.teams), monitor_count,
+                        len(self.monitors))
+        return {'teams': sorted(self.config.teams), 'monitors': monitor_count}
+
+    def list(self, tags=None, columns=None, name=None, states=None, monitor_types=None):
+        """Lists monitors from the inventory of every org, see Monitor.list"""
+        with self._lock.reading():
+            return list(itertools.chain.from_iterable(
+                monitor.list(tags=tags, columns=columns, name=name, states=states,
+                             monitor_types=monitor_types, inventory=self.inventories[org])
+                for org, monitor in self.monitors.items()
+            ))
+
+    def get_inventory(self, tags=None, name=None, states=None, monitor_types=None):
+        """Returns the real monitors of the inventory of every org, with the same filtering as list"""
+        with self._lock.reading():
+            return list(itertools.chain.from_iterable(
+                monitor.get_monitors(tags, name=name, states=states, monitor_types=monitor_types,
+                                     inventory=self.inventories[org])
+                for org, monitor in self.monitors.items()
+            ))
+
+    def plan(self, tags=None):
+        """Returns the changes an update would make in every org, without making them"""
+        with self._lock.reading():
+            report = SyncReport()
+            for org, monitor in self.monitors.items():
+                real_monitors = monitor.get_monitors(tags, inventory=self.inventories[org])
+                report.extend(monitor.sync(monitor.config.get_monitors(tags), real_monitors, dry_run=True))
+            return report.summary()
+
+    def sync(self, tags=None):
+        """
+        Updates the monitors matching the tags in every org in Datadog and returns the changes that were made.
+        The inventory of each org is updated as soon as that org is synced.
+        """
+        with self._lock.writing():
+            report = SyncReport()
+            for org, monitor in self.monitors.items():
+                real_monitors = monitor.get_monitors(tags, inventory=self.inventories[org])
+                org_report = monitor.sync(monitor.config.get_monitors(tags), real_monitors)
+                self.inventories[org] = org_report.apply(self.inventories[org], real_monitors)
+                report.extend(org_report)
+            return report.summary()
+
+
+class DataKennelRequestHandler(BaseHTTPRequestHandler):
+    """
+    Maps HTTP requests to the operations of the server's DataKennelService.
+
+    GET  /list          Lists monitors. Parameters: tags, columns, name, state, type.
+    GET  /inventory     Returns real monitors. Parameters: tags, name, state, type.
+    GET  /plan          Returns the changes an update would make. Parameters: tags.
+    POST /sync          Updates monitors. Parameters: tags.
+    POST /reload        Reloads the config and the inventory.
+
+    tags are given as 'tag_name:tag_value' and, like state and type, can be repeated.
+    """
+
+    routes = {
+        ('GET', '/list'): '_list',
+        ('GET', '/inventory'): '_inventory',
+        ('GET', '/plan'): '_plan',
+        ('POST', '/sync'): '_sync',
+        ('POST', '/reload'): '_reload'
+    }
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles GET requests"""
+        self._handle('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Handles POST requests"""
+        self._handle('POST')
+
+    def address_string(self):
+        # Clients of unix sockets have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix socket'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug('%s %s', self.address_string(), format % args)
+
+    def _handle(self, method):
+        """Dispatches a request to its route and writes the JSON response"""
+        url = urlparse(self.path)
+        route = self.routes.get((method, url.path))
+        if route is None:
+            self._respond(404, {'error': 'Unknown endpoint {0} {1}'.format(method, url.path)})
+            return
+
+        try:
+            self._respond(200, getattr(self, route)(parse_qs(url.query)))
+        except RequestError as ex:
+            self._respond(400, {'error': str(ex)})
+        except Exception as ex:
+            logger.exception('Failed to handle %s %s', method, self.path)
+            self._respond(500, {'error': str(ex)})
+
+    def _respond(self, status, body):
+        """Writes a JSON response"""
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _tags(self, params):
+        """Parses the tags parameter"""
+        tags = params.get('tags', [])
+        if not all(':' in tag for tag in tags):
+            raise RequestError("Tags should be formatted as 'tag_name:tag_value'")
+        return convert_tags_to_dict(tags)
+
+    def _list(self, params):
+        columns = params.get('columns', [','.join(DEFAULT_LIST_COLUMNS)])[0].split(',')
+        unknown_columns = [column for column in columns if column not in LIST_COLUMNS]
+        if unknown_columns:
+            raise RequestError('Unknown columns: {0}'.format(', '.join(unknown_columns)))
+
+        return self.server.service.list(tags=self._tags(params), columns=columns,
+                                        name=params.get('name', [None])[0], states=params.get('state'),
+                                        monitor_types=params.get('type'))
+
+    def _inventory(self, params):
+        return self.server.service.get_inventory(tags=self._tags(params), name=params.get('name', [None])[0],
+                                                 states=params.get('state'), monitor_types=params.get('type'))
+
+    def _plan(self, params):
+        return self.server.service.plan(tags=self._tags(params))
+
+    def _sync(self, params):
+        return self.server.service.sync(tags=self._tags(params))
+
+    def _reload(self, _params):
+        return self.server.service.reload()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server of a DataKennelService, handling each request in its own thread"""
+    daemon_threads = True
+
+    def __init__(self, server_address, service):
+        HTTPServer.__init__(self, server_address, DataKennelRequestHandler)
+        self.service = service
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """HTTP server of a DataKennelService on a unix socket, handling each request in its own thread"""
+    daemon_threads = True
+
+    def __init__(self, socket_path, service):
+        UnixStreamServer.__init__(self, socket_path, DataKennelRequestHandler)
+        self.service = service
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        UnixStreamServer.server_bind(self)
+
+
+def create_server(service, port=DEFAULT_PORT, socket_path=None, host=DEFAULT_HOST):
+    """
+    Creates an HTTP server for a DataKennelService, listening on a unix socket if a socket path is given and
+    on a local TCP port otherwise.
+    """
+    if socket_path:
+        return ThreadingUnixHTTPServer(socket_path, service)
+    return ThreadingHTTPServer((host, port), service)
+
+
+def serve(service, port=DEFAULT_PORT, socket_path=None):
+    """Serves a DataKennelService until interrupted"""
+    server = create_server(service, port=port, socket_path=socket_path)
+    logger.info('Serving on %s', socket_path or 'http://{0}:{1}'.format(DEFAULT_HOST, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
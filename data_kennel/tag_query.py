@@ -0,0 +1,265 @@
+"""
+Tag queries, a small expression language over the tags of monitors, evaluated against a bitmap index.
+
+    team:astronauts AND (env:prod OR env:staging) AND NOT muted
+    service:api-* OR owner
+
+A term is a `key:value` tag, or a `key` matching every tag with that key as well as the bare tag `key`. Keys
+and values can contain `*` wildcards. Terms are combined with NOT, AND and OR, binding in that order, and
+parentheses. Operators are case insensitive, and terms next to each other without an operator are ANDed.
+
+Queries that only AND plain `key:value` tags, like the tags of get_monitors, filter monitors with a scan of
+their tags. Other queries are evaluated against a TagIndex, which keeps a bitset of the monitors having each
+tag, as a Python integer, so that a query takes a few integer operations per term, and wildcards are matched
+once per distinct tag instead of once per monitor. Building the index costs more than a scan, so it only
+pays off for such queries.
+"""
+import binascii
+import re
+
+from collections import defaultdict
+
+_TOKEN_REGEX = re.compile(r'\s*(?:(\()|(\))|([^\s()]+))')
+_OPERATORS = ('AND', 'OR', 'NOT')
+
+
+class TagQueryError(ValueError):
+    """Raised when a tag query can't be parsed"""
+    pass
+
+
+class TagIndex(object):
+    """
+    Monitors indexed by their tags and tag keys. The bitset of a tag has bit i set if monitor i has the tag.
+    Bitsets are built the first time a query needs them.
+    """
+
+    def __init__(self, monitors):
+        self.monitors = list(monitors)
+        self.all = (1 << len(self.monitors)) - 1
+        self._tag_positions = defaultdict(list)
+        self._key_positions = defaultdict(list)
+        self._bitsets = {}
+
+        for position, monitor in enumerate(self.monitors):
+            for tag in monitor.get('tags') or []:
+                self._tag_positions[tag].append(position)
+                self._key_positions[tag.split(':', 1)[0]].append(position)
+
+    def tag(self, tag):
+        """The bitset of the monitors with a tag"""
+        return self._bitset(('tag', tag), self._tag_positions.get(tag, []))
+
+    def key(self, key):
+        """The bitset of the monitors with a tag with the key, or the bare tag key"""
+        return self._bitset(('key', key), self._key_positions.get(key, []))
+
+    def matching_tags(self, predicate):
+        """The bitset of the monitors with a tag matching a predicate"""
+        positions = set()
+        for tag, tag_positions in self._tag_positions.items():
+            if predicate(tag):
+                positions.update(tag_positions)
+        return self._to_bitset(positions)
+
+    def select(self, bits):
+        """The monitors in a bitset, in their original order"""
+        # The binary digits of the bitset, lowest first, so that digit i is monitor i
+        digits = bin(bits)[:1:-1]
+        selected = []
+        position = digits.find('1')
+        while position >= 0:
+            selected.append(self.monitors[position])
+            position = digits.find('1', position + 1)
+        return selected
+
+    def _bitset(self, cache_key, positions):
+        """The bitset of positions, cached"""
+        if cache_key not in self._bitsets:
+            self._bitsets[cache_key] = self._to_bitset(positions)
+        return self._bitsets[cache_key]
+
+    def _to_bitset(self, positions):
+        """Builds a bitset from positions through a byte array, rather than one large integer per position"""
+        if not positions:
+            return 0
+        bits = bytearray((len(self.monitors) + 7) // 8)
+        for position in positions:
+            bits[position >> 3] |= 1 << (position & 7)
+        bits.reverse()
+        return int(binascii.hexlify(bits), 16)
+
+
+class TagQuery(object):
+    """
+    A compiled tag query.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        tokens = list(_tokenize(text))
+        if not tokens:
+            raise TagQueryError('Empty tag query')
+
+        self._tokens = tokens
+        self._position = 0
+        self._tree = self._parse_or()
+        if self._position < len(self._tokens):
+            raise TagQueryError('Unexpected {0!r} in tag query {1!r}'.format(self._peek(), text))
+        del self._tokens
+
+    @classmethod
+    def from_tags(cls, tags):
+        """A query matching monitors with all of the tags"""
+        query = cls.__new__(cls)
+        query.text = ' AND '.join(tags)
+        query._tree = ('and', [('term', tag) for tag in tags])
+        return query
+
+    def evaluate(self, index):
+        """The bitset of the monitors of a TagIndex matching the query"""
+        return _evaluate(self._tree, index)
+
+    def filter(self, monitors):
+        """The monitors matching the query, in their original order"""
+        plain_tags = _plain_tags(self._tree)
+        if plain_tags is not None:
+            return [monitor for monitor in monitors if plain_tags.issubset(monitor.get('tags') or ())]
+
+        index = TagIndex(monitors)
+        return index.select(self.evaluate(index))
+
+    def matches(self, tags):
+        """Whether a monitor with the tags matches the query"""
+        return bool(self.filter([{'tags': tags}]))
+
+    def __repr__(self):
+        return 'TagQuery({0!r})'.format(self.text)
+
+    def _peek(self):
+        """The next token, or None"""
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self):
+        """Consumes the next token"""
+        token = self._peek()
+        if token is None:
+            raise TagQueryError('Unexpected end of tag query {0!r}'.format(self.text))
+        self._position += 1
+        return token
+
+    def _parse_or(self):
+        """or := and ('OR' and)*"""
+        operands = [self._parse_and()]
+        while _is_operator(self._peek(), 'OR'):
+            self._next()
+            operands.append(self._parse_and())
+        return operands[0] if len(operands) == 1 else ('or', operands)
+
+    def _parse_and(self):
+        """and := not (['AND'] not)*"""
+        operands = [self._parse_not()]
+        while self._peek() is not None and self._peek() != ')' and not _is_operator(self._peek(), 'OR'):
+            if _is_operator(self._peek(), 'AND'):
+                self._next()
+            operands.append(self._parse_not())
+        return operands[0] if len(operands) == 1 else ('and', operands)
+
+    def _parse_not(self):
+        """not := 'NOT' not | '(' or ')' | term"""
+        token = self._next()
+        if _is_operator(token, 'NOT'):
+            return ('not', self._parse_not())
+        if token == '(':
+            tree = self._parse_or()
+            if self._next() != ')':
+                raise TagQueryError('Missing ) in tag query {0!r}'.format(self.text))
+            return tree
+        if token == ')' or token.upper() in _OPERATORS:
+            raise TagQueryError('Unexpected {0!r} in tag query {1!r}'.format(token, self.text))
+        return ('term', token)
+
+
+def _tokenize(text):
+    """Splits a tag query into parentheses and words"""
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_REGEX.match(text, position)
+        position = match.end()
+        yield match.group(1) or match.group(2) or match.group(3)
+
+
+def _is_operator(token, operator):
+    """Whether a token is an operator, case insensitively"""
+    return token is not None and token.upper() == operator
+
+
+def _plain_tags(tree):
+    """The tags of a parsed query that only ANDs plain key:value tags, or None for any other query"""
+    if tree[0] == 'term':
+        return frozenset([tree[1]]) if ':' in tree[1] and '*' not in tree[1] else None
+    if tree[0] != 'and':
+        return None
+
+    tags = frozenset()
+    for operand in tree[1]:
+        operand_tags = _plain_tags(operand)
+        if operand_tags is None:
+            return None
+        tags |= operand_tags
+    return tags
+
+
+def _wildcard_regex(pattern):
+    """Compiles a pattern with * wildcards"""
+    return re.compile('^' + '.*'.join(re.escape(part) for part in pattern.split('*')) + '$')
+
+
+def _evaluate(tree, index):
+    """Evaluates a parsed query against a TagIndex"""
+    kind = tree[0]
+    if kind == 'term':
+        return _evaluate_term(tree[1], index)
+    if kind == 'not':
+        return index.all & ~_evaluate(tree[1], index)
+    if not tree[1]:
+        return index.all if kind == 'and' else 0
+
+    bits = _evaluate(tree[1][0], index)
+    for operand in tree[1][1:]:
+        if kind == 'and':
+            if not bits:
+                break
+            bits &= _evaluate(operand, index)
+        else:
+            bits |= _evaluate(operand, index)
+    return bits
+
+
+def _evaluate_term(term, index):
+    """Evaluates a term against a TagIndex"""
+    if '*' not in term:
+        return index.tag(term) if ':' in term else index.key(term)
+
+    if ':' in term:
+        regex = _wildcard_regex(term)
+        return index.matching_tags(lambda tag: ':' in tag and regex.match(tag) is not None)
+
+    regex = _wildcard_regex(term)
+    return index.matching_tags(lambda tag: regex.match(tag.split(':', 1)[0]) is not None)
+
+
+def compile_tag_query(expressions):
+    """
+    Compiles tag expressions, such as the values of --tags, into one TagQuery matching monitors that match
+    all of them.
+    """
+    queries = [TagQuery(expression) for expression in expressions]
+    if len(queries) == 1:
+        return queries[0]
+
+    query = TagQuery.__new__(TagQuery)
+    query.text = ' AND '.join('({0})'.format(expression) for expression in expressions)
+    query._tree = ('and', [compiled._tree for compiled in queries])
+    return query
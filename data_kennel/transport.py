@@ -0,0 +1,193 @@
+"""
+Non-blocking transport for the Datadog monitor API.
+
+asyncio needs Python 3, while Data Kennel runs on Python 2.7, so AsyncMonitorClient provides the same
+model on top of any monitor client with a small pool of worker threads: every call returns a MonitorRequest
+right away, which can be waited on with a timeout, cancelled before it is sent, or given callbacks. Any
+number of requests can be in flight, but no more than `workers` of them are sent at once, and the worker
+threads only live while there are requests to send.
+"""
+import logging
+import sys
+import threading
+
+from collections import deque
+
+import six
+
+from data_kennel.util import DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimeout(Exception):
+    """Raised when waiting on a request takes longer than its timeout"""
+    pass
+
+
+class RequestCancelled(Exception):
+    """Raised when waiting on a request that was cancelled"""
+    pass
+
+
+class MonitorRequest(object):
+    """
+    A request to the monitor API that may not have completed yet, like a future.
+    """
+
+    def __init__(self, operation, args, kwargs, timeout=None):
+        self.operation = operation
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._started = False
+        self._cancelled = False
+        self._result = None
+        # The sys.exc_info() of the exception the request raised, if any, to re-raise with its traceback
+        self._exc_info = None
+        self._callbacks = []
+
+    def cancel(self):
+        """Cancels the request unless it was already sent. Returns whether it was cancelled."""
+        with self._lock:
+            if self._started:
+                return False
+            self._cancelled = True
+        self._finish()
+        return True
+
+    def cancelled(self):
+        """Whether the request was cancelled"""
+        return self._cancelled
+
+    def done(self):
+        """Whether the request completed, failed or was cancelled"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the request and returns the response of the monitor API, or raises the exception the
+        request raised. Raises RequestTimeout if the request doesn't complete within the timeout, which
+        defaults to the request's own timeout, and RequestCancelled if the request was cancelled.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self._done.wait(timeout):
+            raise RequestTimeout('{0} did not complete within {1} seconds'.format(self.operation, timeout))
+        if self._cancelled:
+            raise RequestCancelled('{0} was cancelled'.format(self.operation))
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+        return self._result
+
+    def add_done_callback(self, callback):
+        """Calls the callback with the request once it is done, right away if it already is"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def run(self, client):
+        """Sends the request with the client, unless it was cancelled"""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._started = True
+
+        try:
+            self._result = getattr(client, self.operation)(*self.args, **self.kwargs)
+        except Exception:  # pylint: disable=broad-except
+            self._exc_info = sys.exc_info()
+        self._finish()
+
+    def _finish(self):
+        """Marks the request as done and calls its callbacks"""
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Callback of %s failed', self.operation)
+
+
+class AsyncMonitorClient(object):
+    """
+    Monitor API client whose calls return a MonitorRequest instead of waiting for the response. Requests are
+    sent with the wrapped monitor client, which must be safe to use from several threads.
+
+    client      The monitor client sending the requests, e.g. a DatadogMonitorClient or HttpMonitorClient.
+    workers     The maximum number of requests sent at once.
+    timeout     The default timeout of waiting on a request, in seconds. None waits forever.
+    """
+
+    def __init__(self, client, workers=DEFAULT_WORKERS, timeout=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._active_workers = 0
+
+    def get_all(self, **params):
+        """Gets all monitors matching the params"""
+        return self.submit('get_all', **params)
+
+    def get(self, monitor_id):
+        """Gets a monitor"""
+        return self.submit('get', monitor_id)
+
+    def create(self, **monitor):
+        """Creates a monitor"""
+        return self.submit('create', **monitor)
+
+    def update(self, **monitor):
+        """Updates a monitor, identified by the id of the given monitor"""
+        return self.submit('update', **monitor)
+
+    def delete(self, monitor_id):
+        """Deletes a monitor"""
+        return self.submit('delete', monitor_id)
+
+    def search(self, **params):
+        """Searches monitors with a monitor search query"""
+        return self.submit('search', **params)
+
+    def validate(self, **monitor):
+        """Validates a monitor without creating it"""
+        return self.submit('validate', **monitor)
+
+    def submit(self, operation, *args, **kwargs):
+        """Queues a call of the operation of the wrapped client, returning its MonitorRequest"""
+        request = MonitorRequest(operation, args, kwargs, timeout=self.timeout)
+        with self._lock:
+            self._pending.append(request)
+            start_worker = self._active_workers < self.workers
+            if start_worker:
+                self._active_workers += 1
+
+        if start_worker:
+            worker = threading.Thread(target=self._work, name='data-kennel-transport')
+            worker.daemon = True
+            worker.start()
+        return request
+
+    def gather(self, requests, timeout=None):
+        """
+        Waits for the requests and returns their responses in order. The timeout applies to each request
+        separately, and the first exception of a request is raised.
+        """
+        return [request.result(timeout) for request in requests]
+
+    def _work(self):
+        """Sends pending requests until there are none left"""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._active_workers -= 1
+                    return
+                request = self._pending.popleft()
+            request.run(self.client)
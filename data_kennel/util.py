@@ -1,13 +1,37 @@
-'''Utility functions for data kennel'''
+'''
+Utility functions for data kennel.
+
+The scripts in bin/ only import this module and data_kennel.version at load time, and everything else once
+the command line has been parsed, so that --help and --version don't pay for importing datadog, requests,
+yaml and schema. This module must stay cheap to import for the same reason.
+'''
 from __future__ import print_function
 
+import calendar
+import csv
+import datetime
+import hashlib
+import json
 import logging
+import os
+import re
 import sys
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from multiprocessing import cpu_count
+from multiprocessing.pool import Pool, ThreadPool
 
 logger = logging.getLogger(__name__)
 YES_LIST = ['y', 't', 'yes', 'true', '1']
+OUTPUT_FORMATS = ('table', 'jsonl', 'csv', 'tsv')
+DEFAULT_COLUMN_WIDTH = 40
+DEFAULT_WORKERS = 8
+DEFAULT_CHUNK_SIZE = 100
+# The units of the durations parse_duration parses, in seconds
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+# The formats of the date and time strings that to_timestamp parses, all in UTC
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%MZ',
+                     '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M', '%Y-%m-%d')
 
 
 class EasyExit(Exception):
@@ -92,6 +116,119 @@ def print_table(rows, headers=None):
         print(format_string.format(**defaulted_row))
 
 
+def print_fixed_width_table(rows, headers, widths=None):
+    """
+    Convenience method for printing dictionary objects into a table with fixed column widths. Unlike
+    print_table, rows are printed as they arrive, so this works with iterators of any length. Values that
+    are too long for their column are truncated, except in the last column.
+
+    Params:
+        rows -                  An iterable of dictionaries representing a table of information, where keys
+                                are the headers of the table.
+
+        headers -               A list of the headers to print for the table.
+
+        widths -                A dictionary of header to column width. Columns without a width are
+                                DEFAULT_COLUMN_WIDTH wide.
+    """
+    widths = widths or {}
+    sizes = [max(widths.get(header, DEFAULT_COLUMN_WIDTH), len(header)) for header in headers]
+
+    def format_row(values):
+        """Pads and truncates the values of a row into columns"""
+        cells = []
+        for index, value in enumerate(values):
+            value = str(value)
+            if index == len(values) - 1:
+                cells.append(value)
+            elif len(value) > sizes[index]:
+                cells.append(value[:sizes[index] - 3] + '...' + ' ')
+            else:
+                cells.append(value.ljust(sizes[index] + 1))
+        return '\t'.join(cells)
+
+    print(format_row(headers), file=sys.stderr)
+
+    for row in rows:
+        print(format_row([row.get(header) or '-' for header in headers]))
+
+
+def print_rows(rows, headers, output_format='table', fixed_width=False, widths=None):
+    """
+    Convenience method for printing dictionary objects in one of OUTPUT_FORMATS. Every format except a
+    table that isn't fixed width prints rows one at a time as they arrive, without holding them in memory.
+
+    Params:
+        rows -                  An iterable of dictionaries representing a table of information, where keys
+                                are the headers of the table.
+
+        headers -               A list of the headers to print, in order.
+
+        output_format -         One of OUTPUT_FORMATS. jsonl prints one JSON object per row, csv and tsv
+                                print a header line and then one line per row.
+
+        fixed_width -           If True, tables are printed with print_fixed_width_table.
+
+        widths -                Column widths for fixed width tables.
+    """
+    if output_format == 'table':
+        if fixed_width:
+            print_fixed_width_table(rows, headers, widths)
+        else:
+            print_table(list(rows), headers)
+    elif output_format == 'jsonl':
+        for row in rows:
+            print(json.dumps(OrderedDict((header, row.get(header)) for header in headers)))
+    elif output_format in ('csv', 'tsv'):
+        writer = csv.writer(sys.stdout, delimiter=',' if output_format == 'csv' else '\t',
+                            lineterminator='\n')
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow([row.get(header, '') for header in headers])
+    else:
+        raise ValueError('Unknown output format: {0}'.format(output_format))
+
+
+def run_concurrently(function, items, workers=DEFAULT_WORKERS):
+    """
+    Convenience method for calling a function on each item using a pool of threads, for when the function
+    spends its time waiting on the network. Returns the results in the order of the items.
+    """
+    items = list(items)
+    if not items:
+        return []
+    if workers <= 1 or len(items) == 1:
+        return [function(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_in_processes(function, items, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convenience method for calling a function on each item using a pool of processes, for when the function
+    spends its time on the CPU. The function must be defined at the top level of a module and the items and
+    results must be picklable. Items are sent to the processes chunk_size at a time, and no more than one
+    chunk of items is processed inline, since starting processes would cost more than it saves. Returns the
+    results in the order of the items.
+    """
+    items = list(items)
+    processes = min(processes or cpu_count(), (len(items) + chunk_size - 1) // chunk_size)
+    if processes <= 1:
+        return [function(item) for item in items]
+
+    pool = Pool(processes)
+    try:
+        return pool.map(function, items, chunk_size)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def convert_dict_to_tags(tags):
     """Convenience function for converting a dict to datadog tags"""
     return ["{0}:{1}".format(key, value) for key, value in tags.iteritems()]
@@ -102,8 +239,112 @@ def convert_tags_to_dict(tags):
     return dict(tag.split(':', 1) for tag in tags)
 
 
+def parse_duration(duration):
+    """
+    Parses a duration such as '90m', '2h' or '1d' into seconds. A plain number is a number of seconds.
+
+    >>> parse_duration('2h')
+    7200
+    """
+    match = re.match(r'^(\d+)([smhdw]?)$', duration.strip())
+    if match is None:
+        raise ValueError('Unknown duration {0!r}, it should be a number followed by one of {1}'.format(
+            duration, ', '.join(sorted(DURATION_UNITS))))
+    return int(match.group(1)) * DURATION_UNITS.get(match.group(2) or 's')
+
+
+def parse_shard(shard):
+    """
+    Parses a --shard option given as I/N into an (index, count) pair, or None if it isn't a valid shard.
+
+    >>> parse_shard('2/4')
+    (2, 4)
+    >>> parse_shard('5/4') is None
+    True
+    """
+    if shard is None:
+        return None
+    index, count = [int(part) for part in shard.split('/')]
+    return (index, count) if 1 <= index <= count else None
+
+
+def user_cache_dir(name):
+    """Convenience function for the directory Data Kennel caches name in, under the user's cache directory"""
+    cache_home = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'data_kennel', name)
+
+
 def is_truthy(var):
     """Convenience function for checking whether a variable is truthy"""
     if isinstance(var, basestring):
         return var.lower() in YES_LIST
     return bool(var)
+
+
+def is_rate_limited(response):
+    """
+    Whether the errors of a response of the Datadog API are about rate limits
+
+    >>> is_rate_limited({'errors': ['429 Too Many Requests']})
+    True
+    >>> is_rate_limited({'errors': ['Invalid query']})
+    False
+    """
+    errors = response.get('errors') if isinstance(response, dict) else None
+    return bool(errors) and any('429' in str(error) or 'rate limit' in str(error).lower() for error in errors)
+
+
+def file_digest(path, chunk_size=65536):
+    """Convenience function for the SHA-1 hex digest of a file's content, read a chunk at a time"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as digested_file:
+        for chunk in iter(lambda: digested_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def to_timestamp(value):
+    """
+    Convenience function for converting a POSIX timestamp, a datetime or date as parsed by YAML, or a date and
+    time string in one of TIMESTAMP_FORMATS to a POSIX timestamp. Naive datetimes are taken to be in UTC.
+
+    >>> to_timestamp('2017-06-01T12:00:00Z')
+    1496318400
+    >>> to_timestamp(datetime.date(2017, 6, 1))
+    1496275200
+    """
+    if isinstance(value, datetime.datetime):
+        if value.utcoffset() is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return calendar.timegm(value.timetuple())
+    if isinstance(value, datetime.date):
+        return calendar.timegm(value.timetuple())
+    if isinstance(value, basestring) and not value.strip().isdigit():
+        for timestamp_format in TIMESTAMP_FORMATS:
+            try:
+                parsed = datetime.datetime.strptime(value.strip(), timestamp_format)
+                return calendar.timegm(parsed.timetuple())
+            except ValueError:
+                continue
+        raise ValueError('Unknown date and time {0!r}, it should be a POSIX timestamp or like {1}'.format(
+            value, '2017-06-01T12:00:00Z'))
+    return int(value)
+
+
+def parse_time(value, now):
+    """
+    Parses a POSIX timestamp, a date and time string like to_timestamp, or a duration like parse_duration
+    before now, into a POSIX timestamp.
+
+    >>> parse_time('2h', now=1496318400)
+    1496311200
+    """
+    try:
+        return to_timestamp(value)
+    except ValueError:
+        pass
+    try:
+        return now - parse_duration(value)
+    except ValueError:
+        raise ValueError('Unknown time {0!r}, it should be a timestamp, a date and time or a duration'.format(
+            value))
@@ -0,0 +1,356 @@
+"""
+Long running incremental sync of a config directory to Datadog.
+"""
+import hashlib
+import logging
+import os
+import time
+
+from data_kennel.config import Config, get_config_files, load_config_file
+from data_kennel.monitor import SyncReport, create_org_monitor
+from data_kennel.util import file_digest
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_DEBOUNCE = 1.0
+
+
+class PollingChangeDetector(object):
+    """
+    Detects changes to the config files of a directory by periodically comparing their modification times
+    and sizes.
+    """
+
+    def __init__(self, config_dir, interval=DEFAULT_POLL_INTERVAL):
+        self.config_dir = config_dir
+        self.interval = interval
+        self.watched_files = set()
+        self._snapshot = self._take_snapshot()
+
+    def watch_files(self, paths):
+        """Also detects changes to these files, such as the variables files of config files"""
+        self.watched_files = set(paths)
+        self._snapshot = self._take_snapshot()
+
+    def poll(self, timeout=None):
+        """
+        Waits up to timeout seconds, or forever if timeout is None, for config files to change.
+        Returns the paths of the changed, added and removed config files, which is empty on timeout.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            snapshot = self._take_snapshot()
+            changed = set(
+                path for path in set(snapshot) | set(self._snapshot)
+                if snapshot.get(path) != self._snapshot.get(path)
+            )
+            self._snapshot = snapshot
+
+            if changed:
+                return changed
+
+            if deadline is not None and time.time() >= deadline:
+                return set()
+
+            time.sleep(self.interval if deadline is None else max(0, min(self.interval,
+                                                                         deadline - time.time())))
+
+    def _take_snapshot(self):
+        """The modification time and size of every config file and watched file"""
+        snapshot = {}
+        for path in set(get_config_files(self.config_dir)) | self.watched_files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed between listing and stat, it will show up as removed in the next snapshot
+                continue
+            snapshot[path] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+
+class InotifyChangeDetector(object):
+    """
+    Detects changes to the config files of a directory with inotify. Requires the inotify_simple package.
+    """
+
+    def __init__(self, config_dir):
+        self.config_dir = config_dir
+        self.watched_files = set()
+        self._inotify = INotify()
+        # The watched directories, by watch descriptor
+        self._directories = {}
+        self._watch_directory(config_dir)
+
+    def watch_files(self, paths):
+        """Also detects changes to these files, such as the variables files of config files"""
+        self.watched_files = set(paths)
+        for directory in set(os.path.dirname(path) for path in paths) - set(self._directories.values()):
+            self._watch_directory(directory)
+
+    def poll(self, timeout=None):
+        """
+        Waits up to timeout seconds, or forever if timeout is None, for config files to change.
+        Returns the paths of the changed, added and removed config files, which is empty on timeout.
+        """
+        events = self._inotify.read(timeout=None if timeout is None else int(timeout * 1000))
+        changed = set()
+        for event in events:
+            directory = self._directories[event.wd]
+            path = os.path.join(directory, event.name)
+            if path in self.watched_files or (directory == self.config_dir and event.name.endswith('.yml')):
+                changed.add(path)
+        return changed
+
+    def _watch_directory(self, directory):
+        """Watches a directory for files being written, moved, created and deleted"""
+        watch_descriptor = self._inotify.add_watch(
+            directory,
+            flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.CREATE | flags.DELETE
+        )
+        # Watching a directory twice returns the same descriptor, keep the first name it was watched by
+        self._directories.setdefault(watch_descriptor, directory)
+
+
+def create_change_detector(config_dir, interval=DEFAULT_POLL_INTERVAL):
+    """Creates an inotify change detector if inotify_simple is installed, otherwise a polling one"""
+    if INotify is not None:
+        try:
+            return InotifyChangeDetector(config_dir)
+        except (OSError, IOError) as ex:
+            logger.warning('Unable to watch %s with inotify, polling instead: %s', config_dir, ex)
+    return PollingChangeDetector(config_dir, interval)
+
+
+class Watcher(object):
+    """
+    Keeps a config directory in sync with Datadog. The expanded monitors of every config file and the
+    inventory of real monitors of every org are kept in memory, so that when files change only the monitors
+    from those files are re-expanded and reconciled, in the orgs of those files with the credentials of each
+    org.
+    """
+
+    def __init__(self, config_dir, dry_run=False, debounce=DEFAULT_DEBOUNCE, change_detector=None):
+        self.config_dir = config_dir
+        self.dry_run = dry_run
+        self.debounce = debounce
+        self.change_detector = change_detector or create_change_detector(config_dir)
+        # The real monitors of the teams of each org in the config directory, by org
+        self.inventories = {}
+        # The teams whose real monitors are in the inventory
+        self.teams = set()
+        # The names of the monitors and sub-monitors each config file expands to
+        self.file_monitor_names = {}
+        # The variables files each config file reads
+        self.file_data_files = {}
+        # The sync key of each config file, which changes when the file or its variables files change
+        self.file_keys = {}
+        # The org of the team of each config file
+        self.file_orgs = {}
+
+    @property
+    def inventory(self):
+        """The real monitors of every team in the config directory, across orgs"""
+        return [real_monitor for org in sorted(self.inventories) for real_monitor in self.inventories[org]]
+
+    def run(self, iterations=None):
+        """
+        Syncs the whole config directory, then syncs changed files as they change. Runs forever unless a
+        number of iterations is given.
+        """
+        self.sync_all()
+
+        iteration = 0
+        while iterations is None or iteration < iterations:
+            self.sync_files(self.wait_for_changes())
+            iteration += 1
+
+    def wait_for_changes(self):
+        """
+        Waits for config files to change, then keeps collecting changes until none have happened for the
+        debounce period, so that a burst of edits is synced once. Returns the changed paths.
+        """
+        changed = set()
+        while not changed:
+            changed = self.change_detector.poll()
+
+        while True:
+            more_changes = self.change_detector.poll(self.debounce)
+            if not more_changes:
+                return changed
+            changed |= more_changes
+
+    def sync_all(self):
+        """Syncs every config file and refreshes the inventory from Datadog"""
+        paths = get_config_files(self.config_dir)
+        logger.info('Syncing %s config files', len(paths))
+
+        parsed_files = self._load_files(paths)
+        inspected_files = dict(
+            (path, self._inspect_file(path, parsed)) for path, parsed in parsed_files.items()
+        )
+        config = Config(config_list=list(parsed_files.values()))
+        self.inventories = {}
+        self.teams = set(config.teams)
+        self.file_monitor_names = {}
+        self.file_data_files = {}
+        self.file_keys = {}
+        self.file_orgs = {}
+        for path, inspected in inspected_files.items():
+            self._remember_file(path, *inspected)
+        self.change_detector.watch_files(set().union(*self.file_data_files.values()))
+
+        for org in config.orgs:
+            monitor = create_org_monitor(config, org)
+            inventory = monitor.get_monitors()
+            report = monitor.sync(monitor.config.get_monitors(), inventory, dry_run=self.dry_run)
+            self.inventories[org] = inventory if self.dry_run else report.apply(inventory, inventory)
+
+    def sync_files(self, paths):
+        """
+        Syncs the monitors of the given config files, and of the config files reading the given variables
+        files. Files whose sync key hasn't changed are skipped. Only monitors these files used to expand to,
+        or now expand to, are reconciled, in the orgs these files belonged to or now belong to. Errors are
+        logged, and the files are retried on their next change. The inventory of each org is updated as soon
+        as that org is synced, so that it matches Datadog even if another org then fails.
+        """
+        paths = self._get_changed_config_files(paths)
+        if not paths:
+            logger.info('No config files changed')
+            return SyncReport()
+
+        logger.info('Syncing changed config files: %s', ', '.join(sorted(paths)))
+
+        try:
+            parsed_files = self._load_files(path for path in paths if os.path.exists(path))
+            inspected_files = dict(
+                (path, self._inspect_file(path, parsed)) for path, parsed in parsed_files.items()
+            )
+            config = Config(config_list=list(parsed_files.values()))
+            # The orgs the changed files belonged to and now belong to, which differ when a team moves orgs
+            orgs = set(self.file_orgs[path] for path in paths if path in self.file_orgs)
+            orgs.update(org for _, _, org in inspected_files.values())
+            report = SyncReport()
+            for org in sorted(orgs):
+                report.extend(self._sync_org(create_org_monitor(config, org), paths, inspected_files))
+        except Exception:
+            logger.exception('Failed to sync %s', ', '.join(sorted(paths)))
+            return None
+
+        for path in paths:
+            self.file_monitor_names.pop(path, None)
+            self.file_data_files.pop(path, None)
+            self.file_keys.pop(path, None)
+            self.file_orgs.pop(path, None)
+        for path, inspected in inspected_files.items():
+            self._remember_file(path, *inspected)
+        self.change_detector.watch_files(set().union(*self.file_data_files.values()))
+        return report
+
+    def _sync_org(self, monitor, paths, inspected_files):
+        """
+        Syncs the monitors that changed config files used to expand to, or now expand to, in the org of a
+        Monitor. inspected_files are the inspected config files that still exist, by path.
+        """
+        org = monitor.config.org
+        scope, other_names = self._get_scope(org, paths, inspected_files)
+
+        self._fetch_new_teams(monitor)
+        inventory = self.inventories.setdefault(org, [])
+        scoped_inventory = [real_monitor for real_monitor in inventory if real_monitor['name'] in scope]
+        report = monitor.sync(monitor.config.get_monitors(), scoped_inventory, dry_run=self.dry_run,
+                              keep=other_names)
+
+        # Dry runs leave the inventory untouched, since nothing changed in Datadog
+        if not self.dry_run:
+            self.inventories[org] = report.apply(inventory, scoped_inventory)
+        return report
+
+    def _get_scope(self, org, paths, inspected_files):
+        """
+        The names of the monitors of an org that changed config files used to expand to or now expand to, and
+        the names of the monitors of the org's other config files. Sub-monitors shared with the monitors of
+        other files must survive the sync of the changed files.
+        """
+        old_names = set().union(*[
+            self.file_monitor_names[path] for path in paths if self.file_orgs.get(path) == org
+        ])
+        scope = old_names.union(*[
+            names for names, _, file_org in inspected_files.values() if file_org == org
+        ])
+        other_names = set().union(*[
+            names for path, names in self.file_monitor_names.items()
+            if path not in paths and self.file_orgs[path] == org
+        ])
+        return scope, other_names
+
+    def _fetch_new_teams(self, monitor):
+        """Adds the real monitors of the teams of a Monitor's config that aren't in the inventory yet"""
+        new_teams = set(monitor.config.teams) - self.teams
+        if new_teams:
+            self.inventories.setdefault(monitor.config.org, []).extend(
+                real_monitor for real_monitor in monitor.get_monitors()
+                if any('team:' + team in real_monitor['tags'] for team in new_teams)
+            )
+            self.teams.update(new_teams)
+
+    def _load_files(self, paths):
+        """Parses config files by path, once per sync, for both inspecting and syncing them"""
+        return dict((path, load_config_file(path)) for path in paths)
+
+    def _inspect_file(self, path, parsed):
+        """
+        The names of the monitors and sub-monitors a parsed config file expands to, the variables files it
+        uses and the org of its team
+        """
+        from schema import SchemaError
+
+        try:
+            config = Config(config_list=[parsed])
+        except SchemaError as ex:
+            raise Exception('Invalid schema in %s: %s' % (path, ex))
+        names = set()
+        for monitor in config.get_monitors():
+            names.add(monitor['name'])
+            names.update(sub_monitor['name'] for sub_monitor in config.get_sub_monitor(monitor))
+        return names, set(config.data_files), config.orgs[0]
+
+    def _remember_file(self, path, names, data_files, org):
+        """Remembers what a synced config file expands to, its org and its sync key"""
+        self.file_monitor_names[path] = names
+        self.file_data_files[path] = data_files
+        self.file_orgs[path] = org
+        self.file_keys[path] = self._get_sync_key(path, data_files)
+
+    def _get_changed_config_files(self, paths):
+        """
+        The config files among the paths, plus the config files reading variables files among the paths,
+        whose sync key changed since they were last synced.
+        """
+        paths = set(paths)
+        config_paths = set(path for path in paths if path.endswith('.yml'))
+        config_paths.update(
+            path for path, data_files in self.file_data_files.items() if paths.intersection(data_files)
+        )
+        return set(
+            path for path in config_paths
+            if self._get_sync_key(path, self.file_data_files.get(path, set())) != self.file_keys.get(path)
+        )
+
+    def _get_sync_key(self, path, data_files):
+        """
+        A digest of the content of a config file and of its variables files, or None if the config file
+        doesn't exist.
+        """
+        if not os.path.exists(path):
+            return None
+
+        digest = hashlib.sha1(file_digest(path))
+        for data_file in sorted(data_files):
+            digest.update(file_digest(data_file) if os.path.exists(data_file) else 'missing')
+        return digest.hexdigest()
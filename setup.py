@@ -68,6 +68,10 @@ setup(
     dependency_links=[
     ],
     install_requires=get_requirements(),
-    scripts=['bin/dk_monitor'],
+    extras_require={
+        'watch': ['inotify_simple'],
+        'metric': ['numpy'],
+    },
+    scripts=['bin/dk_monitor', 'bin/dk_downtime', 'bin/dk_metric', 'bin/dk_event'],
     test_suite='nose.collector',
 )
@@ -0,0 +1,3 @@
+"""
+Benchmarks -- tests that guard the performance of this egg against regressions
+"""
@@ -0,0 +1,58 @@
+"""
+Benchmark of backtesting monitors
+"""
+from __future__ import print_function
+
+import bisect
+import random
+import timeit
+
+from unittest import TestCase, skipIf
+
+from data_kennel import backtest
+from data_kennel.backtest import Backtest
+
+VARIANT_COUNT = 500
+DAYS = 28
+START = 1496275200
+
+
+class CachedMetric(object):
+    """A Metric answering from timeseries already in memory, like a warm metric cache"""
+
+    def __init__(self):
+        generator = random.Random(0)
+        self.points = [[START + minute * 60, generator.uniform(0, 100)] for minute in range(DAYS * 24 * 60)]
+        self.times = [timestamp for timestamp, _ in self.points]
+
+    def query(self, query, start, end, **_options):
+        """Answers every query with the points of the range"""
+        return [{'name': query, 'points': self.points[bisect.bisect_left(self.times, start):
+                                                      bisect.bisect_right(self.times, end)]}]
+
+
+@skipIf(backtest.numpy is None, 'numpy is not installed')
+class BacktestTimeBenchmark(TestCase):
+    """Benchmark of backtesting monitors"""
+
+    def test_hundreds_of_variants(self):
+        """Hundreds of variants of a monitor are backtested over weeks of minutely data in seconds"""
+        monitors = [
+            {
+                'name': 'cpu on host-{0}'.format(index),
+                'type': 'metric alert',
+                'query': 'avg(last_5m):avg:system.cpu.user{{host:host-{0}}} > {1}'.format(index,
+                                                                                          40 + index % 30)
+            }
+            for index in range(VARIANT_COUNT)
+        ]
+        run = Backtest(CachedMetric())
+
+        results = list(run.run(monitors, START + 3600, START + DAYS * 86400 - 60))
+        self.assertTrue(all(result['Alerts'] > 0 for result in results))
+
+        elapsed = min(timeit.repeat(lambda: list(run.run(monitors, START + 3600, START + DAYS * 86400 - 60)),
+                                    number=1, repeat=2))
+        print('{0} variants over {1} days: {2:.2f}s'.format(VARIANT_COUNT, DAYS, elapsed))
+
+        self.assertLess(elapsed, 10)
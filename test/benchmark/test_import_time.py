@@ -0,0 +1,27 @@
+"""
+Benchmark of dk_monitor's startup time
+"""
+from __future__ import print_function
+
+import os
+
+from unittest import TestCase
+
+from test.helpers.cli import time_command, BIN_DIR
+
+
+class ImportTimeBenchmark(TestCase):
+    """Benchmark of dk_monitor's startup time"""
+
+    def test_version_startup(self):
+        """dk_monitor --version starts much faster than importing the monitor engine"""
+        interpreter_time = time_command(['-c', 'pass'])
+        version_time = time_command([os.path.join(BIN_DIR, 'dk_monitor'), '--version'])
+        engine_time = time_command(['-c', 'import data_kennel.monitor, data_kennel.config, yaml, schema'])
+
+        print('interpreter: {0:.3f}s, dk_monitor --version: {1:.3f}s, engine import: {2:.3f}s'.format(
+            interpreter_time, version_time, engine_time))
+
+        # Compare the time spent on top of a bare interpreter, so that the noise of process startup on
+        # loaded CI hosts doesn't dominate.
+        self.assertLess(version_time - interpreter_time, (engine_time - interpreter_time) / 2)
@@ -0,0 +1,70 @@
+"""
+Benchmark of searching monitors
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import timeit
+
+from unittest import TestCase
+
+from data_kennel.search import SearchIndex
+
+MONITOR_COUNT = 50000
+METRICS = ['system.load.norm.5', 'system.cpu.user', 'system.disk.in_use', 'redis.mem.rss',
+           'kafka.consumer.lag', 'http.requests.errors', 'jvm.gc.pause', 'nginx.net.conn_dropped',
+           'aws.sqs.queue_depth']
+
+
+def _inventory():
+    """An inventory of tens of thousands of monitors, managed by Data Kennel or not"""
+    return [
+        {
+            'id': index,
+            'name': 'High {0} on service-{1}'.format(METRICS[index % len(METRICS)], index),
+            'type': 'metric alert',
+            'query': 'avg(last_5m):avg:{0}{{service:service-{1},env:prod}} by {{host}} > {2}'.format(
+                METRICS[index % len(METRICS)], index, index % 97),
+            'message': '{0} is high on {{{{host.name}}}}, see https://wiki/runbooks/{1} @slack-{2}'.format(
+                METRICS[index % len(METRICS)], index, index % 300),
+            'tags': ['team:team-{0}'.format(index % 300), 'env:prod'] + (
+                ['source:data_kennel'] if index % 2 else [])
+        }
+        for index in range(MONITOR_COUNT)
+    ]
+
+
+class SearchTimeBenchmark(TestCase):
+    """Benchmark of searching monitors"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_search_is_interactive(self):
+        """Searching the cached index of tens of thousands of monitors takes a fraction of a second"""
+        monitors = _inventory()
+        path = os.path.join(self.cache_dir, 'default.index')
+        build_time = min(timeit.repeat(lambda: SearchIndex(monitors).save(path), number=1, repeat=1))
+
+        def search(term, regex=False):
+            """Searches the cached index, like dk_monitor search"""
+            return list(SearchIndex.load(path).search(term, regex=regex))
+
+        self.assertEqual(len(search('service:service-4242,')), 1)
+        kafka_monitors = [index for index in range(MONITOR_COUNT)
+                          if METRICS[index % len(METRICS)] == 'kafka.consumer.lag']
+        self.assertEqual(len(search(r'kafka\.consumer\.lag\{service:service-\d+1,', regex=True)),
+                         len([index for index in kafka_monitors if index % 10 == 1]))
+
+        substring_time = min(timeit.repeat(lambda: search('system.load.norm'), number=1, repeat=3))
+        regex_time = min(timeit.repeat(lambda: search(r'runbooks/12\d\d\b', regex=True), number=1, repeat=3))
+        print('index build: {0:.2f}s, substring search: {1:.3f}s, regex search: {2:.3f}s'.format(
+            build_time, substring_time, regex_time))
+
+        self.assertLess(substring_time, 1)
+        self.assertLess(regex_time, 1)
@@ -0,0 +1,74 @@
+"""
+Benchmark of filtering monitors by tags
+"""
+from __future__ import print_function
+
+import timeit
+
+from unittest import TestCase
+from mock import MagicMock
+
+from data_kennel.monitor import Monitor
+from data_kennel.tag_query import TagIndex, TagQuery
+
+MONITOR_COUNT = 50000
+
+
+def _inventory():
+    """An inventory of tens of thousands of monitors with a few tags each"""
+    return [
+        {
+            'id': index,
+            'tags': ['source:data_kennel', 'team:team-{0}'.format(index % 50), 'env:{0}'.format(
+                ('prod', 'staging', 'qa')[index % 3]), 'service:svc-{0}'.format(index % 400)]
+        }
+        for index in range(MONITOR_COUNT)
+    ]
+
+
+class TagQueryTimeBenchmark(TestCase):
+    """Benchmark of filtering monitors by tags"""
+
+    def setUp(self):
+        self.monitors = _inventory()
+        self.monitor = Monitor(client=MagicMock())
+
+    def test_plain_tags_are_scanned(self):
+        """Filtering an inventory by plain tags, as get_monitors does, is no slower than a bare scan"""
+        user_tags = ['team:team-7', 'env:prod']
+
+        def scan():
+            """Filters like a list membership scan per tag per monitor"""
+            return [monitor for monitor in self.monitors if all(tag in monitor['tags'] for tag in user_tags)]
+
+        def get_monitors():
+            """Filters the inventory the way list, plan and sync do"""
+            return self.monitor.get_monitors({'team': 'team-7', 'env': 'prod'}, inventory=self.monitors)
+
+        self.assertEqual(get_monitors(), scan())
+
+        scan_time = min(timeit.repeat(scan, number=1, repeat=3))
+        filter_time = min(timeit.repeat(get_monitors, number=1, repeat=3))
+        print('scan: {0:.4f}s, get_monitors: {1:.4f}s'.format(scan_time, filter_time))
+
+        self.assertLess(filter_time, scan_time)
+
+    def test_expressions_use_the_index(self):
+        """Filtering an inventory by an expression, index build included, stays well under a second"""
+        query = TagQuery('team:team-7 AND (env:prod OR service:svc-1*) AND NOT muted')
+        index = TagIndex(self.monitors)
+
+        def get_monitors():
+            """Filters the inventory the way list and delete do with --tags expressions"""
+            return self.monitor.get_monitors(query, inventory=self.monitors)
+
+        self.assertEqual(get_monitors(), index.select(query.evaluate(index)))
+
+        filter_time = min(timeit.repeat(get_monitors, number=1, repeat=3))
+        build_time = min(timeit.repeat(lambda: TagIndex(self.monitors), number=1, repeat=3))
+        index_time = min(timeit.repeat(lambda: query.evaluate(index), number=1, repeat=3))
+        print('get_monitors: {0:.3f}s, of which index build: {1:.3f}s, query of a built index: {2:.6f}s'
+              .format(filter_time, build_time, index_time))
+
+        self.assertLess(filter_time, 1)
+        self.assertLess(index_time, 0.01)
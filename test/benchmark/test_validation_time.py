@@ -0,0 +1,62 @@
+"""
+Benchmark of config validation
+"""
+from __future__ import print_function
+
+import copy
+import timeit
+
+from unittest import TestCase
+
+from data_kennel.config import get_config_schema
+from data_kennel.validator import validate_config
+
+MONITOR_COUNT = 2000
+VARIABLE_SET_COUNT = 200
+
+
+def _large_config():
+    """A config with thousands of monitors, some with hundreds of variable sets"""
+    monitors = []
+    for index in range(MONITOR_COUNT):
+        monitor = {
+            'name': 'monitor {0} for ${{host}}'.format(index),
+            'query': 'avg(last_5m):avg:system.load.norm.5{{host:${{host}}}} > ${{critical}}',
+            'type': 'metric alert',
+            'message': 'Load is {{value}} on ${host}',
+            'notify': ['example@example.com', 'pager'],
+            'tags': {'index': index, 'host': '${host}'},
+            'options': {
+                'notify_no_data': 'true',
+                'no_data_timeframe': '10',
+                'renotify_interval': '${renotify}',
+                'thresholds': {'critical': '${critical}', 'warning': '1.5'}
+            }
+        }
+        if index % 100 == 0:
+            monitor['with_variables'] = [
+                {'host': 'host-{0}'.format(variable_set), 'critical': variable_set, 'renotify': 30}
+                for variable_set in range(VARIABLE_SET_COUNT)
+            ]
+        monitors.append(monitor)
+
+    return {'data_kennel': {'team': 'benchmark'}, 'monitors': monitors}
+
+
+class ValidationTimeBenchmark(TestCase):
+    """Benchmark of config validation"""
+
+    def test_validator_beats_schema(self):
+        """The config validator validates a large config much faster than the config schema"""
+        config = _large_config()
+        schema = get_config_schema()
+
+        self.assertEqual(validate_config(copy.deepcopy(config)), schema.validate(copy.deepcopy(config)))
+
+        schema_time = min(timeit.repeat(lambda: schema.validate(config), number=1, repeat=3))
+        validator_time = min(timeit.repeat(lambda: validate_config(config), number=1, repeat=3))
+
+        print('schema: {0:.3f}s, validator: {1:.3f}s ({2:.1f}x)'.format(
+            schema_time, validator_time, schema_time / validator_time))
+
+        self.assertLess(validator_time, schema_time / 3)
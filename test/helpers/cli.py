@@ -0,0 +1,53 @@
+"""
+Helpers for exercising the command line scripts in a fresh interpreter
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BIN_DIR = os.path.join(ROOT_DIR, 'bin')
+
+# Runs a script as __main__ and reports which modules it imported, even if it exited.
+_MODULES_SNIPPET = """
+import json, runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+
+def _environment():
+    """The environment for running scripts against this checkout"""
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, environment.get('PYTHONPATH')]))
+    return environment
+
+
+def imported_modules(script, *args):
+    """Runs a script from bin/ in a fresh interpreter and returns the names of the modules it imported"""
+    process = subprocess.Popen(
+        [sys.executable, '-c', _MODULES_SNIPPET, os.path.join(BIN_DIR, script)] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=_environment()
+    )
+    _, stderr = process.communicate()
+    return set(json.loads(stderr.decode('utf-8').splitlines()[-1]))
+
+
+def time_command(command, runs=5):
+    """Runs a command in a fresh interpreter several times and returns the fastest wall clock time"""
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call([sys.executable] + list(command), stdout=devnull, stderr=devnull,
+                            env=_environment())
+            timings.append(time.time() - start)
+    return min(timings)
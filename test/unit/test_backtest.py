@@ -0,0 +1,139 @@
+"""
+Tests of data_kennel.backtest
+"""
+from unittest import TestCase, skipIf
+
+from data_kennel import backtest
+from data_kennel.backtest import Backtest, UnsupportedQuery, parse_monitor_query
+
+START = 1496275200
+
+
+class FakeMetric(object):
+    """A Metric answering every metric query with the series given for it, recording the queries"""
+
+    def __init__(self, series):
+        self.series = series
+        self.queries = []
+
+    def query(self, query, start, end, **options):
+        """Answers with the points of the series of the query in the range"""
+        self.queries.append((query, start, end, options))
+        return [{'name': name, 'points': [point for point in points if start <= point[0] <= end]}
+                for name, points in self.series.get(query, [])]
+
+
+def _monitor(name, query, critical=None, monitor_type='metric alert'):
+    """A monitor as Config.get_monitors returns it"""
+    monitor = {'name': name, 'type': monitor_type, 'query': query, 'options': {}}
+    if critical is not None:
+        monitor['options']['thresholds'] = {'critical': critical}
+    return monitor
+
+
+class ParseMonitorQueryTests(TestCase):
+    """Tests of parsing monitor queries"""
+
+    def test_parse(self):
+        """The aggregation, window, metric query, comparator and threshold are parsed"""
+        parsed = parse_monitor_query('avg(last_1h):avg:system.load.norm.5{host:a,environment:prod} < -0.5')
+
+        self.assertEqual((parsed.aggregation, parsed.window, parsed.metric_query, parsed.comparator,
+                          parsed.threshold),
+                         ('avg', 3600, 'avg:system.load.norm.5{host:a,environment:prod}', '<', -0.5))
+
+    def test_unsupported(self):
+        """Queries with functions or several conditions can't be backtested"""
+        for query in ('avg(last_5m):avg:a{*} > 1 && avg(last_5m):avg:b{*} > 2',
+                      'pct_change(avg(last_5m),last_5m):avg:a{*} > 1',
+                      'avg(last_5m):anomalies(avg:a{*}, \'basic\', 2) >= 1',
+                      '"http.can_connect".over("*").last(2).count_by_status()'):
+            self.assertRaises(UnsupportedQuery, parse_monitor_query, query)
+
+
+@skipIf(backtest.numpy is None, 'numpy is not installed')
+class BacktestTests(TestCase):
+    """Tests of Backtest, which need numpy"""
+
+    def test_rolling(self):
+        """Windows are aggregated ignoring steps without data"""
+        numpy = backtest.numpy
+        values = numpy.array([[1.0, 5.0, numpy.nan, 3.0, numpy.nan, numpy.nan, 2.0]])
+
+        self.assertEqual(backtest.rolling(values, 'max', 3).tolist()[0][2:], [5.0, 5.0, 3.0, 3.0, 2.0])
+        self.assertEqual(backtest.rolling(values, 'min', 2).tolist()[0][1:5], [1.0, 5.0, 3.0, 3.0])
+        self.assertEqual(backtest.rolling(values, 'sum', 3).tolist()[0][:4], [1.0, 6.0, 6.0, 8.0])
+        averages = backtest.rolling(values, 'avg', 2)[0]
+        self.assertEqual([averages[3], averages[4], averages[6]], [3.0, 3.0, 2.0])
+        self.assertTrue(numpy.isnan(averages[5]))
+
+    def test_bin_points(self):
+        """Points of a step are binned as their sum and count, or their extreme"""
+        numpy = backtest.numpy
+        points = numpy.array([[0.0, 1.0], [30.0, 3.0], [60.0, numpy.nan], [150.0, 2.0], [400.0, 9.0]])
+
+        values, counts = backtest.bin_points(points, 'avg', 0, 60, 4)
+        self.assertEqual([values[0], values[2]], [4.0, 2.0])
+        self.assertTrue(numpy.isnan(values[[1, 3]]).all())
+        self.assertEqual(counts.tolist(), [2.0, 0.0, 1.0, 0.0])
+        self.assertEqual(backtest.bin_points(points, 'min', 0, 60, 4)[0][0], 1.0)
+        self.assertEqual(backtest.bin_points(points, 'max', 0, 60, 4)[0][0], 3.0)
+
+    def test_variants_in_one_pass(self):
+        """Every variant is backtested with its own threshold and comparator, and groups add up"""
+        minutes = range(0, 120)
+        # 0 for 10 minutes, then 10 for 10 minutes, and so on
+        points = [[START + minute * 60, float(minute // 10 % 2 * 10)] for minute in minutes]
+        metric = FakeMetric({
+            'avg:load{env:prod} by {host}': [('host:a', points), ('host:b', points)],
+            'avg:load{env:qa}': [('host:c', points)],
+            'avg:load{env:dev}': [('host:d', points)]
+        })
+        monitors = [
+            _monitor('prod', 'avg(last_2m):avg:load{env:prod} by {host} > 5'),
+            _monitor('qa', 'max(last_2m):avg:load{env:qa} > 50', critical='10'),
+            _monitor('dev', 'min(last_2m):avg:load{env:dev} < 5'),
+            _monitor('none', 'avg(last_2m):avg:load{env:none} > 5'),
+            _monitor('composite', '123 && 456', monitor_type='composite')
+        ]
+
+        results = {result['Name']: result
+                   for result in Backtest(metric).run(monitors, START + 600, START + 119 * 60)}
+
+        self.assertEqual((results['prod']['Alerts'], results['prod']['Recoveries']), (12, 10))
+        self.assertEqual(results['prod']['Groups'], 2)
+        self.assertEqual((results['qa']['Alerts'], results['qa']['Recoveries']), (0, 0))
+        # Already alerting when the range starts, which isn't an alert of the range
+        self.assertEqual((results['dev']['Alerts'], results['dev']['Recoveries']), (5, 6))
+        self.assertEqual(results['none']['Note'], 'no data')
+        self.assertIn('composite monitors', results['composite']['Note'])
+        self.assertEqual(len(metric.queries), 4)
+
+    def test_no_data_keeps_state(self):
+        """A monitor keeps alerting through a gap in its data"""
+        points = [[START + minute * 60, 10.0] for minute in range(0, 5)] + \
+            [[START + minute * 60, value] for minute, value in ((20, 10.0), (21, 0.0))]
+        metric = FakeMetric({'avg:load{*}': [('*', points)]})
+
+        results = list(Backtest(metric).run([_monitor('load', 'avg(last_1m):avg:load{*} >= 10')],
+                                            START, START + 30 * 60))
+
+        self.assertEqual((results[0]['Alerts'], results[0]['Recoveries']), (1, 1))
+
+    def test_points_of_a_step_aggregated(self):
+        """Every point of a step longer than the metric resolution counts towards the window"""
+        # Data from 15 minutes on, a spike of 100 in one 10 second point per minute and otherwise 0
+        points = [[START + second, 100.0 if second % 60 == 30 else 0.0] for second in range(900, 3600, 10)]
+        metric = FakeMetric({'avg:load{*}': [('*', points)]})
+        monitors = [_monitor('avg', 'avg(last_5m):avg:load{*} > 15'),
+                    _monitor('max', 'max(last_5m):avg:load{*} > 50'),
+                    _monitor('min', 'min(last_5m):avg:load{*} < 50'),
+                    _monitor('sum', 'sum(last_5m):avg:load{*} > 400')]
+
+        backtest_run = Backtest(metric, step=300, chunk=3600).run(monitors, START + 600, START + 2999)
+        results = {result['Name']: result for result in backtest_run}
+
+        # Every window averages 100/6, sums 500, and has a maximum of 100 and a minimum of 0
+        self.assertEqual([(results[name]['Alerts'], results[name]['Recoveries'])
+                          for name in ('avg', 'max', 'min', 'sum')], [(1, 0)] * 4)
+        self.assertEqual(metric.queries, [('avg:load{*}', START + 300, START + 2999, {'chunk': 3600})])
@@ -0,0 +1,136 @@
+"""
+Tests of data_kennel.client
+"""
+from unittest import TestCase
+from mock import MagicMock
+
+from data_kennel.client import HttpMonitorClient, HttpDowntimeClient, HttpMetricClient, HttpEventClient
+
+
+class DataKennelHttpMonitorClientTests(TestCase):
+    """Tests of Data Kennel's HttpMonitorClient"""
+
+    def setUp(self):
+        self.client = HttpMonitorClient('mock_api_key', 'mock_app_key', api_host='https://mock.host/')
+        self.client.session = MagicMock()
+        self.response = self.client.session.request.return_value
+        self.response.status_code = 200
+
+    def test_credentials(self):
+        """Credentials are sent as headers of the client's own session"""
+        client = HttpMonitorClient('mock_api_key', 'mock_app_key')
+
+        self.assertEqual(client.session.headers['DD-API-KEY'], 'mock_api_key')
+        self.assertEqual(client.session.headers['DD-APPLICATION-KEY'], 'mock_app_key')
+
+    def test_get_all(self):
+        """Tag lists are sent comma separated"""
+        self.response.json.return_value = [{'id': 1}]
+
+        self.assertEqual(self.client.get_all(monitor_tags=['team:a', 'source:data_kennel']), [{'id': 1}])
+        self.client.session.request.assert_called_once_with(
+            'GET', 'https://mock.host/api/v1/monitor', params={'monitor_tags': 'team:a,source:data_kennel'},
+            json=None, timeout=60
+        )
+
+    def test_update(self):
+        """Monitors are updated by their id"""
+        self.response.json.return_value = {'id': 1, 'name': 'mock'}
+
+        self.client.update(id=1, name='mock')
+
+        self.client.session.request.assert_called_once_with(
+            'PUT', 'https://mock.host/api/v1/monitor/1', params=None, json={'id': 1, 'name': 'mock'},
+            timeout=60
+        )
+
+    def test_errors_are_returned(self):
+        """Errors are returned like the datadog package does, rather than raised"""
+        self.response.status_code = 403
+        self.response.reason = 'Forbidden'
+        self.response.json.side_effect = ValueError
+
+        self.assertEqual(self.client.delete(1), {'errors': ['403 Forbidden']})
+
+    def test_validate(self):
+        """Monitors are validated without being created"""
+        self.response.json.return_value = {}
+
+        self.assertEqual(self.client.validate(name='mock'), {})
+        self.client.session.request.assert_called_once_with(
+            'POST', 'https://mock.host/api/v1/monitor/validate', params=None, json={'name': 'mock'},
+            timeout=60
+        )
+
+
+class DataKennelHttpDowntimeClientTests(TestCase):
+    """Tests of Data Kennel's HttpDowntimeClient"""
+
+    def setUp(self):
+        self.client = HttpDowntimeClient('mock_api_key', 'mock_app_key', api_host='https://mock.host/')
+        self.client.session = MagicMock()
+        self.response = self.client.session.request.return_value
+        self.response.status_code = 200
+
+    def test_update(self):
+        """Downtimes are updated by their id"""
+        self.response.json.return_value = {'id': 1, 'scope': ['*']}
+
+        self.client.update(1, scope=['*'])
+
+        self.client.session.request.assert_called_once_with(
+            'PUT', 'https://mock.host/api/v1/downtime/1', params=None, json={'scope': ['*']}, timeout=60
+        )
+
+    def test_delete(self):
+        """Cancelling a downtime answers with no content"""
+        self.response.status_code = 204
+        self.response.json.side_effect = ValueError
+
+        self.assertEqual(self.client.delete(1), {})
+        self.client.session.request.assert_called_once_with(
+            'DELETE', 'https://mock.host/api/v1/downtime/1', params=None, json=None, timeout=60
+        )
+
+
+class DataKennelHttpMetricClientTests(TestCase):
+    """Tests of Data Kennel's HttpMetricClient"""
+
+    def setUp(self):
+        self.client = HttpMetricClient('mock_api_key', 'mock_app_key', api_host='https://mock.host/')
+        self.client.session = MagicMock()
+        self.response = self.client.session.request.return_value
+        self.response.status_code = 200
+
+    def test_query(self):
+        """Metric queries are made over a time range"""
+        self.response.json.return_value = {'status': 'ok', 'series': []}
+
+        response = self.client.query(1000, 2000, 'avg:system.cpu.user{*}')
+
+        self.assertEqual(response, {'status': 'ok', 'series': []})
+        self.client.session.request.assert_called_once_with(
+            'GET', 'https://mock.host/api/v1/query', json=None, timeout=60,
+            params={'from': 1000, 'to': 2000, 'query': 'avg:system.cpu.user{*}'}
+        )
+
+
+class DataKennelHttpEventClientTests(TestCase):
+    """Tests of Data Kennel's HttpEventClient"""
+
+    def setUp(self):
+        self.client = HttpEventClient('mock_api_key', 'mock_app_key', api_host='https://mock.host/')
+        self.client.session = MagicMock()
+        self.response = self.client.session.request.return_value
+        self.response.status_code = 202
+
+    def test_create(self):
+        """Events are posted one at a time"""
+        self.response.json.return_value = {'status': 'ok', 'event': {'id': 1, 'title': 'Deploy'}}
+
+        self.client.create(title='Deploy', text='', tags=['service:db'])
+
+        self.client.session.request.assert_called_once_with(
+            'POST', 'https://mock.host/api/v1/events', params=None, timeout=60,
+            json={'title': 'Deploy', 'text': '', 'tags': ['service:db']}
+        )
@@ -3,11 +3,15 @@ Tests of data_kennel.config
 """
 from unittest import TestCase
 
+import copy
+import os
 import random
+import shutil
+import tempfile
 import mock
 
 from schema import SchemaError
-from data_kennel.config import Config
+from data_kennel.config import Config, get_shard, peek_team
 
 
 MOCK_API_KEY = "".join(random.choice('1234567890ABCDEF') for _ in range(20))
@@ -312,3 +316,256 @@ class DataKennelConfigTests(TestCase):
         config = Config(config_list=MOCK_CONFIG)
 
         self.assertRaises(Exception, getattr, config, 'app_key')
+
+    def test_shared_sub_monitors(self):
+        """Verify sub-monitors with identical conditions are named after their content when shared"""
+        shared_config = copy.deepcopy(MOCK_COMPOSITE_CONFIG)
+        shared_config[0]['data_kennel']['share_sub_monitors'] = True
+        shared_config[0]['monitors'][0]['query'] = "mock_query_${foo_1} && mock_query_shared"
+        config = Config(config_list=shared_config)
+
+        monitors = config.get_monitors()
+        sub_monitors = [config.get_sub_monitor(monitor) for monitor in monitors]
+
+        self.assertNotEqual(sub_monitors[0][0]['name'], sub_monitors[1][0]['name'])
+        self.assertEqual(sub_monitors[0][1]['name'], sub_monitors[1][1]['name'])
+        self.assertTrue(sub_monitors[0][1]['name'].startswith('[DK-C] mock_team_1 | '))
+        self.assertIn('dk_shared:true', sub_monitors[0][1]['tags'])
+
+    def test_shared_sub_monitor_queries(self):
+        """Verify shared sub-monitors ignore whitespace differences in their queries"""
+        shared_config = copy.deepcopy(MOCK_COMPOSITE_CONFIG)
+        shared_config[0]['data_kennel']['share_sub_monitors'] = True
+        config = Config(config_list=shared_config)
+        monitor = config.get_monitors()[0]
+
+        spaced_monitor = dict(monitor, query=monitor['query'].replace(' ', '   '))
+
+        self.assertEqual(
+            [sub_monitor['name'] for sub_monitor in config.get_sub_monitor(monitor)],
+            [sub_monitor['name'] for sub_monitor in config.get_sub_monitor(spaced_monitor)]
+        )
+
+    @mock.patch.dict('os.environ', {'DATADOG_API_KEY_EU_ORG': 'eu_api',
+                                    'DATA_KENNEL_APP_KEY_EU_ORG': 'eu_app'})
+    def test_for_org(self):
+        """Verify an org's config only has the org's teams and uses the org's credentials"""
+        org_config = copy.deepcopy(MOCK_MULTI_TEAM_CONFIG)
+        org_config[-1]['data_kennel']['org'] = 'eu-org'
+        config = Config(config_list=org_config, api_key=MOCK_API_KEY, app_key=MOCK_APP_KEY)
+
+        self.assertEqual(config.orgs, ['default', 'eu-org'])
+
+        default_config = config.for_org('default')
+        self.assertEqual(default_config.teams, [MOCK_TEAM_1])
+        self.assertEqual(default_config.api_key, MOCK_API_KEY)
+
+        eu_config = config.for_org('eu-org')
+        self.assertEqual(eu_config.teams, [MOCK_TEAM_2])
+        self.assertEqual((eu_config.api_key, eu_config.app_key), ('eu_api', 'eu_app'))
+        self.assertItemsEqual(config.teams, [MOCK_TEAM_1, MOCK_TEAM_2])
+
+    def test_team_in_two_orgs(self):
+        """Verify a team can't be configured for two orgs"""
+        org_config = copy.deepcopy(MOCK_CONFIG) + copy.deepcopy(MOCK_CONFIG)
+        org_config[1]['data_kennel']['org'] = 'other_org'
+
+        self.assertRaises(Exception, Config, config_list=org_config)
+
+
+class DataKennelShardTests(TestCase):
+    """Tests of sharding Data Kennel's Config by team"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write(self, name, content):
+        """Writes a config file into the config directory"""
+        path = os.path.join(self.config_dir, name)
+        with open(path, 'w') as config_file:
+            config_file.write(content)
+        return path
+
+    def test_get_shard(self):
+        """Verify every team is assigned to exactly one shard, the same one every time"""
+        teams = ['team_{0}'.format(i) for i in range(60)]
+        shards = [get_shard(team, 4) for team in teams]
+
+        self.assertEqual(shards, [get_shard(team, 4) for team in teams])
+        self.assertEqual(set(shards), set([1, 2, 3, 4]))
+        self.assertEqual(get_shard('mock_team', 1), 1)
+
+    def test_peek_team(self):
+        """Verify the team is read from plain team lines of the data_kennel section only"""
+        plain = self._write('plain.yml', '# comment\ndata_kennel:\n    team: "mock_team"  # a comment\n')
+        monitors_first = self._write('monitors_first.yml',
+                                     'monitors:\n  - team: other\ndata_kennel:\n  team: mock_team\n')
+        flow = self._write('flow.yml', 'data_kennel: {team: mock_team}\n')
+
+        self.assertEqual(peek_team(plain), 'mock_team')
+        self.assertEqual(peek_team(monitors_first), 'mock_team')
+        self.assertIsNone(peek_team(flow))
+
+    def test_config_dir_shard(self):
+        """Verify a shard only parses the config files of its teams"""
+        teams = ['team_{0}'.format(i) for i in range(8)]
+        for team in teams:
+            if get_shard(team, 2) == 1:
+                content = 'data_kennel:\n    team: {0}\nmonitors: []\n'.format(team)
+            else:
+                # Invalid, so that parsing it would fail
+                content = 'data_kennel:\n    team: {0}\nmonitors: [\n'.format(team)
+            self._write(team + '.yml', content)
+
+        config = Config(config_dir=self.config_dir, shard=(1, 2))
+
+        self.assertItemsEqual(config.teams, [team for team in teams if get_shard(team, 2) == 1])
+
+    def test_config_list_shard(self):
+        """Verify shards of parsed configs cover every team exactly once"""
+        config_list = copy.deepcopy(MOCK_MULTI_TEAM_CONFIG)
+        shard_teams = [Config(config_list=config_list, shard=(index, 3)).teams for index in (1, 2, 3)]
+
+        self.assertItemsEqual(sum(shard_teams, []), [MOCK_TEAM_1, MOCK_TEAM_2])
+
+
+MOCK_MATRIX_CONFIG = [
+    {
+        "data_kennel": {
+            "team": MOCK_TEAM_1
+        },
+        "monitors": [
+            {
+                "name": "load on ${hostclass} in ${environment} ${direction}",
+                "query": "mock_query_${hostclass}_${environment}_${direction}",
+                "type": "metric alert",
+                "message": "mock_message",
+                "tags": {
+                    "hostclass": "${hostclass}",
+                    "environment": "${environment}",
+                    "kind": "load"
+                },
+                "variable_matrix": {
+                    "axes": {
+                        "hostclass": ["web", "db", "cache"],
+                        "environment": ["qa", "prod"],
+                        "direction": ["in", "out"]
+                    },
+                    "exclude": [
+                        {"hostclass": "cache", "environment": "qa"}
+                    ]
+                }
+            }
+        ]
+    }
+]
+
+
+class DataKennelVariableMatrixTests(TestCase):
+    """Tests of expanding variable matrices of Data Kennel's Config"""
+
+    def setUp(self):
+        self.config = Config(config_list=MOCK_MATRIX_CONFIG)
+
+    def test_expansion(self):
+        """Verify every combination of the axes is expanded, except excluded ones"""
+        names = [monitor['name'] for monitor in self.config.get_monitors()]
+
+        self.assertEqual(len(names), 10)
+        self.assertEqual(len(set(names)), 10)
+        self.assertIn('[DK] mock_team_1 | load on cache in prod out', names)
+        self.assertNotIn('[DK] mock_team_1 | load on cache in qa out', names)
+
+    def test_tags_prune_combinations(self):
+        """Verify combinations that can't match the tags are never interpolated"""
+        with mock.patch.object(self.config, '_interpolate_monitor',
+                               wraps=self.config._interpolate_monitor) as interpolate:
+            monitors = self.config.get_monitors({'hostclass': 'db', 'environment': 'prod'})
+
+        self.assertEqual([monitor['name'] for monitor in monitors],
+                         ['[DK] mock_team_1 | load on db in prod in',
+                          '[DK] mock_team_1 | load on db in prod out'])
+        self.assertEqual(interpolate.call_count, 2)
+
+    def test_unmatchable_tags_prune_monitor(self):
+        """Verify a monitor whose fixed tags can't match isn't expanded at all"""
+        self.assertEqual(self.config.get_monitors({'kind': 'latency'}), [])
+        self.assertEqual(self.config.get_monitors({'unknown': 'tag'}), [])
+        self.assertEqual(len(self.config.get_monitors({'kind': 'load', 'team': MOCK_TEAM_1})), 10)
+        self.assertIsNone(self.config._get_variable_constraints(
+            MOCK_MATRIX_CONFIG[0]['monitors'][0], MOCK_TEAM_1, {'kind': 'latency'}))
+
+
+VARIABLES_FILE_CONFIG = """
+data_kennel:
+    team: mock_team_1
+monitors:
+  - name: "load on ${{hostclass}} in ${{environment}}"
+    type: "metric alert"
+    query: "mock_query_${{hostclass}}_${{environment}}"
+    message: "mock_message"
+    tags:
+        hostclass: "${{hostclass}}"
+    with_variables_file: {0}
+"""
+
+
+class DataKennelVariablesFileTests(TestCase):
+    """Tests of reading variables from variables files in Data Kennel's Config"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write(self, name, content):
+        """Writes a file of the config directory"""
+        path = os.path.join(self.config_dir, name)
+        with open(path, 'w') as written_file:
+            written_file.write(content)
+        return path
+
+    def _config(self, variables_file):
+        """Writes a config file with a monitor reading the variables file, and loads it"""
+        return Config(config_path=self._write('team.yml', VARIABLES_FILE_CONFIG.format(variables_file)))
+
+    def test_csv(self):
+        """Verify a CSV variables file is read relative to the config file, a monitor per row"""
+        self._write('hosts.csv', 'hostclass,environment\nweb,qa\ndb,prod\n')
+        config = self._config('hosts.csv')
+
+        self.assertEqual([monitor['name'] for monitor in config.get_monitors()],
+                         ['[DK] mock_team_1 | load on web in qa', '[DK] mock_team_1 | load on db in prod'])
+        self.assertEqual(config.data_files, [os.path.join(self.config_dir, 'hosts.csv')])
+
+    def test_jsonl(self):
+        """Verify a JSONL variables file is read an object per line"""
+        self._write('hosts.jsonl', '{"hostclass": "web", "environment": "qa"}\n\n'
+                                   '{"hostclass": "db", "environment": "prod"}\n')
+        config = self._config('hosts.jsonl')
+
+        self.assertEqual(len(config.get_monitors()), 2)
+
+    def test_tags_filter_rows(self):
+        """Verify rows that can't match the tags are skipped before being interpolated"""
+        self._write('hosts.csv', 'hostclass,environment\nweb,qa\ndb,prod\nweb,prod\n')
+        config = self._config('hosts.csv')
+
+        with mock.patch.object(config, '_interpolate_monitor',
+                               wraps=config._interpolate_monitor) as interpolate:
+            monitors = config.get_monitors({'hostclass': 'web'})
+
+        self.assertEqual([monitor['name'] for monitor in monitors],
+                         ['[DK] mock_team_1 | load on web in qa', '[DK] mock_team_1 | load on web in prod'])
+        self.assertEqual(interpolate.call_count, 2)
+
+    def test_unsupported_file(self):
+        """Verify variables files other than CSV and JSONL are rejected"""
+        self._write('hosts.txt', 'web\n')
+        config = self._config('hosts.txt')
+
+        self.assertRaises(Exception, config.get_monitors)
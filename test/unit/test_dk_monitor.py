@@ -0,0 +1,48 @@
+"""
+Tests of the dk_monitor script
+"""
+from unittest import TestCase
+
+from test.helpers.cli import imported_modules
+
+HEAVY_MODULES = ['datadog', 'requests', 'yaml', 'schema', 'data_kennel.config', 'data_kennel.monitor']
+
+
+class DkMonitorTests(TestCase):
+    """Tests of the dk_monitor script"""
+
+    def test_version_is_cheap(self):
+        """--version doesn't import the modules only needed by commands"""
+        modules = imported_modules('dk_monitor', '--version')
+
+        self.assertIn('docopt', modules)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_help_is_cheap(self):
+        """--help doesn't import the modules only needed by commands"""
+        modules = imported_modules('dk_monitor', '--help')
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_downtime_help_is_cheap(self):
+        """dk_downtime --help doesn't import the modules only needed by commands either"""
+        modules = imported_modules('dk_downtime', '--help')
+
+        for module in HEAVY_MODULES + ['data_kennel.downtime']:
+            self.assertNotIn(module, modules)
+
+    def test_metric_help_is_cheap(self):
+        """dk_metric --help doesn't import the modules only needed by commands either"""
+        modules = imported_modules('dk_metric', '--help')
+
+        for module in HEAVY_MODULES + ['data_kennel.metric']:
+            self.assertNotIn(module, modules)
+
+    def test_event_help_is_cheap(self):
+        """dk_event --help doesn't import the modules only needed by commands either"""
+        modules = imported_modules('dk_event', '--help')
+
+        for module in HEAVY_MODULES + ['data_kennel.event']:
+            self.assertNotIn(module, modules)
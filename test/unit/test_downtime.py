@@ -0,0 +1,198 @@
+"""
+Tests of data_kennel.downtime
+"""
+from unittest import TestCase
+from mock import MagicMock, patch
+
+from data_kennel.config import Config
+from data_kennel.downtime import Downtime, parse_marker
+
+MOCK_TEAM_1 = "mock_team"
+MOCK_TEAM_2 = "mock_team2"
+
+# Far enough in the future that the downtimes of these tests haven't ended
+FUTURE = 4102444800
+
+MOCK_CONFIG = [
+    {
+        "data_kennel": {
+            "team": MOCK_TEAM_1
+        },
+        "monitors": [],
+        "downtimes": [
+            {
+                "name": "db maintenance",
+                "scope": ["environment:production", "hostclass:db"],
+                "monitor_tags": {"service": "db"},
+                "end": FUTURE,
+                "message": "Upgrading the database"
+            },
+            {
+                "name": "forever"
+            },
+            {
+                "name": "already over",
+                "end": 1000
+            }
+        ]
+    },
+    {
+        "data_kennel": {
+            "team": MOCK_TEAM_2
+        },
+        "monitors": []
+    }
+]
+
+DB_DOWNTIME = {
+    'scope': ['environment:production', 'hostclass:db'],
+    'monitor_tags': ['service:db', 'source:data_kennel', 'team:mock_team'],
+    'message': '[DK] mock_team | db maintenance\nUpgrading the database',
+    'end': FUTURE
+}
+FOREVER_DOWNTIME = {
+    'scope': ['*'],
+    'monitor_tags': ['source:data_kennel', 'team:mock_team'],
+    'message': '[DK] mock_team | forever',
+    'end': None
+}
+
+
+def _real(downtime_id, downtime, **fields):
+    """A downtime as Datadog returns it"""
+    real_downtime = dict(downtime, id=downtime_id, active=True, canceled=None, disabled=False)
+    real_downtime.update(fields)
+    return real_downtime
+
+
+# pylint: disable=unused-argument
+@patch('datadog.api.Downtime')
+class DataKennelDowntimeTests(TestCase):
+    """Tests of Data Kennel's Downtime"""
+
+    @patch('datadog.initialize', MagicMock())
+    def setUp(self):
+        self.config = Config(config_list=MOCK_CONFIG)
+        self.downtime = Downtime(config=self.config)
+
+    def test_config_downtimes(self, downtime_api):
+        """Configured downtimes only mute their team's monitors and are marked with their team and name"""
+        self.assertEqual(self.config.get_downtimes()[:2], [DB_DOWNTIME, FOREVER_DOWNTIME])
+        self.assertEqual(self.config.get_downtimes(tags={'service': 'db'}), [DB_DOWNTIME])
+        self.assertEqual(parse_marker(DB_DOWNTIME), ('configured', MOCK_TEAM_1, 'db maintenance'))
+        self.assertIsNone(parse_marker({'message': 'muted by hand'}))
+
+    def test_update_schedules_downtimes(self, downtime_api):
+        """Configured downtimes that aren't scheduled are, unless they already ended"""
+        downtime_api.get_all.return_value = []
+        downtime_api.create.side_effect = lambda **downtime: dict(downtime, id=1)
+
+        report = self.downtime.update()
+
+        self.assertEqual(report.summary()['created'], ['[DK] mock_team | db maintenance',
+                                                       '[DK] mock_team | forever'])
+        self.assertEqual(downtime_api.create.call_count, 2)
+        downtime_api.create.assert_any_call(**DB_DOWNTIME)
+
+    def test_update_is_idempotent(self, downtime_api):
+        """Scheduled downtimes are left alone, changed ones are updated and unconfigured ones cancelled"""
+        downtime_api.get_all.return_value = [
+            _real(1, DB_DOWNTIME, start=1000, timezone='UTC',
+                  scope=['hostclass:db', 'environment:production']),
+            _real(2, FOREVER_DOWNTIME, scope=['environment:staging']),
+            _real(3, FOREVER_DOWNTIME, message='[DK] mock_team | removed'),
+            _real(4, FOREVER_DOWNTIME, message='[DK-S] mock_team | by hand'),
+            _real(5, FOREVER_DOWNTIME, message='muted by someone else'),
+            _real(6, FOREVER_DOWNTIME, message='[DK] other_team | not ours'),
+            _real(7, FOREVER_DOWNTIME, message='[DK] mock_team | cancelled', canceled=1000),
+            _real(8, FOREVER_DOWNTIME, message='[DK] mock_team | ended', end=1000)
+        ]
+
+        report = self.downtime.update()
+
+        self.assertEqual(report.summary(), {
+            'created': [],
+            'updated': ['[DK] mock_team | forever'],
+            'unchanged': ['[DK] mock_team | db maintenance'],
+            'cancelled': ['[DK] mock_team | removed']
+        })
+        downtime_api.update.assert_called_once_with(2, **FOREVER_DOWNTIME)
+        downtime_api.delete.assert_called_once_with(3)
+        downtime_api.create.assert_not_called()
+
+    def test_update_cancels_duplicates(self, downtime_api):
+        """Only the newest downtime with a marker is kept"""
+        downtime_api.get_all.return_value = [_real(2, FOREVER_DOWNTIME), _real(1, FOREVER_DOWNTIME),
+                                             _real(3, DB_DOWNTIME)]
+
+        report = self.downtime.update()
+
+        self.assertEqual(sorted(downtime['id'] for downtime in report.unchanged), [2, 3])
+        downtime_api.delete.assert_called_once_with(1)
+
+    def test_update_dry_run(self, downtime_api):
+        """Nothing is written in a dry run"""
+        downtime_api.get_all.return_value = [_real(3, FOREVER_DOWNTIME, message='[DK] mock_team | removed')]
+
+        report = self.downtime.update(dry_run=True)
+
+        self.assertEqual(len(report.created), 2)
+        self.assertEqual(len(report.cancelled), 1)
+        downtime_api.create.assert_not_called()
+        downtime_api.delete.assert_not_called()
+
+    def test_update_raises_errors(self, downtime_api):
+        """Errors returned by Datadog fail the update"""
+        downtime_api.get_all.return_value = []
+        downtime_api.create.return_value = {'errors': ['Invalid scope']}
+
+        self.assertRaises(Exception, self.downtime.update)
+
+    def test_schedule(self, downtime_api):
+        """Scheduling a downtime creates it, or updates the one with the same name"""
+        downtime_api.get_all.return_value = []
+        downtime_api.create.side_effect = lambda **downtime: dict(downtime, id=1)
+
+        self.downtime.schedule(MOCK_TEAM_2, 'deploy', scope=['host:a'], monitor_tags={'service': 'api'},
+                               start=1000, end=FUTURE, message='Deploying')
+
+        downtime_api.create.assert_called_once_with(
+            scope=['host:a'], monitor_tags=['service:api', 'source:data_kennel', 'team:mock_team2'],
+            message='[DK-S] mock_team2 | deploy\nDeploying', start=1000, end=FUTURE
+        )
+
+        downtime_api.get_all.return_value = [_real(1, FOREVER_DOWNTIME, message='[DK-S] mock_team2 | deploy')]
+        self.downtime.schedule(MOCK_TEAM_2, 'deploy')
+
+        downtime_api.update.assert_called_once_with(
+            1, scope=['*'], monitor_tags=['source:data_kennel', 'team:mock_team2'],
+            message='[DK-S] mock_team2 | deploy', end=None
+        )
+        self.assertRaises(Exception, self.downtime.schedule, 'unknown_team', 'deploy')
+
+    def test_cancel(self, downtime_api):
+        """Downtimes scheduled by Data Kennel are cancelled by team, name, scope and monitor tags"""
+        downtime_api.get_all.return_value = [
+            _real(1, DB_DOWNTIME),
+            _real(2, FOREVER_DOWNTIME),
+            _real(3, FOREVER_DOWNTIME, message='[DK-S] mock_team2 | deploy', scope=['host:a', 'host:b']),
+            _real(4, FOREVER_DOWNTIME, message='muted by someone else')
+        ]
+
+        self.downtime.cancel(scopes=['hostclass:db'])
+        self.downtime.cancel(tags={'service': 'db'}, dry_run=True)
+        self.downtime.cancel(team=MOCK_TEAM_2, scopes=['host:b'])
+
+        self.assertEqual(sorted(call[0][0] for call in downtime_api.delete.call_args_list), [1, 3])
+
+    def test_list(self, downtime_api):
+        """Downtimes are listed with their team, name and kind"""
+        downtime_api.get_all.return_value = [
+            _real(1, DB_DOWNTIME, start=1496354400),
+            _real(4, FOREVER_DOWNTIME, message='muted by someone else')
+        ]
+
+        rows = list(self.downtime.list(columns=['Id', 'Team', 'Name', 'Kind', 'Start', 'End']))
+
+        self.assertEqual(rows, [{'Id': 1, 'Team': MOCK_TEAM_1, 'Name': 'db maintenance', 'Kind': 'configured',
+                                 'Start': '2017-06-01T22:00:00Z', 'End': '2100-01-01T00:00:00Z'}])
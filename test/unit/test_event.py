@@ -0,0 +1,143 @@
+"""
+Tests of data_kennel.event
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from unittest import TestCase
+from mock import patch
+
+from data_kennel.event import EventEmitter
+
+
+class FakeEventClient(object):
+    """An event client that can be held up, failing with the given responses or exceptions first"""
+
+    def __init__(self, failures=None):
+        self.lock = threading.Lock()
+        self.sending = threading.Event()
+        self.released = threading.Event()
+        self.released.set()
+        self.events = []
+        self.failures = list(failures or [])
+
+    def create(self, **event):
+        """Records an event once released, unless the next failure is due"""
+        self.sending.set()
+        self.released.wait()
+        with self.lock:
+            if self.failures:
+                failure = self.failures.pop(0)
+                if isinstance(failure, Exception):
+                    raise failure
+                return failure
+            self.events.append(event)
+        return {'status': 'ok', 'event': event}
+
+
+# pylint: disable=unused-argument
+@patch('time.sleep')
+class DataKennelEventEmitterTests(TestCase):
+    """Tests of Data Kennel's EventEmitter"""
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def test_emit_does_not_wait(self, mock_sleep):
+        """Events are sent in the background, in batches of the events queued while a batch is sent"""
+        client = FakeEventClient()
+        client.released.clear()
+        emitter = EventEmitter(client)
+
+        for index in range(5):
+            emitter.emit('Sync {0}'.format(index), tags=['team:astronauts'])
+
+        self.assertEqual(client.events, [])
+        self.assertFalse(emitter.flush(timeout=0.01))
+        client.released.set()
+
+        self.assertTrue(emitter.flush(timeout=5))
+        self.assertEqual(sorted(event['title'] for event in client.events),
+                         ['Sync {0}'.format(index) for index in range(5)])
+        self.assertEqual(client.events[0]['tags'], ['team:astronauts'])
+        self.assertEqual(emitter.sent, 5)
+        self.assertTrue(emitter.close())
+        self.assertRaises(Exception, emitter.emit, 'Too late')
+
+    def test_retries_with_backoff(self, mock_sleep):
+        """Failed and rate limited requests are retried with exponential backoff"""
+        client = FakeEventClient([IOError('Connection refused'), {'errors': ['429 Too Many Requests']}])
+        emitter = EventEmitter(client, retries=3, backoff=0.5)
+
+        emitter.emit('Deploy')
+        emitter.close()
+
+        self.assertEqual(emitter.sent, 1)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list], [0.5, 1.0])
+
+    def test_rejected_events_are_dropped(self, mock_sleep):
+        """Events Datadog rejects aren't retried or spooled"""
+        client = FakeEventClient([{'errors': ['Event title is required']}])
+        emitter = EventEmitter(client, spool_dir=self.spool_dir)
+
+        emitter.emit('')
+        emitter.close()
+
+        self.assertEqual((emitter.sent, emitter.dropped, emitter.spooled), (0, 1, 0))
+        mock_sleep.assert_not_called()
+
+    def test_spool_and_replay(self, mock_sleep):
+        """Events that can't be sent are spooled, and replayed once Datadog is reachable"""
+        client = FakeEventClient([IOError('Connection refused')] * 2)
+        emitter = EventEmitter(client, retries=1, spool_dir=self.spool_dir)
+
+        emitter.emit('Deploy', text='Version 2', aggregation_key='deploy')
+        emitter.close()
+
+        self.assertEqual(emitter.spooled, 1)
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+        self.assertEqual(EventEmitter(client, spool_dir=self.spool_dir).replay_spool(), 1)
+        self.assertEqual(client.events[0]['aggregation_key'], 'deploy')
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_close_spools_unsent_events(self, mock_sleep):
+        """Events still being sent or queued when closing times out are spooled rather than lost"""
+        client = FakeEventClient()
+        client.released.clear()
+        emitter = EventEmitter(client, batch_size=1, spool_dir=self.spool_dir)
+
+        emitter.emit('First')
+        client.sending.wait(5)
+        emitter.emit('Second')
+
+        self.assertFalse(emitter.close(timeout=0.01))
+        self.assertEqual(emitter.spooled, 2)
+
+        client.released.set()
+        emitter._sender.join(5)  # pylint: disable=protected-access
+        self.assertEqual(emitter.spooled, 2)
+        self.assertEqual(EventEmitter(client, spool_dir=self.spool_dir).replay_spool(), 2)
+        self.assertEqual([event['title'] for event in client.events], ['First', 'First', 'Second'])
+
+    def test_close_drops_unsent_events(self, mock_sleep):
+        """Without a spool directory, events being sent when closing times out are counted as dropped"""
+        client = FakeEventClient(failures=[{'errors': ['500 Internal Server Error']}] * 4)
+        client.released.clear()
+        emitter = EventEmitter(client)
+
+        emitter.emit('First')
+        client.sending.wait(5)
+
+        self.assertFalse(emitter.close(timeout=0.01))
+        self.assertEqual(emitter.dropped, 1)
+
+        client.released.set()
+        emitter._sender.join(5)  # pylint: disable=protected-access
+        self.assertEqual(emitter.dropped, 1)
+        self.assertEqual(client.events, [])
@@ -0,0 +1,67 @@
+"""
+Tests of data_kennel.journal
+"""
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from data_kennel.journal import SyncJournal
+
+MONITOR = {'name': 'mock_monitor', 'query': 'mock_query'}
+
+
+class DataKennelSyncJournalTests(TestCase):
+    """Tests of Data Kennel's SyncJournal"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        """Operations of an incomplete journal are looked up when resuming"""
+        journal = SyncJournal(self.path)
+        journal.record('created', MONITOR, dict(MONITOR, id=1))
+        journal.close()
+
+        resumed = SyncJournal(self.path, resume=True)
+
+        self.assertEqual(resumed.lookup(MONITOR)['monitor'], dict(MONITOR, id=1))
+        self.assertIsNone(resumed.lookup(dict(MONITOR, query='changed_query')))
+
+    def test_without_resume(self):
+        """A journal that isn't resumed starts empty"""
+        journal = SyncJournal(self.path)
+        journal.record('created', MONITOR, dict(MONITOR, id=1))
+        journal.close()
+
+        self.assertIsNone(SyncJournal(self.path).lookup(MONITOR))
+
+    def test_complete_journal(self):
+        """Resuming from a complete journal starts over"""
+        journal = SyncJournal(self.path)
+        journal.record('created', MONITOR, dict(MONITOR, id=1))
+        journal.complete()
+
+        self.assertIsNone(SyncJournal(self.path, resume=True).lookup(MONITOR))
+
+    def test_truncated_line(self):
+        """A line cut short by an interruption is skipped, and later lines are still readable"""
+        journal = SyncJournal(self.path)
+        journal.record('created', MONITOR, dict(MONITOR, id=1))
+        journal.close()
+        with open(self.path, 'a') as journal_file:
+            journal_file.write('{"op": "crea')
+
+        resumed = SyncJournal(self.path, resume=True)
+        other_monitor = {'name': 'other_monitor', 'query': 'other_query'}
+        resumed.record('updated', other_monitor, dict(other_monitor, id=2))
+        resumed.close()
+
+        reread = SyncJournal(self.path, resume=True)
+        self.assertEqual(reread.lookup(MONITOR)['op'], 'created')
+        self.assertEqual(reread.lookup(other_monitor)['op'], 'updated')
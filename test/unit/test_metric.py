@@ -0,0 +1,142 @@
+"""
+Tests of data_kennel.metric
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+from unittest import TestCase, skipIf
+from mock import patch, MagicMock
+
+from data_kennel import metric
+from data_kennel.metric import Metric, MetricCache, create_org_metric, write_npz
+
+HOUR = 3600
+# Midnight UTC long enough ago that its chunks are complete, aligned to chunks of any hours
+START = 1496275200
+
+
+class FakeMetricClient(object):
+    """A metric client returning a point per hour of a host's series, recording the chunks queried"""
+
+    def __init__(self, responses=None):
+        self.lock = threading.Lock()
+        self.queries = []
+        self.responses = list(responses or [])
+
+    def query(self, start, end, query):
+        """Records the chunk queried, and returns the next response if any, or an hourly series"""
+        with self.lock:
+            self.queries.append((start, end))
+            if self.responses:
+                return self.responses.pop(0)
+        return {
+            'status': 'ok',
+            'series': [{
+                'metric': 'system.cpu.user',
+                'scope': 'host:a',
+                'expression': query,
+                'pointlist': [[float(timestamp * 1000), float(timestamp - START) / HOUR]
+                              for timestamp in range(start - HOUR, end + HOUR, HOUR)]
+            }]
+        }
+
+
+class DataKennelMetricTests(TestCase):
+    """Tests of Data Kennel's Metric"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.client = FakeMetricClient()
+        self.metric = Metric(client=self.client, cache=MetricCache(self.cache_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_query_in_chunks(self):
+        """Chunks are fetched concurrently and merged into one series of the time range"""
+        series = self.metric.query('avg:system.cpu.user{host:a}', START + HOUR, START + 10 * HOUR,
+                                   chunk=4 * HOUR, workers=4)
+
+        self.assertEqual(len(series), 1)
+        self.assertEqual(series[0]['name'], 'avg:system.cpu.user{host:a}')
+        self.assertEqual(series[0]['points'],
+                         [[START + hour * HOUR, float(hour)] for hour in range(1, 11)])
+        self.assertEqual(sorted(self.client.queries), [(START, START + 4 * HOUR - 1),
+                                                       (START + 4 * HOUR, START + 8 * HOUR - 1),
+                                                       (START + 8 * HOUR, START + 12 * HOUR - 1)])
+
+    def test_overlapping_ranges_are_cached(self):
+        """Only the chunks of a range that aren't cached yet are fetched"""
+        query = 'avg:system.cpu.user{host:a}'
+        self.metric.query(query, START, START + 8 * HOUR - 1, chunk=4 * HOUR)
+
+        series = self.metric.query(query, START + 2 * HOUR, START + 12 * HOUR - 1, chunk=4 * HOUR)
+
+        self.assertEqual(len(series[0]['points']), 10)
+        self.assertEqual(len(self.client.queries), 3)
+        self.assertEqual(self.client.queries[-1], (START + 8 * HOUR, START + 12 * HOUR - 1))
+
+    @patch('data_kennel.metric.HttpMetricClient')
+    def test_orgs_are_cached_apart(self, client_class):
+        """The same query is fetched and cached separately for every org"""
+        clients = {'eu-org': FakeMetricClient(), 'us-org': FakeMetricClient()}
+        config = MagicMock()
+        config.for_org.side_effect = lambda org: MagicMock(api_key=org)
+        client_class.side_effect = lambda api_key, app_key, api_host: clients[api_key]
+        cache = MetricCache(self.cache_dir)
+        query = 'avg:system.cpu.user{host:a}'
+
+        for org in ('eu-org', 'us-org', 'eu-org'):
+            create_org_metric(config, org, cache=cache).query(query, START, START + HOUR, chunk=4 * HOUR)
+
+        self.assertEqual([len(clients[org].queries) for org in ('eu-org', 'us-org')], [1, 1])
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['eu-org', 'us-org'])
+
+    @patch('time.time')
+    def test_incomplete_chunks_are_not_cached(self, mock_time):
+        """Chunks that haven't passed yet are fetched every time"""
+        mock_time.return_value = START + 6 * HOUR
+        query = 'avg:system.cpu.user{host:a}'
+
+        self.metric.query(query, START, START + 6 * HOUR, chunk=4 * HOUR)
+        self.metric.query(query, START, START + 6 * HOUR, chunk=4 * HOUR)
+
+        self.assertEqual(self.client.queries.count((START, START + 4 * HOUR - 1)), 1)
+        self.assertEqual(self.client.queries.count((START + 4 * HOUR, START + 8 * HOUR - 1)), 2)
+
+    @patch('time.sleep')
+    def test_rate_limits_are_retried(self, mock_sleep):
+        """Rate limited requests are retried with exponential backoff"""
+        self.client.responses = [{'errors': ['429 Too Many Requests']}] * 2
+
+        series = self.metric.query('avg:system.cpu.user{host:a}', START, START + HOUR, chunk=4 * HOUR)
+
+        self.assertEqual(len(series[0]['points']), 2)
+        self.assertEqual([call[0][0] for call in mock_sleep.call_args_list], [2.0, 4.0])
+
+    def test_errors_raise(self):
+        """Errors returned by Datadog fail the query, and aren't cached"""
+        self.client.responses = [{'status': 'error', 'error': 'Rule parsing error'}]
+
+        self.assertRaises(Exception, self.metric.query, 'avg:oops{', START, START + HOUR)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    @skipIf(metric.numpy is None, 'numpy is not installed')
+    def test_write_npz(self):
+        """Series are written in columns, with NaN where a series has no point"""
+        path = os.path.join(self.cache_dir, 'points.npz')
+
+        write_npz(path, [{'name': 'a', 'points': [[1, 1.0], [2, None]]}, {'name': 'b', 'points': [[3, 3.0]]}])
+
+        arrays = metric.numpy.load(path)
+        self.assertEqual(arrays['timestamps'].tolist(), [1, 2, 3])
+        self.assertEqual(arrays['series'].tolist(), ['a', 'b'])
+        self.assertEqual(metric.numpy.isnan(arrays['values']).tolist(),
+                         [[False, True, True], [True, True, False]])
+
+    @patch('data_kennel.metric.numpy', None)
+    def test_write_npz_requires_numpy(self):
+        """Writing .npz files without numpy fails before writing anything"""
+        self.assertRaises(ImportError, write_npz, os.path.join(self.cache_dir, 'points.npz'), [])
@@ -0,0 +1,129 @@
+"""
+Tests of data_kennel.metrics
+"""
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+from mock import MagicMock, patch
+
+from data_kennel.config import Config
+from data_kennel.metrics import RunMetrics, InstrumentedMonitorClient, collecting_metrics
+from data_kennel.monitor import Monitor, SyncReport
+
+MOCK_CONFIG = [
+    {
+        'data_kennel': {
+            'team': 'mock_team'
+        },
+        'monitors': [
+            {
+                'name': 'mock_monitor',
+                'query': 'mock_query',
+                'type': 'metric alert',
+                'message': 'mock_message'
+            }
+        ]
+    }
+]
+
+
+class DataKennelMetricsTests(TestCase):
+    """Tests of Data Kennel's run metrics"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'data_kennel.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self):
+        """Reads the written metrics file"""
+        with open(self.path) as metrics_file:
+            return metrics_file.read()
+
+    def test_render(self):
+        """Metrics are rendered in the Prometheus text format"""
+        metrics = RunMetrics('update')
+        metrics.record_phase('fetch', 1.5)
+        metrics.record_request('get_all', 'ok', 0.2)
+        metrics.record_request('get_all', 'ok', 3.0)
+        report = SyncReport()
+        report.created.append({'name': 'a', 'tags': ['team:mock "team"', 'source:data_kennel']})
+        metrics.record_sync(report)
+        metrics.finish(True)
+
+        rendered = metrics.render()
+
+        self.assertIn('# TYPE data_kennel_api_request_duration_seconds histogram\n', rendered)
+        self.assertIn('data_kennel_phase_duration_seconds{command="update",phase="fetch"} 1.5\n', rendered)
+        self.assertIn('data_kennel_api_requests_total{command="update",operation="get_all",status="ok"} 2\n',
+                      rendered)
+        self.assertIn('data_kennel_api_request_duration_seconds_bucket{command="update",le="0.25",'
+                      'operation="get_all",status="ok"} 1\n', rendered)
+        self.assertIn('data_kennel_api_request_duration_seconds_bucket{command="update",le="+Inf",'
+                      'operation="get_all",status="ok"} 2\n', rendered)
+        self.assertIn('data_kennel_monitors{change="created",command="update",team="mock \\"team\\""} 1\n',
+                      rendered)
+        self.assertIn('data_kennel_run_success{command="update"} 1\n', rendered)
+
+    def test_instrumented_client(self):
+        """Requests are recorded with their status"""
+        client = MagicMock()
+        client.get.return_value = {'id': 1}
+        client.delete.return_value = {'errors': ['429 Too Many Requests']}
+        client.update.side_effect = ValueError
+        metrics = RunMetrics('update')
+        instrumented_client = InstrumentedMonitorClient(client, metrics)
+
+        self.assertEqual(instrumented_client.get(1), {'id': 1})
+        instrumented_client.delete(1)
+        self.assertRaises(ValueError, instrumented_client.update, id=1)
+
+        self.assertEqual(dict(metrics.request_counts), {
+            ('get', 'ok'): 1, ('delete', 'rate_limited'): 1, ('update', 'exception'): 1
+        })
+
+    def test_written_on_failure(self):
+        """Metrics are written even if the run fails, and leave no temporary files behind"""
+        with self.assertRaises(ValueError):
+            with collecting_metrics(self.path, 'update'):
+                raise ValueError
+
+        self.assertIn('data_kennel_run_success{command="update"} 0\n', self._read())
+        self.assertEqual(os.listdir(self.directory), ['data_kennel.prom'])
+
+    def test_write_errors_are_logged(self):
+        """Failing to write the metrics doesn't hide the exception the run failed with"""
+        path = os.path.join(self.directory, 'missing', 'data_kennel.prom')
+
+        with patch('data_kennel.metrics.logger') as mock_logger:
+            with self.assertRaises(ValueError):
+                with collecting_metrics(path, 'update'):
+                    raise ValueError
+
+        self.assertEqual(mock_logger.exception.call_count, 1)
+
+    def test_not_collected_without_path(self):
+        """Nothing is collected without a path"""
+        with collecting_metrics(None, 'update') as metrics:
+            self.assertIsNone(metrics)
+
+    @patch('datadog.initialize', MagicMock())
+    @patch('datadog.api.Monitor')
+    def test_update(self, monitor_api):
+        """Updates record their phases, requests and synced monitors"""
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = lambda **monitor: dict(monitor, id=1)
+
+        with collecting_metrics(self.path, 'update'):
+            Monitor(Config(config_list=MOCK_CONFIG)).update()
+
+        written = self._read()
+        for phase in ('interpolate', 'fetch', 'sync'):
+            self.assertIn('phase="{0}"'.format(phase), written)
+        self.assertIn('data_kennel_api_requests_total{command="update",operation="create",status="ok"} 1\n',
+                      written)
+        self.assertIn('data_kennel_monitors{change="created",command="update",team="mock_team"} 1\n', written)
@@ -2,13 +2,19 @@
 """
 Tests of data_kennel.monitor
 """
+import copy
+import os
 import random
+import shutil
+import tempfile
 
 from unittest import TestCase
 from mock import MagicMock, call, patch, ANY
 
-from data_kennel.monitor import Monitor
+from data_kennel.journal import SyncJournal
+from data_kennel.monitor import Monitor, MonitorIndex, create_org_monitor, update_orgs
 from data_kennel.config import Config
+from data_kennel.tag_query import TagQuery
 
 
 MOCK_TEAM_1 = "mock_team"
@@ -236,7 +242,7 @@ class DataKennelMonitorTests(TestCase):
 
         monitor_api.get_all.return_value = monitors
 
-        actual_list = self.monitor.list()
+        actual_list = list(self.monitor.list())
         expected_list = [
             {
                 "Name": "foo",
@@ -294,7 +300,7 @@ class DataKennelMonitorTests(TestCase):
 
         monitor_api.get_all.return_value = monitors
 
-        actual_list = self.monitor.list()
+        actual_list = list(self.monitor.list())
         expected_list = [
             {
                 "Name": "foo",
@@ -318,7 +324,7 @@ class DataKennelMonitorTests(TestCase):
         """List monitors works with no monitors"""
         monitor_api.get_all.return_value = []
 
-        actual_list = self.monitor.list()
+        actual_list = list(self.monitor.list())
         expected_list = []
 
         self.assertEqual(actual_list, expected_list)
@@ -326,6 +332,111 @@ class DataKennelMonitorTests(TestCase):
             monitor_tags=['source:data_kennel', 'team:mock_team']
         )
 
+    def test_list_monitors_columns(self, monitor_api):
+        """List monitors only includes the requested columns"""
+        monitor_api.get_all.return_value = [
+            {
+                'id': 123,
+                'name': 'foo',
+                'type': 'metric alert',
+                'overall_state': 'OK',
+                'tags': ['source:data_kennel', 'team:mock_team', 'dk_type:Monitor']
+            }
+        ]
+
+        actual_list = list(self.monitor.list(columns=['Id', 'Type']))
+
+        self.assertEqual(actual_list, [{'Id': 123, 'Type': 'metric alert'}])
+
+    def test_list_monitors_is_lazy(self, monitor_api):
+        """List monitors doesn't fetch monitors until rows are consumed"""
+        rows = self.monitor.list()
+
+        monitor_api.get_all.assert_not_called()
+        self.assertEqual(list(rows), [])
+        monitor_api.get_all.assert_called_once_with(
+            monitor_tags=['source:data_kennel', 'team:mock_team']
+        )
+
+    def test_list_monitors_filters(self, monitor_api):
+        """List monitors pushes the name filter to Datadog and filters by state and type"""
+        tags = ['source:data_kennel', 'team:mock_team', 'dk_type:Monitor']
+        monitor_api.get_all.return_value = [
+            {'id': 1, 'name': 'foo high', 'type': 'metric alert', 'overall_state': 'Alert', 'tags': tags},
+            {'id': 2, 'name': 'foo low', 'type': 'metric alert', 'overall_state': 'OK', 'tags': tags},
+            {'id': 3, 'name': 'foo both', 'type': 'composite', 'overall_state': 'Alert', 'tags': tags}
+        ]
+
+        actual_list = list(self.monitor.list(columns=['Id'], name='foo', states=['alert'],
+                                             monitor_types=['Metric Alert']))
+
+        self.assertEqual(actual_list, [{'Id': 1}])
+        monitor_api.get_all.assert_called_once_with(
+            monitor_tags=['source:data_kennel', 'team:mock_team'],
+            name='foo'
+        )
+
+    def test_list_monitors_tag_query(self, monitor_api):
+        """Tag queries are evaluated locally over the monitors of the team"""
+        monitor_api.get_all.return_value = [
+            {'id': 1, 'name': 'a', 'tags': ['source:data_kennel', 'team:mock_team', 'env:prod']},
+            {'id': 2, 'name': 'b', 'tags': ['source:data_kennel', 'team:mock_team', 'env:staging', 'muted']},
+            {'id': 3, 'name': 'c', 'tags': ['source:data_kennel', 'team:mock_team', 'env:staging']}
+        ]
+
+        monitors = self.monitor.get_monitors(tags=TagQuery('env:prod OR (env:staging AND NOT muted)'))
+
+        self.assertEqual([monitor['id'] for monitor in monitors], [1, 3])
+        monitor_api.get_all.assert_called_once_with(
+            monitor_tags=['source:data_kennel', 'team:mock_team']
+        )
+
+    def test_get_monitors_projects_fields(self, monitor_api):
+        """Getting monitors with fields only keeps those fields"""
+        monitor_api.get_all.return_value = [
+            {
+                'id': 1,
+                'name': 'foo',
+                'tags': ['source:data_kennel', 'team:mock_team'],
+                'state': {'groups': {'host:a': {'status': 'OK'}}},
+                'options': {'thresholds': {'critical': 1}}
+            }
+        ]
+
+        monitors = self.monitor.get_monitors(fields=['id', 'tags', 'overall_state'])
+
+        self.assertEqual(monitors, [{'id': 1, 'tags': ['source:data_kennel', 'team:mock_team']}])
+
+    def test_get_monitors_bounds_requests(self, monitor_api):
+        """No more teams are requested ahead than the transport sends at once"""
+        teams = ['team_a', 'team_b', 'team_c']
+        monitor = Monitor(Config(config_list=[dict(MOCK_CONFIG[0], data_kennel={'team': team})
+                                              for team in teams]), client=MagicMock())
+        monitor.transport.workers = 1
+        events = []
+        monitor.client.get_all.side_effect = lambda monitor_tags: [{'tags': monitor_tags}]
+        get_all = monitor.transport.get_all
+        filter_monitors = monitor._filter_monitors  # pylint: disable=protected-access
+
+        def request(**params):
+            """Records a team being requested"""
+            events.append(('request', params['monitor_tags'][1]))
+            return get_all(**params)
+
+        def project(monitors, *args):
+            """Records the monitors of a team being filtered and projected"""
+            events.append(('project', monitors[0]['tags'][1]))
+            return filter_monitors(monitors, *args)
+
+        with patch.object(monitor.transport, 'get_all', side_effect=request), \
+                patch.object(monitor, '_filter_monitors', side_effect=project):
+            monitors = monitor.get_monitors()
+
+        self.assertEqual([monitor['tags'][1] for monitor in monitors], ['team:' + team for team in teams])
+        self.assertEqual(events, [('request', 'team:team_a'), ('request', 'team:team_b'),
+                                  ('project', 'team:team_a'), ('request', 'team:team_c'),
+                                  ('project', 'team:team_b'), ('project', 'team:team_c')])
+
     def test_update_monitors_creates_monitors(self, monitor_api):
         """Update monitor makes correct calls"""
         self.monitor.update()
@@ -1046,7 +1157,8 @@ class DataKennelMonitorTests(TestCase):
         ]
 
         monitor_api.get_all.return_value = monitors
-        monitor_api.get.side_effect = [monitors[2], monitors[3]]
+        sub_monitors = {id3: monitors[2], id4: monitors[3]}
+        monitor_api.get.side_effect = lambda monitor_id: sub_monitors[monitor_id.strip()]
 
         self.monitor.delete()
 
@@ -1109,30 +1221,310 @@ class DataKennelMonitorTests(TestCase):
 
         monitor_api.delete.assert_not_called()
 
-    def test_compare_monitors_both(self, monitor_api):
-        """Comparing monitors by both name and query works"""
-        monitor1 = {'name': 'foo', 'query': 'bar'}
-        monitor2 = {'name': 'foo', 'query': 'bar'}
+    def test_matched_by_name_and_query(self, monitor_api):
+        """A real monitor with the same name and query is the equivalent of a configured monitor"""
+        real_monitor = {'name': 'foo', 'query': 'bar'}
+
+        self.assertIs(MonitorIndex([real_monitor]).find({'name': 'foo', 'query': 'bar'}), real_monitor)
+
+    def test_matched_by_name(self, monitor_api):
+        """A real monitor with the same name is the equivalent of a configured monitor"""
+        real_monitor = {'name': 'foo', 'query': 'bar'}
 
-        self.assertTrue(self.monitor._compare_monitor(monitor1, monitor2))
+        self.assertIs(MonitorIndex([real_monitor]).find({'name': 'foo', 'query': 'foobar'}), real_monitor)
 
-    def test_compare_monitors_name(self, monitor_api):
-        """Comparing monitors by name works"""
-        monitor1 = {'name': 'foo', 'query': 'bar'}
-        monitor2 = {'name': 'foo', 'query': 'foobar'}
+    def test_matched_by_query(self, monitor_api):
+        """A real monitor with the same query is the equivalent of a configured monitor"""
+        real_monitor = {'name': 'foo', 'query': 'bar'}
 
-        self.assertTrue(self.monitor._compare_monitor(monitor1, monitor2))
+        self.assertIs(MonitorIndex([real_monitor]).find({'name': 'foobar', 'query': 'bar'}), real_monitor)
 
-    def test_compare_monitors_query(self, monitor_api):
-        """Comparing monitors by name works"""
-        monitor1 = {'name': 'foo', 'query': 'bar'}
-        monitor2 = {'name': 'foobar', 'query': 'bar'}
+    def test_not_matched(self, monitor_api):
+        """A real monitor with a different name and query isn't the equivalent of a configured monitor"""
+        real_monitor = {'name': 'bar', 'query': 'bar'}
+
+        self.assertIsNone(MonitorIndex([real_monitor]).find({'name': 'foo', 'query': 'foo'}))
+
+    def test_gc_deletes_orphaned_sub_monitors(self, monitor_api):
+        """Garbage collection deletes the sub-monitors no composite monitor references"""
+        sub_monitor_tags = ['source:data_kennel', 'team:mock_team', 'dk_type:Sub Monitor']
+        monitors = [
+            {
+                'id': 1,
+                'name': '[DK] mock_team | composite',
+                'query': '2 && 3',
+                'tags': ['source:data_kennel', 'team:mock_team', 'dk_type:Monitor']
+            },
+            {'id': 2, 'name': '[DK-C] composite -- 1', 'query': 'q1', 'tags': sub_monitor_tags},
+            {'id': 3, 'name': '[DK-C] composite -- 2', 'query': 'q2', 'tags': sub_monitor_tags},
+            {'id': 4, 'name': '[DK-C] old composite -- 1', 'query': 'q3', 'tags': sub_monitor_tags},
+            {'id': 5, 'name': '[DK-C] old composite -- 2', 'query': 'q4', 'tags': sub_monitor_tags}
+        ]
+        monitor_api.get_all.return_value = monitors
+        # Mocks don't record calls from several threads reliably, so record the deletes ourselves
+        deleted_ids = []
+        monitor_api.delete.side_effect = deleted_ids.append
 
-        self.assertTrue(self.monitor._compare_monitor(monitor1, monitor2))
+        orphans = self.monitor.gc()
 
-    def test_compare_monitors_both_false(self, monitor_api):
-        """Comparing monitors with different name and query fails"""
-        monitor1 = {'name': 'bar', 'query': 'bar'}
-        monitor2 = {'name': 'foo', 'query': 'foo'}
+        self.assertEqual([orphan['id'] for orphan in orphans], [4, 5])
+        self.assertItemsEqual(deleted_ids, [4, 5])
 
-        self.assertFalse(self.monitor._compare_monitor(monitor1, monitor2))
+    def test_gc_dry_run(self, monitor_api):
+        """Garbage collection with dry-run finds orphans but deletes nothing"""
+        monitor_api.get_all.return_value = [
+            {
+                'id': 4,
+                'name': '[DK-C] old composite -- 1',
+                'query': 'q3',
+                'tags': ['source:data_kennel', 'team:mock_team', 'dk_type:Sub Monitor']
+            }
+        ]
+
+        orphans = self.monitor.gc(dry_run=True)
+
+        self.assertEqual([orphan['id'] for orphan in orphans], [4])
+        monitor_api.delete.assert_not_called()
+
+    def _shared_composite_monitor(self):
+        """A Monitor for composite monitors that share their second condition"""
+        shared_config = copy.deepcopy(MOCK_COMPOSITE_CONFIG_1)
+        shared_config[0]['data_kennel']['share_sub_monitors'] = True
+        shared_config[0]['monitors'][0]['query'] = "mock_query_${foo_1} && mock_query_shared"
+        return Monitor(Config(config_list=shared_config))
+
+    def test_update_shares_sub_monitors(self, monitor_api):
+        """Updating composite monitors creates a shared sub-monitor once and references it from both"""
+        monitor = self._shared_composite_monitor()
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [{'id': 1}, {'id': 2}, {'id': 3}, {'id': 4}, {'id': 5}]
+
+        monitor.update()
+
+        created = [kwargs for _, kwargs in monitor_api.create.call_args_list]
+        self.assertEqual(len(created), 5)
+        self.assertEqual([sub_monitor['query'] for sub_monitor in created].count('mock_query_shared'), 1)
+        self.assertEqual([composite['query'] for composite in created if composite['type'] == 'composite'],
+                         ['1 && 2', '4 && 2'])
+
+    def test_delete_keeps_shared_sub_monitors(self, monitor_api):
+        """Deleting a composite monitor keeps shared sub-monitors other composite monitors reference"""
+        monitor = self._shared_composite_monitor()
+        composite_tags = ['source:data_kennel', 'team:mock_team', 'dk_type:Monitor', 'foo:bar']
+        shared_tags = ['source:data_kennel', 'team:mock_team', 'dk_type:Sub Monitor', 'dk_shared:true']
+        monitors = [
+            {'id': 1, 'name': 'composite 1', 'query': '3 && 4', 'tags': composite_tags},
+            {'id': 2, 'name': 'composite 2', 'query': '5 && 4', 'tags': composite_tags[:3]},
+            {'id': 3, 'name': 'sub 3', 'query': 'q3', 'tags': shared_tags},
+            {'id': 4, 'name': 'sub 4', 'query': 'q4', 'tags': shared_tags},
+            {'id': 5, 'name': 'sub 5', 'query': 'q5', 'tags': shared_tags}
+        ]
+        monitor_api.get_all.return_value = monitors
+        monitor_api.get.side_effect = lambda monitor_id: monitors[int(monitor_id) - 1]
+
+        monitor.delete(tags={'foo': 'bar'})
+
+        self.assertEqual(monitor_api.delete.call_args_list, [call(1), call(3)])
+
+    def test_diff(self, monitor_api):
+        """Diffing reports missing, extra and changed monitors without changing anything"""
+        configured = self.config1.get_monitors()
+        changed = dict(configured[0], id=1, message='old message', overall_state='OK', options={})
+        unchanged = dict(configured[1], id=2, overall_state='OK', options={})
+        extra = {'id': 3, 'name': 'extra monitor', 'query': 'extra query', 'tags': []}
+        monitor_api.get_all.return_value = [changed, extra]
+
+        differences = self.monitor.diff(processes=1)
+
+        self.assertEqual(differences, [
+            {'status': 'missing', 'name': configured[1]['name'], 'id': None, 'fields': sorted(configured[1])},
+            {'status': 'changed', 'name': changed['name'], 'id': 1, 'fields': ['message']},
+            {'status': 'extra', 'name': 'extra monitor', 'id': 3, 'fields': []}
+        ])
+        monitor_api.get_all.return_value = [unchanged]
+        self.assertNotIn(2, [difference['id'] for difference in self.monitor.diff(processes=1)])
+        monitor_api.create.assert_not_called()
+        monitor_api.update.assert_not_called()
+        monitor_api.delete.assert_not_called()
+
+    def test_diff_unified(self, monitor_api):
+        """Diffing can include a unified diff of changed monitors"""
+        configured = self.config1.get_monitors()
+        monitor_api.get_all.return_value = [dict(monitor, id=index, message='old message')
+                                            for index, monitor in enumerate(configured)]
+
+        differences = self.monitor.diff(unified=True, processes=1)
+
+        self.assertEqual([difference['status'] for difference in differences], ['changed', 'changed'])
+        self.assertIn('-    "message": "old message",', differences[0]['diff'])
+
+    def test_concurrent_syncs_are_isolated(self, monitor_api):
+        """A sync started while another sync of the same Monitor runs doesn't disturb it"""
+        names = [monitor['name'] for monitor in self.config1.get_monitors()]
+        nested_reports = []
+        get_sub_monitor = self.config1.get_sub_monitor
+
+        def start_other_sync(configured_monitor):
+            """Runs another dry run the first time a sync looks for sub-monitors"""
+            if not nested_reports:
+                nested_reports.append(None)
+                nested_reports[0] = self.monitor.sync(self.config1.get_monitors(), [], dry_run=True)
+            return get_sub_monitor(configured_monitor)
+
+        with patch.object(self.config1, 'get_sub_monitor', side_effect=start_other_sync):
+            report = self.monitor.sync(self.config1.get_monitors(), [], dry_run=True)
+
+        self.assertEqual(report.summary()['created'], names)
+        self.assertEqual(nested_reports[0].summary()['created'], names)
+
+    def test_update_resumes_from_journal(self, monitor_api):
+        """A resumed update skips the monitors its journal records instead of creating them again"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'journal.jsonl')
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [{'id': 1, 'name': 'first'}, Exception('network blip')]
+
+        self.assertRaises(Exception, self.monitor.update, journal=SyncJournal(path))
+        self.assertEqual(monitor_api.create.call_count, 2)
+
+        monitor_api.reset_mock()
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [{'id': 2, 'name': 'second'}]
+        report = self.monitor.update(journal=SyncJournal(path, resume=True))
+
+        self.assertEqual(monitor_api.create.call_count, 1)
+        self.assertEqual([monitor['id'] for monitor in report.created], [1, 2])
+        self.assertIsNone(SyncJournal(path, resume=True).lookup(self.config1.get_monitors()[0]))
+
+    def test_resume_retries_failed_creates(self, monitor_api):
+        """Creates that Datadog answered with errors aren't journaled, so a resumed update retries them"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'journal.jsonl')
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [{'id': 1, 'name': 'first'}, {'errors': ['429 Too Many Requests']}]
+
+        journal = SyncJournal(path)
+        with patch.object(journal, 'complete'):
+            self.monitor.update(journal=journal)
+        journal.close()
+
+        monitor_api.reset_mock()
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [{'id': 2, 'name': 'second'}]
+        report = self.monitor.update(journal=SyncJournal(path, resume=True))
+
+        self.assertEqual(monitor_api.create.call_count, 1)
+        self.assertEqual([monitor['id'] for monitor in report.created], [1, 2])
+
+    def test_verify_fetches_only_written_monitors(self, monitor_api):
+        """Verification searches only the monitors a sync wrote, in batches"""
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [
+            {'id': monitor_id, 'name': 'mock {0}'.format(monitor_id), 'query': 'q', 'type': 'metric alert',
+             'tags': ['a']}
+            for monitor_id in (1, 2)
+        ]
+        report = self.monitor.update()
+        monitor_api.search.side_effect = [
+            {'monitors': [dict(report.created[0], tags=['a'])]},
+            {'monitors': [dict(report.created[1], query='  q ')]}
+        ]
+
+        drift = self.monitor.verify(batch_size=1)
+
+        self.assertFalse(drift.has_drift())
+        self.assertEqual(len(drift.verified), 2)
+        self.assertItemsEqual([kwargs['query'] for _, kwargs in monitor_api.search.call_args_list],
+                              ['id:1', 'id:2'])
+        self.assertEqual(monitor_api.get_all.call_count, 1)
+
+    def test_verify_reports_drift(self, monitor_api):
+        """Verification reports written monitors that are missing or differ in Datadog"""
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = [
+            {'id': monitor_id, 'name': 'mock {0}'.format(monitor_id), 'query': 'q', 'type': 'metric alert',
+             'tags': ['a']}
+            for monitor_id in (1, 2)
+        ]
+        report = self.monitor.update()
+        monitor_api.search.return_value = {'monitors': [dict(report.created[0], query='changed')]}
+
+        drift = self.monitor.verify(report)
+
+        self.assertTrue(drift.has_drift())
+        self.assertEqual(drift.missing, [report.created[1]])
+        self.assertEqual(drift.drifted, [(report.created[0], {'query': ('q', 'changed')})])
+        self.assertEqual(drift.describe(), ["Missing monitor: mock 2",
+                                            "Drifted monitor: mock 1: query is 'changed', expected 'q'"])
+        monitor_api.search.assert_called_once_with(query='id:1 OR id:2', per_page=100)
+
+
+class DataKennelUpdateOrgsTests(TestCase):
+    """Tests of updating the monitors of several Datadog orgs"""
+
+    def setUp(self):
+        config_list = copy.deepcopy(MOCK_CONFIG) + copy.deepcopy(MOCK_CONFIG)
+        config_list[0]['data_kennel']['team'] = 'team_a'
+        config_list[0]['data_kennel']['org'] = 'org-a'
+        config_list[1]['data_kennel']['team'] = 'team_b'
+        config_list[1]['data_kennel']['org'] = 'org-b'
+        self.config = Config(config_list=config_list)
+        self.clients = {}
+
+    def _create_client(self, api_key, app_key, api_host):
+        """Stand-in for HttpMonitorClient, recording a mock client per API key"""
+        client = MagicMock()
+        client.get_all.return_value = []
+        client.create.side_effect = lambda **monitor: dict(monitor, id=1)
+        self.clients[api_key] = client
+        return client
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY_ORG_A': 'api_a', 'DATA_KENNEL_APP_KEY_ORG_A': 'app_a',
+                               'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_orgs_use_their_own_clients(self, client_class):
+        """Every org is updated with a client using its own credentials"""
+        client_class.side_effect = self._create_client
+
+        reports = update_orgs(self.config)
+
+        self.assertEqual(list(reports), ['org-a', 'org-b'])
+        for org, api_key, team in (('org-a', 'api_a', 'team_a'), ('org-b', 'api_b', 'team_b')):
+            self.assertEqual(reports[org].summary()['created'],
+                             ['[DK] {0} | mock_monitor for bar'.format(team),
+                              '[DK] {0} | mock_monitor for foo'.format(team)])
+            self.assertEqual(self.clients[api_key].create.call_count, 2)
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_failed_org_is_isolated(self, client_class):
+        """An org that fails to update doesn't stop the other orgs"""
+        client_class.side_effect = self._create_client
+
+        reports = update_orgs(self.config)
+
+        self.assertIsInstance(reports['org-a'], Exception)
+        self.assertEqual(len(reports['org-b'].created), 2)
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY': 'api_default', 'DATA_KENNEL_APP_KEY': 'app_default',
+                               'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.initialize')
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_default_org_uses_global_client(self, client_class, mock_initialize):
+        """The default org uses the global client next to other orgs, which use their own clients"""
+        client_class.side_effect = self._create_client
+        config_list = copy.deepcopy(MOCK_CONFIG) + copy.deepcopy(MOCK_CONFIG)
+        config_list[0]['data_kennel']['team'] = 'team_a'
+        config_list[1]['data_kennel']['team'] = 'team_b'
+        config_list[1]['data_kennel']['org'] = 'org-b'
+        config = Config(config_list=config_list)
+
+        default_monitor = create_org_monitor(config, 'default')
+        org_monitor = create_org_monitor(config, 'org-b')
+
+        mock_initialize.assert_called_once_with(api_key='api_default', app_key='app_default')
+        client_class.assert_called_once_with('api_b', 'app_b', ANY)
+        self.assertEqual(default_monitor.config.teams, ['team_a'])
+        self.assertEqual(org_monitor.config.teams, ['team_b'])
@@ -0,0 +1,147 @@
+"""
+Tests of data_kennel.profiling
+"""
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from data_kennel.profiling import profiling, profile_phase, create_profiler, BaseProfiler, SamplingProfiler
+
+
+@profile_phase
+def _cpu_phase():
+    """A CPU bound phase"""
+    return sum(i * i for i in range(20000))
+
+
+def _network_wait():
+    """Stand-in for time spent outside of any phase"""
+    return sorted(range(20000), reverse=True)
+
+
+class DataKennelProfilingTests(TestCase):
+    """Tests of Data Kennel's profiling"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.directory, 'profile.out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _profiled_functions(self):
+        """The names of the functions recorded in the pstats output"""
+        stats = pstats.Stats(self.output_path)
+        return set(function for _, _, function in stats.stats)
+
+    def test_no_output_path_does_nothing(self):
+        """Profiling without an output path doesn't profile"""
+        with profiling(None) as profiler:
+            _cpu_phase()
+
+        self.assertIsNone(profiler)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_deterministic_all_scope(self):
+        """Deterministic profiling of everything writes pstats and a report"""
+        with profiling(self.output_path):
+            _cpu_phase()
+            _network_wait()
+
+        functions = self._profiled_functions()
+        self.assertIn('_cpu_phase', functions)
+        self.assertIn('_network_wait', functions)
+        self.assertTrue(os.path.getsize(self.output_path + '.txt') > 0)
+
+    def test_deterministic_cpu_scope(self):
+        """Deterministic profiling of the CPU scope only records phases"""
+        with profiling(self.output_path, scope='cpu'):
+            _cpu_phase()
+            _network_wait()
+
+        functions = self._profiled_functions()
+        self.assertIn('_cpu_phase', functions)
+        self.assertNotIn('_network_wait', functions)
+
+    def test_sampling_writes_collapsed_stacks(self):
+        """Sampling profiling writes collapsed stacks and a report"""
+        with profiling(self.output_path, mode='sampling') as profiler:
+            for _ in range(20):
+                _cpu_phase()
+
+        with open(self.output_path) as output:
+            lines = output.read().splitlines()
+
+        self.assertEqual(len(lines), len(profiler.samples))
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertEqual(profiler.samples[stack], int(count))
+        self.assertTrue(os.path.exists(self.output_path + '.txt'))
+
+    def test_sampling_cpu_scope_in_phases(self):
+        """Sampling in the CPU scope only arms the sampling timer inside phases"""
+        profiler = SamplingProfiler(self.output_path, scope='cpu')
+        profiler.start()
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+
+        profiler.enter_phase()
+        profiler.enter_phase()
+        self.assertNotEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        profiler.exit_phase()
+        self.assertNotEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        profiler.exit_phase()
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+
+        profiler.stop()
+
+    def test_cpu_scope_other_threads(self):
+        """Phases entered from other threads run unprofiled, without disturbing the profiled thread"""
+        profiler = SamplingProfiler(self.output_path, scope='cpu')
+        profiler.start()
+        errors = []
+        entered = threading.Event()
+        exit_phase = threading.Event()
+
+        def other_phase():
+            """Enters a phase from another thread, exiting it once told to"""
+            try:
+                profiler.enter_phase()
+                entered.set()
+                exit_phase.wait(5)
+                profiler.exit_phase()
+            except ValueError as ex:
+                errors.append(ex)
+                entered.set()
+
+        thread = threading.Thread(target=other_phase)
+        thread.start()
+        entered.wait(5)
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+
+        profiler.enter_phase()
+        self.assertNotEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        exit_phase.set()
+        thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertNotEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        profiler.exit_phase()
+        self.assertEqual(signal.getitimer(signal.ITIMER_PROF), (0.0, 0.0))
+        profiler.stop()
+
+    def test_unknown_mode(self):
+        """Unknown profile modes are rejected"""
+        self.assertRaises(ValueError, create_profiler, self.output_path, mode='magic')
+
+    def test_unknown_scope(self):
+        """Unknown profile scopes are rejected"""
+        self.assertRaises(ValueError, create_profiler, self.output_path, scope='magic')
+
+    def test_base_profiler_is_abstract(self):
+        """Only profilers implementing how to record and write can be created"""
+        self.assertRaises(TypeError, BaseProfiler, self.output_path)
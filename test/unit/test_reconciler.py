@@ -0,0 +1,119 @@
+"""
+Tests of data_kennel.reconciler
+"""
+import threading
+
+from unittest import TestCase
+
+from data_kennel.reconciler import Reconciler, ResourceAdapter, ResourceIndex
+
+
+class FakeAdapter(ResourceAdapter):
+    """An adapter of resources identified by name or by url, recording the writes made through it"""
+
+    kind = 'fake'
+    keys = (lambda resource: resource.get('name'), lambda resource: resource.get('url'))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = []
+
+    def placeholder(self, resource):
+        return dict(resource, id='placeholder')
+
+    def create(self, resource):
+        return self._record('create', dict(resource, id=100))
+
+    def update(self, resource):
+        return self._record('update', resource)
+
+    def delete(self, resource):
+        self._record('delete', resource)
+
+    def _record(self, action, resource):
+        with self.lock:
+            self.writes.append((action, resource['id']))
+        return resource
+
+
+REAL = [
+    {'id': 1, 'name': 'a', 'url': '/a', 'value': 1},
+    {'id': 2, 'name': 'b', 'url': '/b', 'value': 2},
+    {'id': 3, 'name': 'c', 'url': '/c', 'value': 3},
+    {'id': 4, 'name': 'a', 'url': '/a2', 'value': 1}
+]
+
+
+class ResourceIndexTests(TestCase):
+    """Tests of the ResourceIndex"""
+
+    def test_find_by_any_key(self):
+        """Resources are found by any of their keys, the first remaining one first"""
+        index = ResourceIndex(REAL, FakeAdapter.keys)
+
+        self.assertEqual(index.find({'name': 'b'})['id'], 2)
+        self.assertEqual(index.find({'url': '/c'})['id'], 3)
+        self.assertEqual(index.find({'name': 'x', 'url': '/a2'})['id'], 4)
+        self.assertEqual(index.find({'name': 'a', 'url': '/a2'})['id'], 1)
+        self.assertIsNone(index.find({'name': 'x'}))
+        self.assertIsNone(index.find({}))
+
+        index.remove(REAL[0])
+
+        self.assertEqual(index.find({'name': 'a'})['id'], 4)
+        self.assertEqual([resource['id'] for resource in index], [2, 3, 4])
+        self.assertEqual(index.count(), 3)
+
+
+class ReconcilerTests(TestCase):
+    """Tests of the Reconciler"""
+
+    def setUp(self):
+        self.adapter = FakeAdapter()
+
+    def test_adapter_is_abstract(self):
+        """Adapters that don't implement create, update and delete can't be instantiated"""
+        self.assertRaises(TypeError, ResourceAdapter)
+
+    def test_plan(self):
+        """Configured resources are created, updated or left unchanged depending on their real equivalent"""
+        reconciler = Reconciler(self.adapter, REAL)
+
+        self.assertEqual(reconciler.plan({'name': 'a', 'value': 1}).action, 'unchanged')
+        change = reconciler.plan({'url': '/b', 'value': 5})
+        self.assertEqual(change.action, 'updated')
+        self.assertEqual(change.resource, {'id': 2, 'name': 'b', 'url': '/b', 'value': 5})
+        self.assertEqual(reconciler.plan({'name': 'x'}).action, 'created')
+        self.assertEqual(reconciler.plan({'name': 'a', 'value': 1}).real['id'], 4)
+        self.assertEqual([change.real['id'] for change in reconciler.plan_deletions()], [3])
+        self.assertEqual(reconciler.plan_deletions(keep=['c']), [])
+
+    def test_reconcile(self):
+        """Changes are written and reported in the order they were planned, even concurrently"""
+        configured = [{'name': 'x', 'value': 9}, {'name': 'b', 'value': 5}, {'name': 'a', 'value': 1}]
+        changes = []
+        reconciler = Reconciler(self.adapter, REAL,
+                                listener=lambda change, resource: changes.append(change.action))
+
+        report = reconciler.reconcile(configured, keep=['c'], workers=4)
+
+        self.assertEqual(report.summary(), {'created': ['x'], 'updated': ['b'], 'unchanged': ['a'],
+                                            'deleted': ['a']})
+        self.assertEqual(report.created[0]['id'], 100)
+        self.assertEqual(report.deleted[0]['id'], 4)
+        self.assertEqual(sorted(self.adapter.writes), [('create', 100), ('delete', 4), ('update', 2)])
+        self.assertEqual(sorted(changes), ['created', 'deleted', 'unchanged', 'updated'])
+
+    def test_dry_run(self):
+        """Nothing is written in a dry run, and resources that would be created are placeholders"""
+        changes = []
+        reconciler = Reconciler(self.adapter, REAL, dry_run=True,
+                                listener=lambda change, resource: changes.append(change))
+
+        report = reconciler.reconcile([{'name': 'x'}, {'name': 'b', 'value': 5}])
+
+        self.assertEqual(report.created, [{'name': 'x', 'id': 'placeholder'}])
+        self.assertEqual(report.updated[0]['value'], 5)
+        self.assertEqual(len(report.deleted), 3)
+        self.assertEqual(self.adapter.writes, [])
+        self.assertEqual(changes, [])
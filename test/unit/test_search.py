@@ -0,0 +1,117 @@
+"""
+Tests of data_kennel.search
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import TestCase
+from mock import patch, MagicMock
+
+from data_kennel.search import SearchIndex, get_org_index, required_literals
+
+
+def _monitor(monitor_id, name, query, message='', tags=None):
+    """A monitor as the monitor API returns it"""
+    return {'id': monitor_id, 'name': name, 'type': 'metric alert', 'query': query, 'message': message,
+            'tags': tags or [], 'overall_state': 'OK'}
+
+
+MONITORS = [
+    _monitor(1, 'High load on {{host.name}}', 'avg(last_5m):avg:system.load.norm.5{env:prod} by {host} > 2',
+             message='Check the load @slack-astronauts', tags=['source:data_kennel', 'team:astronauts']),
+    _monitor(2, 'Disk almost full', 'max(last_5m):max:system.disk.in_use{*} by {host,device} > 0.9',
+             tags=['team:storage']),
+    _monitor(3, 'System Load of the API', 'avg(last_10m):avg:system.load.norm.1{service:api} > 1.5',
+             message=u'Charg\xe9 @pagerduty-api', tags=['source:data_kennel', 'team:api']),
+    _monitor(4, 'Composite', '1 && 2')
+]
+
+
+class RequiredLiteralsTests(TestCase):
+    """Tests of the literals required by regular expressions"""
+
+    def test_required_literals(self):
+        """Literals of groups and repeats that must match are kept, optional ones aren't"""
+        self.assertEqual(required_literals(r'(?:Load\.norm)+\.\d'), [u'load.norm', u'.'])
+        self.assertEqual(required_literals(r'load(\.norm)?\.5'), [u'load', u'.5'])
+        self.assertEqual(required_literals(r'[a-z]*'), [])
+
+
+class SearchIndexTests(TestCase):
+    """Tests of SearchIndex"""
+
+    def setUp(self):
+        self.index = SearchIndex(MONITORS, fetched=100)
+
+    def _search(self, term, regex=False):
+        return [(row['Id'], row['Fields']) for row in self.index.search(term, regex=regex)]
+
+    def test_substring(self):
+        """Every monitor with a field containing the term matches, case insensitively"""
+        self.assertEqual(self._search('system.load.norm'), [(1, 'query'), (3, 'query')])
+        self.assertEqual(self._search('LOAD'), [(1, 'name, query, message'), (3, 'name, query')])
+        self.assertEqual(self._search('team:'), [(1, 'tags'), (2, 'tags'), (3, 'tags')])
+        self.assertEqual(self._search(u'charg\xe9'), [(3, 'message')])
+        self.assertEqual(self._search('&&'), [(4, 'query')])
+        self.assertEqual(self._search('nothing like it'), [])
+
+    def test_terms_do_not_span_fields(self):
+        """Terms only match within one field"""
+        self.assertEqual(self._search('> 2check'), [])
+        self.assertEqual(self._search('data_kennel\nteam:api'), [(3, 'tags')])
+
+    def test_regex(self):
+        """Regular expressions are matched against the candidates of their literals, or every monitor"""
+        self.assertEqual(self._search(r'system\.load\.norm\.\d\S* by \S+ > [12]$', regex=True),
+                         [(1, 'query')])
+        self.assertEqual(self._search(r'^(disk|composite)', regex=True), [(2, 'name'), (4, 'name')])
+        self.assertRaises(ValueError, list, self.index.search('load(', regex=True))
+
+    def test_managed(self):
+        """Results are flagged as managed by Data Kennel or not"""
+        rows = list(self.index.search('system'))
+
+        self.assertEqual([(row['Name'], row['Managed']) for row in rows],
+                         [('High load on {{host.name}}', 'yes'), ('Disk almost full', 'no'),
+                          ('System Load of the API', 'yes')])
+
+
+class GetOrgIndexTests(TestCase):
+    """Tests of caching indexes"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    @patch('data_kennel.search.create_org_monitor')
+    def test_cached_until_max_age(self, mock_create_org_monitor):
+        """The monitors are fetched once, until the cached index is older than the maximum age"""
+        mock_create_org_monitor.return_value = MagicMock(**{'client.get_all.return_value': MONITORS})
+
+        index = get_org_index(None, 'eu-prod', cache_dir=self.cache_dir, max_age=3600)
+        cached = get_org_index(None, 'eu-prod', cache_dir=self.cache_dir, max_age=3600)
+
+        self.assertEqual(mock_create_org_monitor.call_count, 1)
+        self.assertEqual(os.listdir(self.cache_dir), ['eu-prod.index'])
+        self.assertEqual(cached.count(), index.count())
+        self.assertEqual(list(cached.search('load')), list(index.search('load')))
+
+        with patch('time.time', return_value=time.time() + 3600):
+            get_org_index(None, 'eu-prod', cache_dir=self.cache_dir, max_age=3600)
+        self.assertEqual(mock_create_org_monitor.call_count, 2)
+
+    @patch('data_kennel.search.create_org_monitor')
+    def test_unreadable_cache_is_refetched(self, mock_create_org_monitor):
+        """A cache that can't be read is fetched again"""
+        mock_create_org_monitor.return_value = MagicMock(**{'client.get_all.return_value': MONITORS[:1]})
+        with open(os.path.join(self.cache_dir, 'default.index'), 'w') as index_file:
+            index_file.write('{"not": "marshal"}')
+
+        index = get_org_index(None, 'default', cache_dir=self.cache_dir)
+
+        self.assertEqual(index.count(), 1)
+        mock_create_org_monitor.assert_called_once_with(None, 'default')
@@ -0,0 +1,216 @@
+"""
+Tests of data_kennel.server
+"""
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from unittest import TestCase
+from mock import ANY, MagicMock, patch
+
+try:
+    from httplib import HTTPConnection
+except ImportError:
+    from http.client import HTTPConnection
+
+from data_kennel.server import DataKennelService, ReadWriteLock, create_server
+
+MOCK_CONFIG = """
+data_kennel:
+    team: mock_team
+monitors:
+  - name: "mock_monitor"
+    type: "metric alert"
+    query: "mock_query"
+    message: "mock_message"
+"""
+ORG_CONFIG = """
+data_kennel:
+    team: org_team
+    org: org-b
+monitors:
+  - name: "org_monitor"
+    type: "metric alert"
+    query: "org_query"
+    message: "org_message"
+"""
+
+
+class DataKennelReadWriteLockTests(TestCase):
+    """Tests of Data Kennel's ReadWriteLock"""
+
+    def test_readers_share(self):
+        """Readers hold the lock at the same time"""
+        lock = ReadWriteLock()
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def read():
+            """Holds the lock for reading until released"""
+            with lock.reading():
+                acquired.set()
+                release.wait(5)
+
+        reader = threading.Thread(target=read)
+        with lock.reading():
+            reader.start()
+            self.assertTrue(acquired.wait(1))
+        release.set()
+        reader.join(1)
+        self.assertFalse(reader.is_alive())
+
+    def test_writer_waits_for_readers(self):
+        """A writer waits until readers release the lock"""
+        lock = ReadWriteLock()
+        events = []
+
+        def write():
+            """Takes the lock for writing"""
+            with lock.writing():
+                events.append('write')
+
+        with lock.reading():
+            writer = threading.Thread(target=write)
+            writer.start()
+            writer.join(0.1)
+            events.append('read')
+        writer.join(1)
+
+        self.assertEqual(events, ['read', 'write'])
+
+
+@patch('datadog.initialize', MagicMock())
+@patch('datadog.api.Monitor')
+class DataKennelServerTests(TestCase):
+    """Tests of Data Kennel's control server"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.directory, 'config.yml')
+        with open(self.config_path, 'w') as config_file:
+            config_file.write(MOCK_CONFIG)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _start(self, monitor_api, real_monitors, socket_path=None):
+        """Starts a server over a service whose inventory holds the given real monitors"""
+        monitor_api.get_all.return_value = real_monitors
+        return self._serve(DataKennelService(config_path=self.config_path), socket_path=socket_path)
+
+    def _serve(self, service, socket_path=None):
+        """Starts a server over a service"""
+        server = create_server(service, port=0, socket_path=socket_path)
+        self.servers.append(server)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+
+    def _request(self, server, method, path):
+        """Makes a request over TCP and returns the status and decoded body"""
+        connection = HTTPConnection('127.0.0.1', server.server_address[1])
+        connection.request(method, path)
+        response = connection.getresponse()
+        body = json.loads(response.read().decode('utf-8'))
+        connection.close()
+        return response.status, body
+
+    def test_list_from_inventory(self, monitor_api):
+        """Lists answer from the inventory without calling Datadog again"""
+        server = self._start(monitor_api, [
+            {'id': 1, 'name': '[DK] mock_team | mock_monitor', 'overall_state': 'OK',
+             'type': 'metric alert', 'tags': ['team:mock_team']},
+            {'id': 2, 'name': '[DK] other_team | other', 'overall_state': 'Alert',
+             'type': 'metric alert', 'tags': ['team:other_team']}
+        ])
+        monitor_api.reset_mock()
+
+        status, body = self._request(server, 'GET', '/list?tags=team:mock_team&columns=Id,Name')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, [{'Id': 1, 'Name': '[DK] mock_team | mock_monitor'}])
+        monitor_api.get_all.assert_not_called()
+
+    def test_plan_and_sync(self, monitor_api):
+        """Plans don't touch Datadog, syncs do and update the inventory"""
+        monitor_api.create.side_effect = lambda **monitor: dict(monitor, id=1)
+        server = self._start(monitor_api, [])
+
+        status, body = self._request(server, 'GET', '/plan')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['created'], ['[DK] mock_team | mock_monitor'])
+        monitor_api.create.assert_not_called()
+
+        status, body = self._request(server, 'POST', '/sync')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['created'], ['[DK] mock_team | mock_monitor'])
+        self.assertEqual(monitor_api.create.call_count, 1)
+
+        status, body = self._request(server, 'GET', '/inventory')
+        self.assertEqual([monitor['id'] for monitor in body], [1])
+
+        status, body = self._request(server, 'GET', '/plan')
+        self.assertEqual(body['created'], [])
+
+    def test_errors(self, monitor_api):
+        """Unknown endpoints are a 404 and invalid parameters a 400"""
+        server = self._start(monitor_api, [])
+
+        self.assertEqual(self._request(server, 'GET', '/sync')[0], 404)
+        self.assertEqual(self._request(server, 'GET', '/list?tags=invalid')[0], 400)
+        self.assertEqual(self._request(server, 'GET', '/list?columns=Nope')[0], 400)
+
+    def test_unix_socket(self, monitor_api):
+        """The server can listen on a unix socket"""
+        socket_path = os.path.join(self.directory, 'dk.sock')
+        self._start(monitor_api, [], socket_path=socket_path)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.sendall(b'POST /reload HTTP/1.0\r\n\r\n')
+        response = b''
+        while True:
+            data = client.recv(4096)
+            if not data:
+                break
+            response += data
+        client.close()
+
+        headers, body = response.split(b'\r\n\r\n', 1)
+        self.assertIn(b' 200 ', headers.split(b'\r\n')[0])
+        self.assertEqual(json.loads(body.decode('utf-8')), {'teams': ['mock_team'], 'monitors': 0})
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_orgs(self, client_class, monitor_api):
+        """Every org is listed, planned and synced with its own client and inventory"""
+        with open(os.path.join(self.directory, 'org.yml'), 'w') as config_file:
+            config_file.write(ORG_CONFIG)
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = lambda **monitor: dict(monitor, id=1)
+        org_client = client_class.return_value
+        org_client.get_all.return_value = []
+        org_client.create.side_effect = lambda **monitor: dict(monitor, id=2)
+        server = self._serve(DataKennelService(config_dir=self.directory))
+        client_class.assert_called_once_with('api_b', 'app_b', ANY)
+
+        status, body = self._request(server, 'GET', '/plan')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['created'], ['[DK] mock_team | mock_monitor', '[DK] org_team | org_monitor'])
+
+        self._request(server, 'POST', '/sync')
+        self.assertEqual(monitor_api.create.call_args[1]['name'], '[DK] mock_team | mock_monitor')
+        self.assertEqual(org_client.create.call_args[1]['name'], '[DK] org_team | org_monitor')
+
+        status, body = self._request(server, 'GET', '/list?columns=Id,Name')
+        self.assertEqual(body, [{'Id': 1, 'Name': '[DK] mock_team | mock_monitor'},
+                                {'Id': 2, 'Name': '[DK] org_team | org_monitor'}])
+        self.assertEqual(self._request(server, 'GET', '/plan')[1]['created'], [])
@@ -0,0 +1,90 @@
+"""
+Tests of data_kennel.tag_query
+"""
+from unittest import TestCase
+
+from data_kennel.tag_query import TagIndex, TagQuery, TagQueryError, compile_tag_query
+
+MONITORS = [
+    {'id': 1, 'tags': ['team:a', 'env:prod', 'service:api-users']},
+    {'id': 2, 'tags': ['team:a', 'env:staging', 'service:api-orders', 'muted']},
+    {'id': 3, 'tags': ['team:b', 'env:prod', 'service:legacy-batch']},
+    {'id': 4, 'tags': ['team:b', 'owner:someone']},
+    {'id': 5}
+]
+
+
+class DataKennelTagQueryTests(TestCase):
+    """Tests of Data Kennel's tag queries"""
+
+    def _ids(self, text):
+        """The ids of the monitors matching a query"""
+        return [monitor['id'] for monitor in TagQuery(text).filter(MONITORS)]
+
+    def test_terms(self):
+        """Terms match tags, tag keys and bare tags"""
+        self.assertEqual(self._ids('env:prod'), [1, 3])
+        self.assertEqual(self._ids('owner'), [4])
+        self.assertEqual(self._ids('muted'), [2])
+        self.assertEqual(self._ids('env:missing'), [])
+
+    def test_wildcards(self):
+        """Keys and values can contain wildcards"""
+        self.assertEqual(self._ids('service:api-*'), [1, 2])
+        self.assertEqual(self._ids('serv*'), [1, 2, 3])
+        self.assertEqual(self._ids('*:prod'), [1, 3])
+
+    def test_operators(self):
+        """NOT binds tighter than AND, which binds tighter than OR"""
+        self.assertEqual(self._ids('team:a AND env:prod OR team:b AND NOT env:prod'), [1, 4])
+        self.assertEqual(self._ids('team:a and (env:prod or muted)'), [1, 2])
+        self.assertEqual(self._ids('NOT team:a'), [3, 4, 5])
+        self.assertEqual(self._ids('NOT NOT team:a'), [1, 2])
+
+    def test_implicit_and(self):
+        """Terms without an operator between them are ANDed"""
+        self.assertEqual(self._ids('team:b env:prod'), self._ids('team:b AND env:prod'))
+
+    def test_syntax_errors(self):
+        """Malformed queries are rejected"""
+        for text in ('', '   ', 'team:a AND', '(team:a', 'team:a)', 'OR team:a', 'NOT'):
+            self.assertRaises(TagQueryError, TagQuery, text)
+
+    def test_compile_tag_query(self):
+        """Several expressions are ANDed"""
+        query = compile_tag_query(['team:a OR team:b', 'NOT env:prod'])
+
+        self.assertEqual([monitor['id'] for monitor in query.filter(MONITORS)], [2, 4])
+
+    def test_compile_errors_quote_expression(self):
+        """Errors in one of several expressions are reported against that expression as written"""
+        with self.assertRaises(TagQueryError) as context:
+            compile_tag_query(['team:a', 'env:prod AND'])
+
+        self.assertIn("'env:prod AND'", str(context.exception))
+        self.assertNotIn('(team:a)', str(context.exception))
+        self.assertEqual(compile_tag_query(['team:a OR muted']).text, 'team:a OR muted')
+
+    def test_plain_tags_match_like_index(self):
+        """Queries of plain tags, which are scanned, filter like queries evaluated against the index"""
+        for tags in (['team:a'], ['team:b', 'env:prod'], ['team:b', 'muted'], []):
+            query = TagQuery.from_tags(tags)
+            index = TagIndex(MONITORS)
+            self.assertEqual(query.filter(MONITORS), index.select(query.evaluate(index)))
+
+        query = compile_tag_query(['team:b', 'env:prod'])
+        self.assertEqual([monitor['id'] for monitor in query.filter(MONITORS)], [3])
+
+    def test_from_tags(self):
+        """Queries of plain tags match monitors with all of the tags"""
+        self.assertTrue(TagQuery.from_tags(['team:a', 'muted']).matches(['muted', 'team:a', 'env:qa']))
+        self.assertFalse(TagQuery.from_tags(['team:a', 'muted']).matches(['team:a']))
+        self.assertTrue(TagQuery.from_tags([]).matches([]))
+
+    def test_index_select(self):
+        """Bitsets select monitors in their original order"""
+        index = TagIndex(MONITORS)
+
+        self.assertEqual(index.select(index.all), MONITORS)
+        self.assertEqual(index.select(index.tag('team:b') | index.key('muted')), MONITORS[1:4])
+        self.assertEqual(index.select(0), [])
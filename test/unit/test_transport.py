@@ -0,0 +1,104 @@
+"""
+Tests of data_kennel.transport
+"""
+import sys
+import threading
+import traceback
+
+from unittest import TestCase
+from mock import MagicMock
+
+from data_kennel.transport import AsyncMonitorClient, RequestCancelled, RequestTimeout
+
+
+class DataKennelAsyncMonitorClientTests(TestCase):
+    """Tests of Data Kennel's AsyncMonitorClient"""
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.transport = AsyncMonitorClient(self.client, workers=2)
+
+    def test_requests_return_responses(self):
+        """Requests return the responses of the wrapped client, in order"""
+        self.client.get.side_effect = lambda monitor_id: {'id': monitor_id}
+
+        requests = [self.transport.get(monitor_id) for monitor_id in range(10)]
+
+        self.assertEqual(self.transport.gather(requests, timeout=5),
+                         [{'id': monitor_id} for monitor_id in range(10)])
+
+    def test_concurrency_is_bounded(self):
+        """No more than the given number of requests are sent at once"""
+        lock = threading.Lock()
+        release = threading.Event()
+        in_flight = [0]
+        most_in_flight = [0]
+
+        def delete(_):
+            """Blocks until released, counting the requests in flight"""
+            with lock:
+                in_flight[0] += 1
+                most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+            release.wait(5)
+            with lock:
+                in_flight[0] -= 1
+
+        self.client.delete.side_effect = delete
+        requests = [self.transport.delete(monitor_id) for monitor_id in range(6)]
+        release.set()
+
+        self.transport.gather(requests, timeout=5)
+        self.assertEqual(most_in_flight[0], 2)
+
+    def test_exceptions_are_raised(self):
+        """Exceptions of the wrapped client are raised when waiting on the request"""
+        self.client.create.side_effect = ValueError('mock error')
+
+        request = self.transport.create(name='mock')
+
+        self.assertRaises(ValueError, request.result, 5)
+
+    def test_exceptions_keep_tracebacks(self):
+        """Exceptions are raised with the traceback of the wrapped client's call"""
+        def fail_to_create(**_monitor):
+            """Fails like a monitor client would"""
+            raise ValueError('mock error')
+        self.client.create.side_effect = fail_to_create
+
+        request = self.transport.create(name='mock')
+
+        try:
+            request.result(5)
+        except ValueError:
+            functions = [frame[2] for frame in traceback.extract_tb(sys.exc_info()[2])]
+        self.assertIn('fail_to_create', functions)
+
+    def test_timeout(self):
+        """Waiting on a request longer than its timeout raises RequestTimeout"""
+        release = threading.Event()
+        self.client.get_all.side_effect = lambda **params: release.wait(5)
+        transport = AsyncMonitorClient(self.client, timeout=0.01)
+
+        request = transport.get_all(monitor_tags=['team:a'])
+
+        self.assertRaises(RequestTimeout, request.result)
+        release.set()
+        self.assertTrue(request.result(5))
+
+    def test_cancel(self):
+        """Requests cancelled before they are sent are never sent"""
+        release = threading.Event()
+        self.client.update.side_effect = lambda **monitor: release.wait(5)
+        transport = AsyncMonitorClient(self.client, workers=1)
+        callback = MagicMock()
+
+        transport.update(id=1)
+        request = transport.update(id=2)
+        request.add_done_callback(callback)
+
+        self.assertTrue(request.cancel())
+        release.set()
+
+        self.assertRaises(RequestCancelled, request.result, 5)
+        callback.assert_called_once_with(request)
+        self.assertTrue(request.done())
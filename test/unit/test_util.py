@@ -3,12 +3,27 @@ Tests of data_kennel.util
 """
 from unittest import TestCase
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from mock import patch
+
 from data_kennel.util import (
     convert_dict_to_tags,
     convert_tags_to_dict,
-    is_truthy
+    is_truthy,
+    print_rows,
+    run_concurrently,
+    run_in_processes
 )
 
+ROWS = [
+    {'Name': 'foo', 'State': 'OK', 'Tags': 'a:b, c:d'},
+    {'Name': 'bar', 'State': None, 'Tags': 'a:b'}
+]
+
 
 class DataKennelUtilTests(TestCase):
     """Tests of Data Kennel's Utils"""
@@ -46,3 +61,63 @@ class DataKennelUtilTests(TestCase):
     def test_is_truthy_none(self):
         """Verify that None is false"""
         self.assertFalse(is_truthy(None))
+
+    def _print_rows(self, rows, headers, **kwargs):
+        """Prints rows, returning what was written to stdout and stderr"""
+        with patch('sys.stdout', new_callable=StringIO) as stdout:
+            with patch('sys.stderr', new_callable=StringIO) as stderr:
+                print_rows(rows, headers, **kwargs)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_print_rows_jsonl(self):
+        """Rows are printed as one JSON object per line, with only the requested headers"""
+        stdout, _ = self._print_rows(iter(ROWS), ['Name', 'State'], output_format='jsonl')
+
+        self.assertEqual(stdout, '{"Name": "foo", "State": "OK"}\n{"Name": "bar", "State": null}\n')
+
+    def test_print_rows_csv(self):
+        """Rows are printed as CSV with a header line"""
+        stdout, _ = self._print_rows(iter(ROWS), ['Name', 'Tags'], output_format='csv')
+
+        self.assertEqual(stdout, 'Name,Tags\nfoo,"a:b, c:d"\nbar,a:b\n')
+
+    def test_print_rows_tsv(self):
+        """Rows are printed as TSV with a header line"""
+        stdout, _ = self._print_rows(iter(ROWS), ['Name', 'Tags'], output_format='tsv')
+
+        self.assertEqual(stdout, 'Name\tTags\nfoo\ta:b, c:d\nbar\ta:b\n')
+
+    def test_print_rows_table(self):
+        """Tables are sized to their contents, with headers on stderr"""
+        stdout, stderr = self._print_rows(iter(ROWS), ['Name', 'State'])
+
+        self.assertEqual(stderr, 'Name \tState \t\n')
+        self.assertEqual(stdout, 'foo  \tOK    \t\nbar  \t-     \t\n')
+
+    def test_print_rows_fixed_width_table(self):
+        """Fixed width tables truncate long values, except in the last column"""
+        rows = [{'Name': 'a long monitor name', 'Tags': 'a very long list of tags'}]
+        stdout, stderr = self._print_rows(rows, ['Name', 'Tags'], fixed_width=True, widths={'Name': 10})
+
+        self.assertEqual(stderr, 'Name       \tTags\n')
+        self.assertEqual(stdout, 'a long ... \ta very long list of tags\n')
+
+    def test_print_rows_unknown_format(self):
+        """Unknown output formats are rejected"""
+        self.assertRaises(ValueError, print_rows, ROWS, ['Name'], output_format='xml')
+
+    def test_run_concurrently_keeps_order(self):
+        """Running concurrently returns results in the order of the items"""
+        self.assertEqual(run_concurrently(lambda item: item * 2, range(20), workers=4), list(range(0, 40, 2)))
+
+    def test_run_concurrently_empty(self):
+        """Running concurrently on nothing returns nothing"""
+        self.assertEqual(run_concurrently(lambda item: item, []), [])
+
+    def test_run_in_processes_keeps_order(self):
+        """Running in processes returns results in the order of the items"""
+        self.assertEqual(run_in_processes(abs, range(-50, 0), processes=3, chunk_size=7), range(50, 0, -1))
+
+    def test_run_in_processes_inline(self):
+        """A single chunk of items is processed without starting processes"""
+        self.assertEqual(run_in_processes(lambda item: -item, range(5), processes=4), range(0, -5, -1))
@@ -0,0 +1,204 @@
+"""
+Tests of data_kennel.validator
+"""
+import copy
+import random
+
+from unittest import TestCase
+
+from schema import SchemaError
+
+from data_kennel.config import get_config_schema
+from data_kennel.validator import validate_config, ConfigValidationError
+
+VALID_CONFIG = {
+    'data_kennel': {
+        'team': 'mock_team',
+        'org': 'mock_org',
+        'share_sub_monitors': 'yes'
+    },
+    'monitors': [
+        {
+            'name': 'mock_monitor for ${foo}',
+            'query': 'mock_query_${foo} > ${critical}',
+            'type': 'metric alert',
+            'message': 'mock_message',
+            'notify': ['example@example.com'],
+            'tags': {'foo': '${foo}', 'number': 5},
+            'with_variables': [{'foo': 'bar', 'critical': 1.5}, {'foo': 'foo', 'critical': 2}],
+            'options': {
+                'silenced': {'*': None, 'host:a': '12'},
+                'notify_no_data': 'true',
+                'new_host_delay': '300',
+                'no_data_timeframe': '${timeframe}',
+                'timeout_h': 1,
+                'require_full_window': False,
+                'renotify_interval': 10.0,
+                'escalation_message': 'still alerting',
+                'notify_audit': '${audit}',
+                'locked': 1,
+                'include_tags': 'no',
+                'thresholds': {'critical': '${critical}', 'warning': '1', 'ok': 0},
+                'evaluation_delay': 60,
+                'other_option': 42
+            }
+        },
+        {
+            'name': 'matrix monitor for ${hostclass} in ${environment}',
+            'query': 'mock_query_${hostclass}_${environment}',
+            'type': 'service check',
+            'message': 'mock_message',
+            'tags': {'hostclass': '${hostclass}'},
+            'variable_matrix': {
+                'axes': {'hostclass': ['a', 'b'], 'environment': ['qa', 1]},
+                'exclude': [{'hostclass': 'b', 'environment': 1}]
+            }
+        },
+        {
+            'name': 'file monitor for ${host}',
+            'query': 'mock_query_${host}',
+            'type': 'event alert',
+            'message': 'mock_message',
+            'with_variables_file': 'hosts.csv'
+        },
+        {
+            'name': 'minimal monitor',
+            'query': 'mock_query',
+            'type': 'query alert',
+            'message': 'mock_message',
+            'options': {}
+        }
+    ],
+    'downtimes': [
+        {
+            'name': 'maintenance',
+            'scope': ['environment:production', 'hostclass:db'],
+            'monitor_tags': {'service': 'db', 'number': 5},
+            'start': '2017-06-01T22:00:00Z',
+            'end': 1496361600,
+            'message': 'Database maintenance',
+            'timezone': 'UTC',
+            'recurrence': {'type': 'weeks', 'period': '1', 'week_days': ['Thu'], 'until_date': 1500000000,
+                           'until_occurrences': 4}
+        },
+        {
+            'name': 'minimal downtime'
+        }
+    ]
+}
+
+# Values that every kind of field either accepts or rejects in some way
+MUTATIONS = [None, 1, 0, 2.5, True, 'text', '${var}', u'unicode', u'\xe9', [], ['text'], [1], {}, {'a': 1},
+             {1: 'a'}]
+
+
+def _paths(value, path=()):
+    """Every path to a value within a config"""
+    yield path
+    if isinstance(value, dict):
+        for key, child in value.items():
+            for child_path in _paths(child, path + (key,)):
+                yield child_path
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            for child_path in _paths(child, path + (index,)):
+                yield child_path
+
+
+def _set(config, path, value):
+    """Returns a copy of the config with the value at the path replaced"""
+    config = copy.deepcopy(config)
+    if not path:
+        return value
+    parent = config
+    for key in path[:-1]:
+        parent = parent[key]
+    parent[path[-1]] = value
+    return config
+
+
+class DataKennelValidatorTests(TestCase):
+    """Tests of Data Kennel's config validator"""
+
+    def _assert_equivalent(self, config):
+        """Asserts that the validator and the config schema agree on a config"""
+        try:
+            expected = get_config_schema().validate(copy.deepcopy(config))
+        except SchemaError:
+            self.assertRaises(ConfigValidationError, validate_config, copy.deepcopy(config))
+        else:
+            self.assertEqual(validate_config(copy.deepcopy(config)), expected)
+
+    def test_valid_config(self):
+        """Valid configs are coerced like the schema coerces them"""
+        validated = validate_config(copy.deepcopy(VALID_CONFIG))
+
+        self.assertEqual(validated, get_config_schema().validate(copy.deepcopy(VALID_CONFIG)))
+        self.assertIs(validated['data_kennel']['share_sub_monitors'], True)
+        self.assertEqual(validated['monitors'][0]['options']['silenced'], {'*': None, 'host:a': 12})
+        self.assertEqual(validated['monitors'][0]['options']['other_option'], '42')
+        self.assertEqual(validated['monitors'][0]['tags']['number'], '5')
+        self.assertEqual(validated['monitors'][1]['variable_matrix']['axes']['environment'], ['qa', '1'])
+        self.assertIsNone(validated['monitors'][3]['options']['silenced'])
+        self.assertEqual(validated['downtimes'][0]['start'], 1496354400)
+        self.assertEqual(validated['downtimes'][0]['recurrence']['period'], 1)
+
+    def test_mutations_are_equivalent(self):
+        """Replacing any value of a config is accepted or rejected like the schema does"""
+        for path in _paths(VALID_CONFIG):
+            for mutation in MUTATIONS:
+                self._assert_equivalent(_set(VALID_CONFIG, path, mutation))
+
+    def test_extra_and_missing_keys(self):
+        """Adding and removing keys is accepted or rejected like the schema does"""
+        for path in _paths(VALID_CONFIG):
+            parent_path, key = path[:-1], path[-1] if path else None
+            parent = reduce(lambda value, part: value[part], parent_path, VALID_CONFIG)
+            if isinstance(parent, dict):
+                removed = dict((other_key, value) for other_key, value in parent.items() if other_key != key)
+                self._assert_equivalent(_set(VALID_CONFIG, parent_path, removed))
+                self._assert_equivalent(_set(VALID_CONFIG, parent_path, dict(parent, extra_key='value')))
+
+    def test_single_variable_source_is_equivalent(self):
+        """Monitors using several sources of variables are rejected like the schema does"""
+        for key, value in (('with_variables', [{'hostclass': 'c'}]), ('with_variables_file', 'hosts.csv')):
+            config = copy.deepcopy(VALID_CONFIG)
+            config['monitors'][1][key] = value
+
+            self.assertRaises(SchemaError, get_config_schema().validate, copy.deepcopy(config))
+            self._assert_equivalent(config)
+
+    def test_random_configs_are_equivalent(self):
+        """Randomly mutated configs are accepted or rejected like the schema does"""
+        rng = random.Random(0)
+        paths = list(_paths(VALID_CONFIG))
+        for _ in range(300):
+            config = VALID_CONFIG
+            for path in rng.sample(paths, 3):
+                try:
+                    config = _set(config, path, rng.choice(MUTATIONS))
+                except (KeyError, IndexError, TypeError):
+                    # An earlier mutation replaced a parent of the path
+                    pass
+            self._assert_equivalent(config)
+
+    def test_collects_every_error(self):
+        """Every error of a config is reported at once"""
+        config = copy.deepcopy(VALID_CONFIG)
+        config['data_kennel']['team'] = 5
+        config['monitors'][0]['type'] = 'magic'
+        config['monitors'][0]['options']['timeout_h'] = 'soon'
+        del config['monitors'][3]['query']
+        config['monitors'][1]['with_variables'] = [{'hostclass': 'c'}]
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_config(config)
+
+        self.assertEqual(sorted(context.exception.messages), [
+            'data_kennel.team: 5 should be a string',
+            'monitors[0].options.timeout_h: \'soon\' should be an integer or a ${variable}',
+            'monitors[0].type: \'magic\' should be one of metric alert, service check, event alert, '
+            'query alert',
+            'monitors[1]: only one of with_variables, with_variables_file, variable_matrix can be used',
+            'monitors[3]: missing key \'query\''
+        ])
@@ -0,0 +1,296 @@
+"""
+Tests of data_kennel.watch
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import TestCase
+from mock import MagicMock, patch
+
+from data_kennel.config import load_config_file
+from data_kennel.watch import Watcher, PollingChangeDetector
+
+CONFIG_TEMPLATE = """
+data_kennel:
+    team: {team}
+    org: {org}
+monitors:
+{monitors}
+"""
+MONITOR_TEMPLATE = """
+  - name: "{name}"
+    type: "metric alert"
+    query: "{query}"
+    message: "mock_message"
+"""
+
+
+class FakeChangeDetector(object):
+    """Change detector returning a scripted sequence of changes"""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.timeouts = []
+        self.watched_files = set()
+
+    def poll(self, timeout=None):
+        """Returns the next scripted change"""
+        self.timeouts.append(timeout)
+        return self.changes.pop(0) if self.changes else set()
+
+    def watch_files(self, paths):
+        """Records the files to watch"""
+        self.watched_files = set(paths)
+
+
+class DataKennelPollingChangeDetectorTests(TestCase):
+    """Tests of Data Kennel's polling change detector"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write(self, name, content):
+        """Writes a file into the config directory"""
+        path = os.path.join(self.config_dir, name)
+        with open(path, 'w') as config_file:
+            config_file.write(content)
+        return path
+
+    def test_detects_changes(self):
+        """Added, modified and removed config files are detected"""
+        modified_path = self._write('modified.yml', 'a')
+        removed_path = self._write('removed.yml', 'a')
+        detector = PollingChangeDetector(self.config_dir, interval=0.01)
+
+        added_path = self._write('added.yml', 'a')
+        self._write('modified.yml', 'ab')
+        os.remove(removed_path)
+        self._write('ignored.txt', 'a')
+
+        self.assertEqual(detector.poll(0.1), set([added_path, modified_path, removed_path]))
+
+    def test_times_out_without_changes(self):
+        """Polling returns nothing once the timeout passes without changes"""
+        self._write('config.yml', 'a')
+        detector = PollingChangeDetector(self.config_dir, interval=0.01)
+
+        start = time.time()
+        self.assertEqual(detector.poll(0.05), set())
+        self.assertLess(time.time() - start, 1)
+
+
+@patch('datadog.initialize', MagicMock())
+@patch('datadog.api.Monitor')
+class DataKennelWatcherTests(TestCase):
+    """Tests of Data Kennel's Watcher"""
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.ids = itertools.count(1)
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def _write_config(self, name, team, monitors, org='default'):
+        """Writes a config file with monitors given as (name, query) pairs"""
+        path = os.path.join(self.config_dir, name)
+        with open(path, 'w') as config_file:
+            config_file.write(CONFIG_TEMPLATE.format(
+                team=team,
+                org=org,
+                monitors=''.join(MONITOR_TEMPLATE.format(name=name, query=query) for name, query in monitors)
+            ))
+        return path
+
+    def _create(self, **monitor):
+        """Stand-in for creating a monitor in Datadog"""
+        monitor['id'] = next(self.ids)
+        return monitor
+
+    def _watcher(self, monitor_api, dry_run=False, changes=None):
+        """Creates a Watcher of the config directory with a fake Datadog"""
+        monitor_api.get_all.return_value = []
+        monitor_api.create.side_effect = self._create
+        monitor_api.update.side_effect = lambda **monitor: monitor
+        return Watcher(self.config_dir, dry_run=dry_run, change_detector=FakeChangeDetector(changes or []))
+
+    def _org_client(self, *_credentials):
+        """Stand-in for the HttpMonitorClient of an org other than the default one"""
+        client = MagicMock()
+        client.get_all.return_value = []
+        client.create.side_effect = self._create
+        client.update.side_effect = lambda **monitor: monitor
+        return client
+
+    def test_sync_all_creates_monitors(self, monitor_api):
+        """The initial sync creates the monitors of every config file and remembers them"""
+        self._write_config('a.yml', 'team_a', [('a1', 'query_a1'), ('a2', 'query_a2')])
+        self._write_config('b.yml', 'team_b', [('b1', 'query_b1')])
+        watcher = self._watcher(monitor_api)
+
+        watcher.sync_all()
+
+        self.assertEqual(monitor_api.create.call_count, 3)
+        self.assertItemsEqual([monitor['name'] for monitor in watcher.inventory],
+                              ['[DK] team_a | a1', '[DK] team_a | a2', '[DK] team_b | b1'])
+
+    def test_sync_files_changed_only(self, monitor_api):
+        """Syncing a changed file reconciles only the monitors of that file"""
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1'), ('a2', 'query_a2')])
+        self._write_config('b.yml', 'team_a', [('b1', 'query_b1')])
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+        monitor_api.reset_mock()
+
+        self._write_config('a.yml', 'team_a', [('a1', 'query_a1_changed'), ('a3', 'query_a3')])
+        report = watcher.sync_files(set([path_a]))
+
+        summary = report.summary()
+        self.assertEqual(summary['updated'], ['[DK] team_a | a1'])
+        self.assertEqual(summary['created'], ['[DK] team_a | a3'])
+        self.assertEqual(summary['deleted'], ['[DK] team_a | a2'])
+        self.assertEqual(summary['unchanged'], [])
+        monitor_api.get_all.assert_not_called()
+        self.assertItemsEqual([monitor['name'] for monitor in watcher.inventory],
+                              ['[DK] team_a | a1', '[DK] team_a | a3', '[DK] team_a | b1'])
+
+    def test_files_are_parsed_once(self, monitor_api):
+        """Each config file is parsed once per sync, for both inspecting and syncing it"""
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        path_b = self._write_config('b.yml', 'team_b', [('b1', 'query_b1')])
+        watcher = self._watcher(monitor_api)
+
+        with patch('data_kennel.watch.load_config_file', wraps=load_config_file) as mock_load:
+            watcher.sync_all()
+            self.assertItemsEqual([call[0][0] for call in mock_load.call_args_list], [path_a, path_b])
+
+            mock_load.reset_mock()
+            self._write_config('a.yml', 'team_a', [('a1', 'query_a1_changed')])
+            watcher.sync_files(set([path_a]))
+            self.assertEqual([call[0][0] for call in mock_load.call_args_list], [path_a])
+
+    def test_sync_files_removed_file(self, monitor_api):
+        """Syncing a removed file deletes its monitors"""
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        self._write_config('b.yml', 'team_a', [('b1', 'query_b1')])
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+
+        os.remove(path_a)
+        report = watcher.sync_files(set([path_a]))
+
+        self.assertEqual(report.summary()['deleted'], ['[DK] team_a | a1'])
+        self.assertEqual([monitor['name'] for monitor in watcher.inventory], ['[DK] team_a | b1'])
+
+    def test_sync_files_invalid_file(self, monitor_api):
+        """An invalid config file is logged and retried on its next change"""
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+
+        with open(path_a, 'w') as config_file:
+            config_file.write('data_kennel: {}\n')
+
+        self.assertIsNone(watcher.sync_files(set([path_a])))
+        self.assertEqual(watcher.file_monitor_names[path_a], set(['[DK] team_a | a1']))
+
+    def test_sync_files_variables_file(self, monitor_api):
+        """A changed variables file syncs the config files reading it"""
+        variables_path = os.path.join(self.config_dir, 'hosts.csv')
+        with open(variables_path, 'w') as variables_file:
+            variables_file.write('host\nalpha\n')
+        path_a = self._write_config('a.yml', 'team_a', [('a1 on ${host}', 'query_${host}')])
+        with open(path_a, 'a') as config_file:
+            config_file.write('    with_variables_file: hosts.csv\n')
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+        self.assertEqual(watcher.change_detector.watched_files, set([variables_path]))
+
+        with open(variables_path, 'w') as variables_file:
+            variables_file.write('host\nbeta\n')
+        report = watcher.sync_files(set([variables_path]))
+
+        summary = report.summary()
+        self.assertEqual(summary['created'], ['[DK] team_a | a1 on beta'])
+        self.assertEqual(summary['deleted'], ['[DK] team_a | a1 on alpha'])
+
+    def test_sync_files_unchanged_file(self, monitor_api):
+        """Files whose content didn't change aren't synced again"""
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+        monitor_api.reset_mock()
+
+        report = watcher.sync_files(set([path_a]))
+
+        self.assertEqual(report.summary()['unchanged'], [])
+        monitor_api.get.assert_not_called()
+        monitor_api.update.assert_not_called()
+
+    def test_dry_run_keeps_inventory(self, monitor_api):
+        """Dry runs don't change the inventory"""
+        self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        watcher = self._watcher(monitor_api, dry_run=True)
+
+        watcher.sync_all()
+
+        monitor_api.create.assert_not_called()
+        self.assertEqual(watcher.inventory, [])
+
+    def test_wait_for_changes_debounces(self, monitor_api):
+        """A burst of changes is collected until the debounce period passes without changes"""
+        watcher = self._watcher(monitor_api, changes=[set(['a']), set(['b']), set(['a', 'c']), set()])
+
+        self.assertEqual(watcher.wait_for_changes(), set(['a', 'b', 'c']))
+        self.assertEqual(watcher.change_detector.timeouts, [None, 1.0, 1.0, 1.0])
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_orgs_are_synced_with_own_clients(self, client_class, monitor_api):
+        """Each org is synced with the client of that org, and changes only touch the org of their files"""
+        org_client = self._org_client()
+        client_class.return_value = org_client
+        self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        path_b = self._write_config('b.yml', 'team_b', [('b1', 'query_b1')], org='org-b')
+        watcher = self._watcher(monitor_api)
+
+        watcher.sync_all()
+
+        self.assertEqual(monitor_api.create.call_args[1]['name'], '[DK] team_a | a1')
+        self.assertEqual(org_client.create.call_args[1]['name'], '[DK] team_b | b1')
+        self.assertEqual(sorted(watcher.inventories), ['default', 'org-b'])
+        monitor_api.reset_mock()
+
+        self._write_config('b.yml', 'team_b', [('b1', 'query_b1_changed')], org='org-b')
+        report = watcher.sync_files(set([path_b]))
+
+        self.assertEqual(report.summary()['updated'], ['[DK] team_b | b1'])
+        self.assertEqual(org_client.update.call_count, 1)
+        self.assertEqual(monitor_api.mock_calls, [])
+        self.assertEqual([monitor['name'] for monitor in watcher.inventories['org-b']], ['[DK] team_b | b1'])
+
+    @patch.dict('os.environ', {'DATADOG_API_KEY_ORG_B': 'api_b', 'DATA_KENNEL_APP_KEY_ORG_B': 'app_b'})
+    @patch('data_kennel.monitor.HttpMonitorClient')
+    def test_team_moved_to_another_org(self, client_class, monitor_api):
+        """A team moving orgs has its monitors deleted from its old org and created in its new one"""
+        org_client = self._org_client()
+        client_class.return_value = org_client
+        path_a = self._write_config('a.yml', 'team_a', [('a1', 'query_a1')])
+        watcher = self._watcher(monitor_api)
+        watcher.sync_all()
+
+        self._write_config('a.yml', 'team_a', [('a1', 'query_a1')], org='org-b')
+        report = watcher.sync_files(set([path_a]))
+
+        self.assertEqual(report.summary()['deleted'], ['[DK] team_a | a1'])
+        self.assertEqual(report.summary()['created'], ['[DK] team_a | a1'])
+        self.assertEqual(monitor_api.delete.call_count, 1)
+        self.assertEqual(org_client.create.call_count, 1)
+        self.assertEqual(watcher.inventories['default'], [])
+        self.assertEqual([monitor['name'] for monitor in watcher.inventories['org-b']], ['[DK] team_a | a1'])